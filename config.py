@@ -1,4 +1,12 @@
 from dataclasses import dataclass
+from typing import ClassVar, Dict, Optional, Tuple
+
+@dataclass(frozen=True)
+class StageRoute:
+    model: str
+    max_tokens: int = 1000
+    stop_sequences: Tuple[str, ...] = ()
+    escalate_to: Optional[str] = None  # Larger model retried once when the output fails validation
 
 @dataclass
 class Config:
@@ -10,6 +18,61 @@ class Config:
     cache_enabled: bool = True
     cache_dir: str = ".cache"
     cache_ttl: int = 86400  # Cache TTL in seconds (24 hours)
+    templates_enabled: bool = True  # Use deterministic SQL templates before calling the LLM
+    template_min_score: int = 90  # Minimum entity match score for a template to apply
+    batch_generation: bool = True  # Generate SQL for all sub-queries in one LLM call
+    merge_sibling_queries: bool = True  # Run sub-queries differing in one filter value as one GROUP BY scan
+    speculative_candidates: int = 1  # Above 1, request this many SQL candidates concurrently, first valid wins
+    speculative_stagger: float = 1.0  # Seconds between starting candidates; unstarted ones are never sent once one is valid
+    max_sql_retries: int = 2  # Repair attempts for sub-queries whose SQL fails to execute
+    request_time_budget: float = 60.0  # Seconds after which failed sub-queries are no longer retried
+    few_shot_examples: int = 3  # Similar validated question/SQL pairs added to generation prompts, 0 disables
+    example_reuse: bool = True  # Reuse stored SQL for questions identical up to entity values and month
+    prune_schema: bool = True  # Only describe the columns relevant to a question in prompts
+    prompt_caching: bool = False  # Send static prompt prefixes as cached blocks; uses the full schema instead of pruning
+    telemetry_enabled: bool = True  # Append every LLM call to the JSONL trace below
+    telemetry_path: str = ".cache/llm_trace.jsonl"
+    http_max_connections: int = 20  # Connection pool of the shared Anthropic client
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 120.0  # Seconds an idle connection is kept open
+    http_timeout: float = 60.0
+    coalesce_llm_calls: bool = True  # Identical concurrent requests share one API call
+    latency_window: int = 200  # Recent latencies kept per stage for adaptive timeouts and hedging
+    latency_min_samples: int = 20  # Below this, use http_timeout and never hedge
+    timeout_percentile: float = 0.99
+    timeout_multiplier: float = 1.5  # Timeout is this multiple of the percentile latency, within bounds
+    min_llm_timeout: float = 5.0
+    hedging_enabled: bool = False  # Send a duplicate request when the first is slower than the hedge percentile
+    hedge_percentile: float = 0.9
+    hedge_budget: float = 0.05  # Hedged requests as a fraction of all requests
+    hedge_burst: int = 1  # Hedges allowed before the budget has accrued
+    chat_store: str = "sqlite"  # "sqlite" or "json" (one file per chat in saved_chats)
+    chat_db_path: str = "saved_chats/chats.db"
+    chat_page_size: int = 20  # Chats listed per sidebar page
+    chat_search_limit: int = 20  # Hits shown for a chat search
+    chat_background_writes: bool = True  # Persist chats from a background thread instead of the script run
+    chat_journal_compact_every: int = 20  # Journaled messages after which a JSON chat is rewritten as one snapshot
+    chat_inline_rows: int = 20  # Larger result sets are stored once by content hash instead of inside the chat
+    chat_results_compress: bool = True  # Gzip stored result sets
+    ui_table_preview_rows: int = 10  # Larger result tables render collapsed to this many rows until expanded
+    ui_pivot_max_values: int = 200  # Columns with more distinct values are not offered for pivot filters and grouping
+    query_workers: int = 2  # Background threads running queries for all sessions
+    job_poll_interval: float = 1.0  # Seconds between UI polls of a running query
+    job_retention: float = 3600.0  # Seconds a finished job stays available to poll
+    export_chunk_rows: int = 5000  # Rows serialized at a time for CSV/Parquet downloads
+    follow_up_rewrites: bool = True  # Answer follow-ups like "and for July?" by rewriting the previous turn's SQL
+    conversation_contexts: int = 256  # Conversations whose last turn is kept for follow-ups
+
+    # Model and limits per pipeline stage; only SQL generation and repair use the large model
+    stage_routes: ClassVar[Dict[str, StageRoute]] = {
+        "decomposition": StageRoute(haiku_model, max_tokens=500, escalate_to=sonnet_model),
+        "table_selection": StageRoute(haiku_model, max_tokens=50, stop_sequences=("\n",), escalate_to=sonnet_model),
+        "entity_extraction": StageRoute(haiku_model, max_tokens=200),
+        "generation": StageRoute(sonnet_model, max_tokens=1000),
+        "batch_generation": StageRoute(sonnet_model, max_tokens=3000),
+        "repair": StageRoute(sonnet_model, max_tokens=1000),
+        "analysis": StageRoute(haiku_model, max_tokens=1500, escalate_to=sonnet_model),
+    }
 
 class ConfigError(Exception):
     """Custom exception for configuration errors"""
@@ -1,5 +1,5 @@
 import sqlite3
-from typing import Dict
+from typing import Callable, Dict, List
 from config import Config
 from engine.orchestrator import QueryOrchestrator
 from langchain_anthropic import ChatAnthropic
@@ -9,7 +9,7 @@ class DatabaseAnalyst:
         self.config = config
         self.connection = self._create_connection()
         self.llm = ChatAnthropic(
-            model=config.model_name,
+            model=config.sonnet_model,
             anthropic_api_key=config.api_key,
             max_tokens=4096
         )
@@ -18,12 +18,17 @@ class DatabaseAnalyst:
     def _create_connection(self):
         """Create SQLite database connection"""
         try:
-            return sqlite3.connect(self.config.db_path)
+            # Queries run on background job threads, see ui.jobs
+            return sqlite3.connect(self.config.db_path, check_same_thread=False)
         except Exception as e:
             raise Exception(f"Failed to connect to database: {str(e)}")
 
-    def process_query(self, query: str) -> Dict:
-        """Process a natural language query"""
+    def process_query(self, query: str, progress: Callable[[str], None] = None,
+                      conversation_id: str = None, chat_history: List[Dict] = None) -> Dict:
+        """
+        Process a natural language query, reporting each workflow step to progress. Queries
+        with a conversation_id can follow up the previous answer of that chat.
+        """
         try:
             steps_output = []
             
@@ -36,7 +41,9 @@ class DatabaseAnalyst:
             })
             
             # Get orchestrator results
-            results = self.orchestrator.process_query(query)
+            results = self.orchestrator.process_query(
+                query, progress=progress, conversation_id=conversation_id, chat_history=chat_history
+            )
             
             # Merge steps
             if results.get("steps"):
@@ -1,6 +1,9 @@
+import re
+import json
 from typing import Dict, List
 from anthropic import Anthropic
 from config import Config
+from utils.llm import CachedPrompt, call_llm
 
 class SQLAnalyzer:
     def __init__(self, llm):
@@ -9,22 +12,14 @@ class SQLAnalyzer:
 
     def _call_llm(self, prompt: str) -> str:
         """Helper method to call Claude with consistent parameters"""
-        # Use the wrapped client's direct call method
-        if hasattr(self.llm, 'invoke'):
-            response = self.llm.invoke(prompt)
-            return response.content
-        elif hasattr(self.llm, 'messages'):
-            # Direct Anthropic client call with Haiku model
-            response = self.llm.messages.create(
-                model=Config.haiku_model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0,
-                max_tokens=1000
-            )
-            return response.content[0].text
-        else:
-            # Direct call to the wrapped function
-            return self.llm(prompt)
+        return call_llm(self.llm, prompt, stage="analysis", validate=self._is_valid_analysis)
+
+    def _is_valid_analysis(self, response_text: str) -> bool:
+        """The analysis must be a JSON object; anything else is escalated to the larger model"""
+        try:
+            return isinstance(json.loads(re.sub(r'```json\s*|\s*```', '', response_text.strip())), dict)
+        except json.JSONDecodeError:
+            return False
 
     def analyze_results(self, query_info: Dict, sub_query_results: List[Dict]) -> Dict:
         """Analyze SQL query results from multiple sub-queries and generate comprehensive insights"""
@@ -32,30 +27,31 @@ class SQLAnalyzer:
             # Format results for prompt
             formatted_results = self._format_sub_queries_for_prompt(sub_query_results)
             
-            # Create prompt for analysis
-            prompt = f"""
-            Analyze the following SQL query results and provide insights.
-            
-            Original Query: {query_info['original_query']}
-            
-            Results:
-            {formatted_results}
+            # Create prompt for analysis: fixed instructions first, the query and results last
+            prefix = """
+            Analyze the SQL query results below and provide insights.
             
             Provide a detailed analysis in the following format:
-            {{
+            {
                 "summary": "<A clear summary of the query results>",
                 "insights": ["<Key insight 1>", "<Key insight 2>", "<Key insight 3>"],
                 "trends": ["<Observed trend 1>", "<Observed trend 2>"],
                 "implications": ["<Business implication 1>", "<Business implication 2>"],
                 "relationships": ["<Data relationship 1>", "<Data relationship 2>"]
-            }}
+            }
             
             Ensure the response is in valid JSON format with the exact keys shown above.
             Each field except 'summary' should be an array of strings.
             """
+            suffix = f"""
+            Original Query: {query_info['original_query']}
+            
+            Results:
+            {formatted_results}
+            """
             
             # Get analysis from LLM
-            response_text = self._call_llm(prompt)
+            response_text = self._call_llm(CachedPrompt(prefix, suffix))
 
             # Clean and parse the response
             import json
@@ -111,7 +107,7 @@ class SQLAnalyzer:
         for idx, result in enumerate(formatted_results, 1):
             output.append(f"""
 Sub-query {idx}:
-Question: {result['sub_query']}
+Question: {result.get('sub_query') or result.get('query')}
 SQL Query: {result['sql_query']}
 Results:
 {result['results']}
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
+from config import Config
+from utils.intent import resolve_periods, detect_aggregation, detect_direction, detect_limit, detect_function
+
+class SQLCache:
+    """
+    Cache of validated SQL keyed by the canonical intent of a sub-query: table, matched
+    column/value pairs, resolved periods and aggregation type. Differently worded questions
+    with the same intent share an entry. Entries remember the metadata fingerprint of their
+    table and are dropped once the metadata changes or the TTL expires.
+    """
+
+    def __init__(self, cache_dir: str = Config.cache_dir, ttl: int = Config.cache_ttl):
+        self.ttl = ttl
+        self.file_path = os.path.join(cache_dir, "sql_cache.json")
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = self._load()
+
+    def _load(self) -> Dict:
+        """Load cached entries from disk"""
+        if not os.path.exists(self.file_path):
+            return {}
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading SQL cache: {e}")
+            return {}
+
+    def _save(self):
+        """Write entries atomically so a crash never leaves a truncated cache"""
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.file_path)
+
+    @staticmethod
+    def signature(query_info: Dict) -> str:
+        """Build the canonical intent signature for a sub-query"""
+        sub_query = query_info.get('sub_query', '')
+        entities = sorted({
+            (entity['column'], entity['matched_value'])
+            for entity in query_info.get('extracted_entities', [])
+        })
+        canonical = {
+            "table": query_info['table'],
+            "entities": [list(pair) for pair in entities],
+            "periods": sorted(query_info.get('periods') or resolve_periods(sub_query)),
+            "aggregation": query_info.get('aggregation') or detect_aggregation(sub_query),
+            # "highest" vs "lowest" vs "top 3", and "total" vs "average", need different SQL
+            "direction": detect_direction(sub_query),
+            "limit": detect_limit(sub_query),
+            "function": detect_function(sub_query),
+        }
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def metadata_fingerprint(table_info) -> str:
+        """Hash the parts of a table definition that influence generated SQL"""
+        columns = {
+            name: [col.description, col.role, list(col.distinct_values)]
+            for name, col in table_info.columns.items()
+        }
+        payload = json.dumps({"description": table_info.description, "columns": columns}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, query_info: Dict, table_info) -> Optional[str]:
+        """Return cached SQL for this intent, or None on a miss"""
+        key = self.signature(query_info)
+        with self._lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+
+            expired = time.time() - entry['created_at'] > self.ttl
+            if expired or entry['metadata'] != self.metadata_fingerprint(table_info):
+                del self.entries[key]
+                self._save()
+                return None
+            return entry['sql_query']
+
+    def put(self, query_info: Dict, table_info, sql_query: str):
+        """Store SQL that has been validated against the database"""
+        with self._lock:
+            self.entries[self.signature(query_info)] = {
+                "sql_query": sql_query,
+                "table": query_info['table'],
+                "metadata": self.metadata_fingerprint(table_info),
+                "created_at": time.time(),
+            }
+            self._save()
+
+    def invalidate(self, table: str = None):
+        """Drop all entries, or only those for one table"""
+        with self._lock:
+            if table is None:
+                self.entries = {}
+            else:
+                self.entries = {k: v for k, v in self.entries.items() if v['table'] != table}
+            self._save()
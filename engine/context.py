@@ -0,0 +1,292 @@
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from fuzzywuzzy import fuzz
+
+from config import Config
+from engine.metadata import FinancialTableMetadata
+from utils.intent import resolve_periods, mask_periods, move_month
+
+# Openers that mark a question as continuing the previous one: "and for July?", "what about Q3?"
+FOLLOW_UP_CUE = r'^(?:and|what about|how about|same for|same but|do the same|now|then|also|ok(?:ay)?|instead)\b'
+
+# "break that down by department", "split it by property", "grouped by month"
+BREAKDOWN_PATTERN = (
+    r'\b(?:break|broken|split|group(?:ed)?)\s+(?:(?:that|it|this|them|those|these|the results?)\s+)?'
+    r'(?:down\s+)?by\s+(?:each\s+|the\s+)?(?P<dimension>[\w\s&-]+)$'
+)
+# "by property", "and per month"
+SHORT_BREAKDOWN_PATTERN = r'^(?:and\s+|now\s+|then\s+)?(?:by|per)\s+(?:each\s+|the\s+)?(?P<dimension>[\w\s&-]+)$'
+
+# Words left over in "and what about July instead?" once the period is masked
+FILLER_WORDS = {
+    'and', 'what', 'about', 'how', 'same', 'but', 'do', 'now', 'then', 'also', 'ok', 'okay', 'instead',
+    'for', 'in', 'of', 'at', 'the', 'during', 'please', 'show', 'me', 'it', 'that', 'this', 'one', '<period>'
+}
+
+@dataclass
+class TurnContext:
+    """What a finished turn resolved, kept so the next question can build on it"""
+    query: str
+    sub_queries: List[Dict]  # query, table, entities, periods, aggregation, sql_query and result rows
+
+class ConversationStore:
+    """
+    The last successful turn of each conversation, keyed by chat id. Only the most recently
+    used conversations are kept; the result rows are the same lists the turn returned, so
+    holding them costs no copies.
+    """
+
+    def __init__(self, max_conversations: int = Config.conversation_contexts):
+        self.max_conversations = max_conversations
+        self._turns: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str) -> Optional[TurnContext]:
+        with self._lock:
+            turn = self._turns.get(conversation_id)
+            if turn is not None:
+                self._turns.move_to_end(conversation_id)
+            return turn
+
+    def put(self, conversation_id: str, turn: TurnContext):
+        with self._lock:
+            self._turns[conversation_id] = turn
+            self._turns.move_to_end(conversation_id)
+            while len(self._turns) > self.max_conversations:
+                self._turns.popitem(last=False)
+
+    def remember(self, conversation_id: str, query: str, query_results: List[Dict]):
+        """Keep a turn whose sub-queries all executed; a partly failed turn is no base to build on"""
+        if not query_results or any(result.get("error") or not result.get("sql_query") for result in query_results):
+            return
+        self.put(conversation_id, TurnContext(query=query, sub_queries=[
+            {
+                "query": result["query"],
+                "table": result["table"],
+                "entities": result.get("entities") or [],
+                "periods": result.get("periods") or [],
+                "aggregation": result.get("aggregation"),
+                "sql_query": result["sql_query"],
+                "results": result.get("results") or [],
+            }
+            for result in query_results
+        ]))
+
+    def restore(self, conversation_id: str, chat_history: List[Dict]) -> Optional[TurnContext]:
+        """
+        Rebuild the context of a reopened chat from its last answer, given the saved messages
+        (see ui.messages for the record format)
+        """
+        for position in range(len(chat_history) - 1, -1, -1):
+            message = chat_history[position]
+            if message.get("role") != "assistant":
+                continue
+            sub_queries = message.get("sub_queries") or []
+            if not sub_queries or not all(sq.get("execution_results", {}).get("success") for sq in sub_queries):
+                return None
+            if len({sq["sql_query"] for sq in sub_queries}) != len(sub_queries):
+                # Siblings answered by one merged scan record that scan, not SQL of their own
+                return None
+            question = next((m["content"] for m in reversed(chat_history[:position])
+                             if m.get("role") == "user" and isinstance(m.get("content"), str)), "")
+            turn = TurnContext(query=question, sub_queries=[
+                {
+                    "query": sq["sub_query"],
+                    "table": sq["table"],
+                    "entities": sq.get("entities") or [],
+                    "periods": resolve_periods(sq["sub_query"]),
+                    "aggregation": None,
+                    "sql_query": sq["sql_query"],
+                    "results": sq["execution_results"].get("data") or [],
+                }
+                for sq in sub_queries
+            ])
+            self.put(conversation_id, turn)
+            return turn
+        return None
+
+    def forget(self, conversation_id: str):
+        with self._lock:
+            self._turns.pop(conversation_id, None)
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def _parse_select(sql_query: str) -> Optional[exp.Select]:
+    """Parse a single plain SELECT, or None for anything else"""
+    try:
+        tree = sqlglot.parse_one(sql_query, read="sqlite")
+    except SqlglotError:
+        return None
+    return tree if isinstance(tree, exp.Select) else None
+
+def add_grouping(sql_query: str, column: str) -> Optional[str]:
+    """
+    Break an aggregate query down by one more column: the column is selected first and added
+    to the GROUP BY. Returns None for statements where that would change their meaning, such as
+    ranked (LIMIT) queries, joins, CTEs, subqueries or row listings without an aggregate.
+    """
+    tree = _parse_select(sql_query)
+    if tree is None or tree.args.get("with") or tree.args.get("joins") or tree.args.get("limit"):
+        return None
+    source = tree.find(exp.From)
+    if source is None or not isinstance(source.this, exp.Table) or tree.find(exp.Subquery) is not None:
+        return None
+    if tree.find(exp.AggFunc) is None:
+        return None
+    group = tree.args.get("group")
+    if group and any(isinstance(node, exp.Column) and node.name == column for node in group.expressions):
+        return None
+
+    tree.set("expressions", [exp.column(column)] + tree.expressions)
+    tree = tree.group_by(column)
+    if not tree.args.get("order"):
+        tree = tree.order_by(column)
+    return tree.sql(dialect="sqlite", pretty=True)
+
+def move_periods(sql_query: str, old_periods: List[str], new_periods: List[str], time_column: str) -> Optional[str]:
+    """
+    Point a query at other months: a single month moves with its day literals, otherwise the one
+    equality or IN filter on the time column is replaced. None when neither applies.
+    """
+    if len(old_periods) == 1 and len(new_periods) == 1:
+        moved = move_month(sql_query, old_periods[0], new_periods[0])
+        if moved:
+            return moved
+
+    tree = _parse_select(sql_query)
+    if tree is None:
+        return None
+    filters = [node for node in tree.find_all(exp.EQ, exp.In) if _is_period_filter(node, time_column)]
+    if len(filters) != 1:
+        return None
+
+    column = filters[0].this.copy()
+    literals = [exp.Literal.string(period) for period in new_periods]
+    if len(literals) == 1:
+        filters[0].replace(exp.EQ(this=column, expression=literals[0]))
+    else:
+        filters[0].replace(exp.In(this=column, expressions=literals))
+    return tree.sql(dialect="sqlite", pretty=True)
+
+def _is_period_filter(node, time_column: str) -> bool:
+    """Month = '...' or Month IN ('...', ...)"""
+    if not isinstance(node.this, exp.Column) or node.this.name != time_column:
+        return False
+    values = [node.expression] if isinstance(node, exp.EQ) else node.expressions
+    return bool(values) and all(isinstance(value, exp.Literal) and value.is_string for value in values)
+
+class FollowUpRewriter:
+    """
+    Answers follow-up questions by editing the SQL of the previous turn instead of running
+    decomposition, entity extraction and generation again. Handles a different period
+    ("and for July?"), a different entity value of a column the previous turn filtered on
+    ("what about AC Wailea?") and a breakdown by another column ("break that down by
+    department"). Anything else returns None and goes through the full pipeline.
+    """
+
+    def __init__(self, metadata: FinancialTableMetadata = None, min_score: int = Config.template_min_score):
+        self.metadata = metadata or FinancialTableMetadata()
+        self.min_score = min_score
+
+    def rewrite(self, query: str, turn: TurnContext) -> Optional[List[Dict]]:
+        """Decomposition details with the rewritten SQL for each previous sub-query, or None"""
+        text = query.lower().strip().rstrip('?.! ')
+        match = re.search(BREAKDOWN_PATTERN, text) or re.search(SHORT_BREAKDOWN_PATTERN, text)
+        if match is None and not re.match(FOLLOW_UP_CUE, text):
+            return None
+
+        details = []
+        for idx, previous in enumerate(turn.sub_queries, 1):
+            table_info = self.metadata.get_table_info(previous["table"])
+            if table_info is None:
+                return None
+            if match is not None:
+                column = table_info.column_for(match.group("dimension").strip())
+                rewritten = (add_grouping(previous["sql_query"], column), previous["entities"],
+                             previous["periods"]) if column else None
+            else:
+                rewritten = self._refilter(text, previous, table_info, allow_entity=len(turn.sub_queries) == 1)
+            if rewritten is None or rewritten[0] is None:
+                return None
+
+            sql_query, entities, periods = rewritten
+            details.append({
+                "sub_query_number": idx,
+                "query": f"{previous['query']} ({query.strip()})",
+                "table": previous["table"],
+                "entities": entities,
+                "periods": periods,
+                "aggregation": previous.get("aggregation"),
+                "table_info": table_info,
+                "type": "follow-up",
+                "explanation": f"Follow-up answered by rewriting the previous SQL of sub-query {idx}",
+                "sql_query": sql_query,
+                "sql_source": "follow_up",
+                "previous_sql": previous["sql_query"],
+            })
+        return details
+
+    def _refilter(self, text: str, previous: Dict, table_info,
+                  allow_entity: bool) -> Optional[Tuple[str, List[Dict], List[str]]]:
+        """Swap the period and/or one entity value of the previous SQL for those the follow-up names"""
+        years = [int(period[:4]) for period in previous["periods"]]
+        default_year = max(years) if years else None
+        periods = resolve_periods(text, default_year)
+        words = [word for word in re.findall(r"<period>|[\w&'/.-]+", mask_periods(text, default_year))
+                 if word not in FILLER_WORDS]
+        if not periods and not words:
+            return None
+
+        sql_query, entities = previous["sql_query"], previous["entities"]
+        if words:
+            if not allow_entity:
+                return None
+            swapped = self._swap_entity(" ".join(words), sql_query, entities, table_info)
+            if swapped is None:
+                return None
+            sql_query, entities = swapped
+
+        if periods and periods != previous["periods"]:
+            time_columns = table_info.columns_with_role("time")
+            if not previous["periods"] or not time_columns:
+                return None
+            sql_query = move_periods(sql_query, previous["periods"], periods, time_columns[0])
+        return sql_query, entities, periods or previous["periods"]
+
+    def _swap_entity(self, phrase: str, sql_query: str, entities: List[Dict],
+                     table_info) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        Replace the value of an entity column the previous turn filtered on with the value the
+        phrase names. The phrase must be (part of) one value, so a question that merely starts
+        with "and" is not mistaken for a follow-up.
+        """
+        best = None
+        for entity in entities:
+            column_info = table_info.columns.get(entity["column"])
+            if column_info is None or column_info.role != "entity":
+                continue
+            for value in column_info.distinct_values:
+                covered = set(phrase.split()) <= set(value.lower().split())
+                score = fuzz.token_sort_ratio(phrase, value.lower())
+                if (covered or score >= self.min_score) and (best is None or (covered, score) > best[0]):
+                    best = ((covered, score), entity, value)
+        if best is None:
+            return None
+
+        (_, score), entity, value = best
+        old_literal = _quote(entity["matched_value"])
+        if old_literal not in sql_query:
+            return None
+        sql_query = sql_query.replace(old_literal, _quote(value))
+        entities = [
+            {**item, "search_term": phrase, "matched_value": value, "score": score} if item is entity else item
+            for item in entities
+        ]
+        return sql_query, entities
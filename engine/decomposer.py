@@ -4,28 +4,25 @@ from config import Config
 from engine.metadata import FinancialTableMetadata
 from fuzzywuzzy import fuzz
 from utils.search import search_financial_terms_without_threshold
+from utils.intent import resolve_periods, detect_aggregation
+from utils.llm import CachedPrompt, call_llm, get_client
 
 class QueryDecomposer:
     def __init__(self, llm: Anthropic):
-        self.llm = Anthropic(api_key=llm.api_key)  # Create new instance for Haiku
+        self.llm = get_client(llm.api_key)  # Shared client; the stage routes pick Haiku
         self.matcher = None
         self.financial_terms = {}
         self.metadata = FinancialTableMetadata()
 
-    def _call_llm(self, prompt: str) -> str:
+    def _call_llm(self, prompt: str, stage: str = "decomposition", validate=None) -> str:
         """Helper method to call Claude Haiku with consistent parameters"""
-        response = self.llm.messages.create(
-            model=Config.sonnet_model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-            max_tokens=1000
-        )
-        return response.content[0].text
+        return call_llm(self.llm, prompt, stage=stage, validate=validate)
 
     def _decompose_complex_query(self, query: str, chat_history: List[Dict] = None) -> List[str]:
         """Break down complex queries into simpler sub-queries"""
-        prompt = f"""Break down this query ONLY if it compares multiple entities or asks for multiple pieces of information.
+        prefix = """Break down this query ONLY if it compares multiple entities or asks for multiple pieces of information.
         If the query is about a single entity or metric, return it unchanged.
+        Return the sub-queries as a simple list, one per line. For single queries, return just the original query.
         
         Examples:
         1. Input: "What is the Room Revenue for AC Wailea for Dec 2024?"
@@ -37,12 +34,11 @@ class QueryDecomposer:
                "What is the Room Revenue for Residence Inn Tampa for Dec 2024?"
            ]
         
-        Current Query: {query}
-        
-        Return the sub-queries as a simple list, one per line. For single queries, return just the original query."""
+        """
+        suffix = f"Current Query: {query}"
 
         try:
-            response = self._call_llm(prompt)
+            response = self._call_llm(CachedPrompt(prefix, suffix), validate=lambda text: bool(text.strip()))
             # Clean up the response and split into lines
             sub_queries = [q.strip() for q in response.split('\n') if q.strip() and not q.startswith('[') and not q.startswith(']')]
             return sub_queries if sub_queries else [query]
@@ -54,24 +50,29 @@ class QueryDecomposer:
         """Select the most relevant table based on query content using LLM"""
         tables_info = []
         for table_name, table_def in self.metadata.tables.items():
+            if Config.prune_schema:
+                # Names are enough to pick a table; the descriptions only matter for writing SQL
+                columns = ', '.join(table_def.columns)
+            else:
+                columns = ', '.join(f'{col} ({info.description})' for col, info in table_def.columns.items())
             table_info = (
                 f"Table: {table_name}\n"
                 f"Description: {table_def.description}\n"
                 f"Common Queries: {', '.join(table_def.common_queries)}\n"
-                f"Columns: {', '.join(f'{col} ({info.description})' for col, info in table_def.columns.items())}\n"
+                f"Columns: {columns}\n"
             )
             tables_info.append(table_info)
 
-        prompt = (
+        prefix = (
             f"Given the following query and available tables, select the most appropriate table name.\n"
             f"Only return the table name, nothing else.\n\n"
-            f"Query: {query}\n\n"
             f"Available Tables:\n{''.join(tables_info)}\n\n"
-            "Table name:"
         )
+        suffix = f"Query: {query}\n\nTable name:"
 
         try:
-            response = self._call_llm(prompt)
+            response = self._call_llm(CachedPrompt(prefix, suffix), stage="table_selection",
+                                      validate=lambda text: text.strip() in self.metadata.tables)
             selected_table = response.strip()
             if selected_table in self.metadata.tables:
                 return selected_table
@@ -90,7 +91,9 @@ class QueryDecomposer:
     def _extract_entities(self, query: str, table_info) -> List[Dict]:
         """Extract entities using LLM-based entity extraction and fuzzy matching"""
         # Use the new search function that uses LLM for entity extraction
-        matches = search_financial_terms_without_threshold(query, table_info, self._call_llm)
+        matches = search_financial_terms_without_threshold(
+            query, table_info, lambda prompt: self._call_llm(prompt, stage="entity_extraction")
+        )
         
         return [
             {
@@ -118,6 +121,8 @@ class QueryDecomposer:
                     "sub_query": sub_query,
                     "table": table_name,
                     "extracted_entities": extracted_entities,
+                    "periods": resolve_periods(sub_query),
+                    "aggregation": detect_aggregation(sub_query),
                     "explanation": f"Query processed using {table_name} table",
                 })
             return results
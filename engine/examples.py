@@ -0,0 +1,259 @@
+import os
+import re
+import ast
+import json
+import math
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from config import Config
+from utils.intent import resolve_periods, mask_periods, move_month
+from ui.messages import ResultStore
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+@dataclass
+class SQLExample:
+    question: str
+    sql_query: str
+    table: str
+    entities: List[Dict] = field(default_factory=list)
+    periods: List[str] = field(default_factory=list)
+    pattern: str = ""  # Question with entity values and periods replaced by placeholders
+
+def has_values(rows: List) -> bool:
+    """Whether a result set holds at least one non-NULL value; [{'revenue': None}] validates nothing"""
+    return any(value is not None for row in rows for value in (row.values() if isinstance(row, dict) else [row]))
+
+def question_pattern(question: str, entities: List[Dict]) -> str:
+    """Replace matched entity terms with <column> placeholders and periods with <period>"""
+    text = question
+    for entity in sorted(entities, key=lambda e: -len(e.get('search_term', ''))):
+        term = entity.get('search_term', '')
+        if term:
+            text = re.sub(re.escape(term), f" <{entity['column']}> ", text, flags=re.IGNORECASE)
+    text = mask_periods(text)
+    return " ".join(re.findall(r'<[^>]+>|\w+', text))
+
+def _tokens(pattern: str) -> List[str]:
+    """Word tokens plus character trigrams, so inflections like 'expense'/'expenses' still overlap"""
+    tokens = []
+    for word in re.findall(r'<[^>]+>|\w+', pattern):
+        tokens.append(word)
+        if not word.startswith('<'):
+            padded = f" {word} "
+            tokens.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return tokens
+
+class ExampleStore:
+    """
+    Validated question -> SQL pairs harvested from saved chats and successful executions,
+    indexed with BM25 over words and character trigrams of the question pattern. The closest
+    examples are added to generation prompts as few-shot examples, and a question with
+    exactly the same pattern reuses the stored SQL with its entity values and month swapped.
+    """
+
+    def __init__(self, chats_dir: str = "saved_chats", cache_dir: str = Config.cache_dir):
+        self.file_path = os.path.join(cache_dir, "examples.jsonl")
+        self.examples: List[SQLExample] = []
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._index = None
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_chats(chats_dir)
+        self._load_harvested()
+
+    def _load_chats(self, chats_dir: str):
+        """Harvest sub-queries whose SQL executed successfully from saved chats"""
+        if not os.path.isdir(chats_dir):
+            return
+        results = None
+        for filename in sorted(os.listdir(chats_dir)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(chats_dir, filename), 'r', encoding='utf-8') as f:
+                    chat = json.load(f)
+            except Exception as e:
+                print(f"Error loading chat {filename}: {e}")
+                continue
+            for message in chat.get('messages', []):
+                if message.get('role') != 'assistant':
+                    continue
+                if 'schema' in message:
+                    # Typed message record, see ui.messages; larger result sets live in its ResultStore
+                    sub_queries = []
+                    for sub_query in message.get('sub_queries', []):
+                        if not sub_query.get('success') or not sub_query.get('row_count'):
+                            continue
+                        if not all(sub_query.get(key) for key in ('sub_query', 'sql_query', 'table')):
+                            continue
+                        rows = sub_query.get('rows')
+                        if rows is None and sub_query.get('result_ref'):
+                            results = results or ResultStore(os.path.join(chats_dir, "results"))
+                            rows = results.get(sub_query['result_ref'])
+                        if has_values(rows or []):
+                            sub_queries.append(sub_query)
+                else:
+                    sub_queries = self._parse_sub_queries(message.get('content'))
+                for sub_query in sub_queries:
+                    self._add(sub_query['sub_query'], sub_query['sql_query'],
+                              sub_query['table'], sub_query.get('entities', []))
+
+    def _parse_sub_queries(self, content) -> List[Dict]:
+        """Extract validated sub-queries from an assistant message, stored as a dict or its repr"""
+        if isinstance(content, str):
+            try:
+                content = ast.literal_eval(content)
+            except (ValueError, SyntaxError):
+                return []
+        if not isinstance(content, dict):
+            return []
+
+        sub_queries = []
+        for sub_query in content.get('sub_queries', []):
+            execution = sub_query.get('execution_results') or {}
+            if not execution.get('success') or not has_values(execution.get('data') or []):
+                continue
+            if all(sub_query.get(key) for key in ('sub_query', 'sql_query', 'table')):
+                sub_queries.append(sub_query)
+        return sub_queries
+
+    def _load_harvested(self):
+        """Load pairs harvested from executions in earlier sessions"""
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._add(entry['question'], entry['sql_query'], entry['table'], entry.get('entities', []))
+
+    def _add(self, question: str, sql_query: str, table: str, entities: List[Dict]) -> Optional[SQLExample]:
+        """Add a pair to the in-memory store, returning None for duplicates"""
+        pattern = question_pattern(question, entities)
+        key = (table, pattern, sql_query.strip())
+        with self._lock:
+            if key in self._seen:
+                return None
+            self._seen.add(key)
+            example = SQLExample(
+                question=question, sql_query=sql_query.strip(), table=table,
+                entities=[{k: e[k] for k in ('search_term', 'column', 'matched_value') if k in e} for e in entities],
+                periods=resolve_periods(question), pattern=pattern
+            )
+            self.examples.append(example)
+            self._index = None
+        return example
+
+    def add(self, question: str, sql_query: str, table: str, entities: List[Dict]):
+        """Record a pair whose SQL has been validated by executing it"""
+        example = self._add(question, sql_query, table, entities)
+        if not example:
+            return
+        with self._lock:
+            with open(self.file_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({
+                    "question": example.question, "sql_query": example.sql_query,
+                    "table": example.table, "entities": example.entities
+                }, ensure_ascii=False) + "\n")
+
+    def search(self, question: str, table: str, entities: List[Dict] = None, k: int = Config.few_shot_examples) -> List[SQLExample]:
+        """Return the k most similar examples for the same table, best first"""
+        index = self._build_index()
+        if not index['docs'] or k <= 0:
+            return []
+
+        query_tokens = set(_tokens(question_pattern(question, entities or [])))
+        scores = []
+        for i, (example, doc) in enumerate(zip(self.examples, index['docs'])):
+            if example.table != table:
+                continue
+            score = 0.0
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * index['lengths'][i] / index['avg_length'])
+            for token in query_tokens:
+                tf = doc.get(token)
+                if tf:
+                    score += index['idf'][token] * tf * (BM25_K1 + 1) / (tf + length_norm)
+            if score > 0:
+                scores.append((score, i))
+
+        scores.sort(key=lambda item: -item[0])
+        return [self.examples[i] for _, i in scores[:k]]
+
+    def _build_index(self) -> Dict:
+        """Build the BM25 statistics lazily, after the store last changed"""
+        with self._lock:
+            if self._index is None:
+                docs = [Counter(_tokens(example.pattern)) for example in self.examples]
+                lengths = [sum(doc.values()) for doc in docs]
+                df = Counter(token for doc in docs for token in doc)
+                n = len(docs)
+                self._index = {
+                    "docs": docs,
+                    "lengths": lengths,
+                    "avg_length": (sum(lengths) / n) if n else 1.0,
+                    "idf": {token: math.log(1 + (n - count + 0.5) / (count + 0.5)) for token, count in df.items()},
+                }
+            return self._index
+
+    def reuse(self, question: str, table: str, entities: List[Dict], table_info) -> Optional[str]:
+        """
+        Return stored SQL for a question with exactly the same pattern, with entity values
+        and the month substituted, or None when the substitution would not be safe. Only
+        entity-role columns (property, operator) are swapped; metrics must match exactly,
+        since they decide the aggregate and the column alias.
+        """
+        pattern = question_pattern(question, entities)
+        columns = [entity['column'] for entity in entities]
+        if len(set(columns)) != len(columns) or not self._terms_present(question, entities):
+            return None
+        periods = resolve_periods(question)
+
+        for example in reversed(self.examples):
+            if example.table != table or example.pattern != pattern:
+                continue
+            if sorted(e['column'] for e in example.entities) != sorted(columns):
+                continue
+            if not self._terms_present(example.question, example.entities):
+                continue
+            sql_query = self._substitute(example, entities, periods, table_info.columns_with_role("entity"))
+            if sql_query:
+                return sql_query
+        return None
+
+    def _terms_present(self, question: str, entities: List[Dict]) -> bool:
+        """Every matched term must appear in the question for its placeholder to be meaningful"""
+        return all(entity.get('search_term') and entity['search_term'].lower() in question.lower()
+                   for entity in entities)
+
+    def _substitute(self, example: SQLExample, entities: List[Dict], periods: List[str],
+                    entity_columns: List[str]) -> Optional[str]:
+        """Swap the example's entity values and period for the new ones"""
+        sql_query = example.sql_query
+        new_values = {entity['column']: entity['matched_value'] for entity in entities}
+        for entity in example.entities:
+            if new_values[entity['column']] == entity['matched_value']:
+                continue
+            if entity['column'] not in entity_columns:
+                return None
+            old_literal = "'" + entity['matched_value'].replace("'", "''") + "'"
+            if old_literal not in sql_query:
+                return None
+            new_literal = "'" + new_values[entity['column']].replace("'", "''") + "'"
+            sql_query = sql_query.replace(old_literal, new_literal)
+
+        if example.periods == periods:
+            return sql_query
+        if len(example.periods) != 1 or len(periods) != 1:
+            return None
+        return move_month(sql_query, example.periods[0], periods[0])
+
+    def format_examples(self, examples: List[SQLExample]) -> str:
+        """Format examples for a generation prompt"""
+        return "\n\n".join(f"Question: {example.question}\nSQL:\n{example.sql_query}" for example in examples)
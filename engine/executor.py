@@ -21,8 +21,8 @@ class SQLExecutor:
         # Convert to lowercase for checking
         query_lower = sql_query.lower().strip()
 
-        # Must start with SELECT
-        if not query_lower.startswith('select'):
+        # Must be a read-only query: SELECT, WITH ... SELECT or a parenthesized compound SELECT
+        if not re.match(r'\(*\s*(?:select|with)\b', query_lower):
             return False, "Only SELECT queries are allowed"
 
         # Check for blocked operations
@@ -1,32 +1,64 @@
-from typing import Dict, List
+import re
+import json
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
 from anthropic import Anthropic
 from config import Config
 from .metadata import FinancialTableMetadata
+from .templates import SQLTemplateEngine
+from .cache import SQLCache
+from .linter import SQLLinter
+from .examples import ExampleStore
+from utils.llm import CachedPrompt, call_llm
+from utils.intent import resolve_periods, detect_aggregation
+
+# Rules shared by the generation and repair prompts; they sit in the cached prompt prefix
+SQL_REQUIREMENTS = """1. ONLY use columns from the "Available Columns" list
+2. For ANY filtering conditions (WHERE, HAVING, etc.):
+   - You can ONLY use the exact values listed under "Matched Values"
+   - NO partial matches, LIKE patterns, or any values not explicitly shown in the matches
+   - For example, if 'Room Revenue' isn't in the matched values, you cannot use "WHERE column LIKE '%Room Revenue%'"
+3. Return a valid SQLite query
+4. In WHERE clauses, use the exact matched value (e.g., if match is "Found 'apple' in column 'company' matching value 'Apple Inc.'", use "WHERE company = 'Apple Inc.'" NOT "WHERE company = 'apple'")
+5. Use proper SQL syntax and formatting"""
+
+# Rough prompt-token estimate used to report the effect of schema pruning
+CHARS_PER_TOKEN = 4
+
+# Extra instructions that make speculative candidates differ from each other
+SPECULATIVE_HINTS = [
+    "",
+    "Filter on every matched value that applies and aggregate the measure column",
+    "If the question spans several entities or months, GROUP BY them so each appears as its own row",
+    "Keep the query as simple as possible: one table, no subqueries",
+]
+
+class SQLGenerationError(ValueError):
+    """Generated SQL that still failed validation after repair; keeps the statement for the next repair"""
+
+    def __init__(self, message: str, sql_query: str = ""):
+        super().__init__(message)
+        self.sql_query = sql_query
 
 class SQLGenerator:
-    def __init__(self, llm):
+    def __init__(self, llm, use_templates: bool = Config.templates_enabled, sql_cache: SQLCache = None,
+                 examples: ExampleStore = None):
         # Store the wrapped client directly
         self.llm = llm
         self.metadata = FinancialTableMetadata()
+        self.templates = SQLTemplateEngine() if use_templates else None
+        self.cache = sql_cache if sql_cache is not None else (SQLCache() if Config.cache_enabled else None)
+        self.linter = SQLLinter(self.metadata)
+        self.examples = examples
+        self.stats = {
+            "cache_hits": 0, "template_hits": 0, "example_hits": 0, "llm_generated": 0, "llm_requests": 0,
+            "local_repairs": 0, "llm_repairs": 0, "schema_tokens_full": 0, "schema_tokens_sent": 0
+        }
 
-    def _call_llm(self, prompt: str) -> str:
+    def _call_llm(self, prompt: str, temperature: float = 0, stage: str = "generation", validate=None) -> str:
         """Helper method to call Claude with consistent parameters"""
-        # Use the wrapped client's direct call method
-        if hasattr(self.llm, 'invoke'):
-            response = self.llm.invoke(prompt)
-            return response.content
-        elif hasattr(self.llm, 'messages'):
-            # Direct Anthropic client call with Sonnet model
-            response = self.llm.messages.create(
-                model=Config.sonnet_model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0,
-                max_tokens=1000
-            )
-            return response.content[0].text
-        else:
-            # Direct call to the wrapped function
-            return self.llm(prompt)
+        return call_llm(self.llm, prompt, stage=stage, temperature=temperature, validate=validate)
 
     def generate_sql(self, query_info: Dict) -> str:
         """
@@ -37,57 +69,403 @@ class SQLGenerator:
                 - sub_query: The natural language question
                 - table: The target table name 
                 - extracted_entities: List of matched entities
+                - periods: Optional resolved month-start dates
+                - aggregation: Optional aggregation intent
         """
-        # Get table metadata
-        table_info = self.metadata.get_table_info(query_info['table'])
-        if not table_info:
-            raise ValueError(f"Table '{query_info['table']}' not found in metadata")
-            
-        # Format available columns
-        available_columns = self._format_table_schema(table_info)
+        sql_query, _ = self.generate_sql_with_source(query_info)
+        return sql_query
+
+    def generate_sql_with_source(self, query_info: Dict) -> Tuple[str, str]:
+        """
+        Generate SQL and report where it came from
         
-        # Use the extracted entities directly
-        entity_matches = self._format_entity_matches(query_info.get('extracted_entities', []), table_info)
+        Returns:
+            Tuple of (sql_query: str, source: str) where source is "cache", "template:<name>" or "llm"
+        """
+        table_info = self._get_table_info(query_info)
+        resolved = self._generate_without_llm(query_info, table_info)
+        if resolved:
+            return resolved
+
+        self.stats["llm_generated"] += 1
+        self.stats["llm_requests"] += 1
+        prompt = self._build_prompt(query_info, table_info)
+        raw_output = self._call_llm(prompt, validate=lambda text: self.linter.lint(text, query_info['table']).is_valid)
+        return self._finalize_sql(raw_output, query_info), "llm"
+
+    def generate_sql_speculative(self, query_info: Dict, validate: Callable[[str], Tuple[bool, str, Optional[List[Dict]]]],
+                                 candidates: int = Config.speculative_candidates,
+                                 stagger: float = Config.speculative_stagger) -> Tuple[str, str, Optional[List[Dict]]]:
+        """
+        Request several candidate statements, using different prompt variants and temperatures,
+        and return the first one that passes validation together with the rows validation
+        fetched, so the caller need not run it again. Candidates start stagger seconds apart,
+        or as soon as the previous ones all failed, so once one is valid those not started yet
+        are never sent; requests already in flight still complete. Candidates are validated on
+        the calling thread as they arrive, so validate may use the database connection.
         
-        prompt = f"""Given the following information, generate a SQL query:
+        Args:
+            query_info: Same as generate_sql
+            validate: Callable returning (is_valid, error, rows) for a SQL string, e.g. compiles and returns rows
+            candidates: Number of candidates
+            stagger: Seconds to wait for a valid candidate before starting the next one
+        """
+        table_info = self._get_table_info(query_info)
+        resolved = self._generate_without_llm(query_info, table_info)
+        if resolved:
+            is_valid, _, rows = validate(resolved[0])
+            if is_valid:
+                return (*resolved, rows)
+
+        self.stats["llm_generated"] += 1
+        pool = ThreadPoolExecutor(max_workers=candidates)
+        running, variants = {}, iter(range(candidates))
+
+        def start_next() -> bool:
+            variant = next(variants, None)
+            if variant is None:
+                return False
+            # Each worker runs in a copy of the caller's context so telemetry collectors see its calls
+            future = pool.submit(contextvars.copy_context().run, self._generate_candidate, query_info, table_info, variant)
+            running[future] = variant
+            self.stats["llm_requests"] += 1
+            return True
+
+        first_compiled, errors = None, []
+        try:
+            start_next()
+            while running:
+                done, _ = wait(running, timeout=stagger, return_when=FIRST_COMPLETED)
+                if not done:
+                    start_next()
+                    continue
+                for future in done:
+                    variant = running.pop(future)
+                    try:
+                        sql_query = future.result()
+                    except Exception as e:
+                        errors.append(str(e))
+                        continue
+                    is_valid, error, rows = validate(sql_query)
+                    if is_valid:
+                        return sql_query, f"llm:speculative:{variant}", rows
+                    errors.append(error)
+                    first_compiled = first_compiled or sql_query
+                if not running:
+                    start_next()
+        finally:
+            pool.shutdown(wait=False)
+
+        # No candidate returned rows; keep one that at least lints so execution reports the outcome
+        if first_compiled:
+            return first_compiled, "llm:speculative", None
+        raise ValueError(f"No SQL candidate passed validation: {'; '.join(errors)}")
+
+    def _generate_candidate(self, query_info: Dict, table_info, variant: int) -> str:
+        """Generate and locally lint one speculative candidate"""
+        hint = SPECULATIVE_HINTS[variant % len(SPECULATIVE_HINTS)]
+        temperature = min(0.2 * variant, 1.0)
+        result = self.linter.lint(self._call_llm(self._build_prompt(query_info, table_info, hint), temperature),
+                                  query_info['table'])
+        if not result.is_valid:
+            raise ValueError("; ".join(result.errors))
+        return result.sql_query
+
+    def _build_prompt(self, query_info: Dict, table_info, hint: str = "") -> CachedPrompt:
+        """Build the single-query generation prompt: static table instructions first, the question last"""
+        hint_line = f"\nAdditional requirement: {hint}\n" if hint else ""
+        prefix = f"""Given the following information, generate a SQL query:
 
-Natural Language Query: {query_info['sub_query']}
 Table: {query_info['table']}
 
 Available Columns (ONLY use these columns in your query):
-{available_columns}
-
-Matched Values:
-{entity_matches}
+{self._prompt_schema(table_info, [query_info])}
 
 Requirements:
-1. ONLY use columns from the "Available Columns" list above
-2. For ANY filtering conditions (WHERE, HAVING, etc.):
-   - You can ONLY use the exact values listed in "Matched Values" above
-   - NO partial matches, LIKE patterns, or any values not explicitly shown in the matches
-   - For example, if 'Room Revenue' isn't in the matched values, you cannot use "WHERE column LIKE '%Room Revenue%'"
-3. Return a valid SQLite query
-4. In WHERE clauses, use the exact matched value (e.g., if match is "Found 'apple' in column 'company' matching value 'Apple Inc.'", use "WHERE company = 'Apple Inc.'" NOT "WHERE company = 'apple'")
-5. Use proper SQL syntax and formatting
+{SQL_REQUIREMENTS}
 6. Return ONLY the SQL query without any explanation
 7. The query must start with SELECT
 
+"""
+        suffix = f"""Natural Language Query: {query_info['sub_query']}
+
+Matched Values:
+{self._format_entity_matches(query_info.get('extracted_entities', []), table_info)}
+{self._format_examples([query_info])}{hint_line}
 SQL Query:"""
+        return CachedPrompt(prefix, suffix)
 
-        sql_query = self._call_llm(prompt).strip()
+    def generate_sql_batch(self, query_infos: List[Dict], errors: List[str] = None) -> List:
+        """
+        Generate SQL for all sub-queries of a request with at most one LLM call.
+        Cache and template hits are resolved first; the remaining sub-queries share a
+        single prompt that lists each table schema once and asks for a JSON array of SQL.
         
-        # Basic validation
-        if not sql_query.lower().startswith('select'):
-            raise ValueError("Generated query must start with SELECT")
+        Args:
+            query_infos: Same as generate_sql, one per sub-query
+            errors: Optional list that batch failures recovered from by generating individually are appended to
         
-        return sql_query
+        Returns:
+            List in the same order as query_infos of (sql_query, source) tuples, or the ValueError
+            of a sub-query whose SQL could not be generated so the others still run
+        """
+        outputs = [None] * len(query_infos)
+        pending = []
+        for idx, query_info in enumerate(query_infos):
+            table_info = self._get_table_info(query_info)
+            outputs[idx] = self._generate_without_llm(query_info, table_info)
+            if outputs[idx] is None:
+                pending.append(idx)
+
+        batch = None
+        if len(pending) > 1:
+            try:
+                batch = self._generate_llm_batch([query_infos[idx] for idx in pending])
+            except ValueError as e:
+                # Fall back to one prompt per sub-query
+                if errors is not None:
+                    errors.append(f"Batched SQL generation failed, generated individually: {e}")
+
+        if batch is not None:
+            self.stats["llm_generated"] += len(pending)
+            self.stats["llm_requests"] += 1
+        for position, idx in enumerate(pending):
+            try:
+                if batch is None:
+                    outputs[idx] = self.generate_sql_with_source(query_infos[idx])
+                else:
+                    outputs[idx] = (self._finalize_sql(batch[position], query_infos[idx]), "llm:batch")
+            except ValueError as e:
+                outputs[idx] = e
+
+        return outputs
+
+    def _generate_llm_batch(self, query_infos: List[Dict]) -> List[str]:
+        """Generate SQL for several sub-queries in one prompt and parse the JSON array response"""
+        tables = []
+        for query_info in query_infos:
+            if query_info['table'] not in tables:
+                tables.append(query_info['table'])
+
+        schemas = []
+        for table in tables:
+            table_queries = [query_info for query_info in query_infos if query_info['table'] == table]
+            schemas.append(
+                f"Table: {table}\n"
+                f"Available Columns (ONLY use these columns in your query):\n"
+                f"{self._prompt_schema(self.metadata.get_table_info(table), table_queries)}"
+            )
 
-    def _format_table_schema(self, table_info) -> str:
-        """Format available columns for the prompt"""
+        questions = []
+        for idx, query_info in enumerate(query_infos, 1):
+            table_info = self.metadata.get_table_info(query_info['table'])
+            questions.append(
+                f"Query {idx}: {query_info['sub_query']}\n"
+                f"Table: {query_info['table']}\n"
+                f"Matched Values:\n"
+                f"{self._format_entity_matches(query_info.get('extracted_entities', []), table_info)}"
+            )
+
+        schema_block = "\n\n".join(schemas)
+        question_block = "\n\n".join(questions)
+        prefix = f"""Given the following information, generate one SQL query for each numbered natural language query.
+
+{schema_block}
+
+Requirements:
+{SQL_REQUIREMENTS}
+6. Return ONLY a JSON array of strings, one SQL query per numbered query, in order, without any explanation
+7. Every query must start with SELECT
+
+"""
+        suffix = f"""{question_block}
+{self._format_examples(query_infos)}
+Return exactly {len(query_infos)} SQL queries.
+
+JSON Array:"""
+
+        def is_valid(text):
+            try:
+                self._parse_batch_response(text, len(query_infos))
+                return True
+            except ValueError:
+                return False
+
+        response = self._call_llm(CachedPrompt(prefix, suffix), stage="batch_generation", validate=is_valid)
+        return self._parse_batch_response(response, len(query_infos))
+
+    def _parse_batch_response(self, response: str, count: int) -> List[str]:
+        """Parse the JSON array of SQL statements returned for a batch"""
+        response = re.sub(r'```(?:json)?\s*|\s*```', '', response.strip())
+        try:
+            sql_queries = json.loads(response)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Batch response is not valid JSON: {e}")
+
+        if not isinstance(sql_queries, list) or len(sql_queries) != count:
+            raise ValueError(f"Expected a JSON array of {count} SQL queries")
+
+        return [str(sql_query) for sql_query in sql_queries]
+
+    def _get_table_info(self, query_info: Dict):
+        """Get table metadata for a sub-query"""
+        table_info = self.metadata.get_table_info(query_info['table'])
+        if not table_info:
+            raise ValueError(f"Table '{query_info['table']}' not found in metadata")
+        return table_info
+
+    def _generate_without_llm(self, query_info: Dict, table_info) -> Optional[Tuple[str, str]]:
+        """Resolve SQL from the cache or a template, or None when the LLM is needed"""
+        # Previously validated SQL for the same intent
+        if self.cache:
+            cached_sql = self.cache.get(query_info, table_info)
+            if cached_sql:
+                self.stats["cache_hits"] += 1
+                return cached_sql, "cache"
+
+        # Deterministic templates first, the LLM only when none fits
+        if self.templates:
+            match = self.templates.match(query_info, table_info)
+            if match:
+                self.stats["template_hits"] += 1
+                return match.to_sql(), f"template:{match.name}"
+
+        # Validated SQL of a past question that differs only in entity values or month
+        if self.examples and Config.example_reuse:
+            sql_query = self.examples.reuse(query_info['sub_query'], query_info['table'],
+                                            query_info.get('extracted_entities', []), table_info)
+            if sql_query:
+                self.stats["example_hits"] += 1
+                return sql_query, "example"
+        return None
+
+    def repair_sql(self, query_info: Dict, sql_query: str, error: str) -> str:
+        """Ask the LLM to fix a statement, attaching the parser or database error"""
+        table_info = self._get_table_info(query_info)
+        self.stats["llm_repairs"] += 1
+        prefix = f"""The SQL query below failed. Fix it.
+
+Table: {query_info['table']}
+
+Available Columns (ONLY use these columns in your query):
+{self._format_table_schema(table_info)}
+
+Requirements:
+{SQL_REQUIREMENTS}
+6. Return ONLY the corrected SQL query without any explanation
+7. The query must start with SELECT
+
+"""
+        suffix = f"""Natural Language Query: {query_info['sub_query']}
+
+Failed SQL Query:
+{sql_query}
+
+Error:
+{error}
+
+Matched Values:
+{self._format_entity_matches(query_info.get('extracted_entities', []), table_info)}
+
+SQL Query:"""
+        prompt = CachedPrompt(prefix, suffix)
+
+        result = self.linter.lint(self._call_llm(prompt, stage="repair"), query_info['table'])
+        if not result.is_valid:
+            raise SQLGenerationError(f"Generated SQL failed validation: {'; '.join(result.errors)}",
+                                     result.sql_query)
+        return result.sql_query
+
+    def _finalize_sql(self, raw_output: str, query_info: Dict) -> str:
+        """Lint LLM output, repairing it locally and only calling the LLM again as a last resort"""
+        result = self.linter.lint(raw_output, query_info['table'])
+        if result.fixes:
+            self.stats["local_repairs"] += 1
+        if result.is_valid:
+            return result.sql_query
+        return self.repair_sql(query_info, result.sql_query, "; ".join(result.errors))
+
+    def remember_sql(self, query_info: Dict, sql_query: str):
+        """Cache SQL once it has been validated by executing it, and keep it as an example"""
+        table_info = self.metadata.get_table_info(query_info['table'])
+        if self.cache and table_info:
+            self.cache.put(query_info, table_info, sql_query)
+        if self.examples:
+            self.examples.add(query_info['sub_query'], sql_query, query_info['table'],
+                              query_info.get('extracted_entities', []))
+
+    def schema_token_reduction(self) -> float:
+        """Fraction of schema prompt tokens saved by column pruning so far"""
+        full = self.stats["schema_tokens_full"]
+        return 1 - self.stats["schema_tokens_sent"] / full if full else 0.0
+
+    def template_hit_rate(self) -> float:
+        """Fraction of generated queries answered by a template instead of the LLM"""
+        total = self.stats["template_hits"] + self.stats["llm_generated"]
+        return self.stats["template_hits"] / total if total else 0.0
+
+    def _prompt_schema(self, table_info, query_infos: List[Dict]) -> str:
+        """The full schema keeps a cached prompt prefix identical across questions; otherwise prune it"""
+        if Config.prompt_caching:
+            return self._format_table_schema(table_info)
+        return self._format_table_schema(table_info, query_infos)
+
+    def _format_table_schema(self, table_info, query_infos: List[Dict] = None) -> str:
+        """Format available columns for the prompt, pruned to the columns relevant to the given sub-queries"""
         schema = []
         for col_name, col_info in table_info.columns.items():
             schema.append(f"- {col_name}: {col_info.description}")
-        return "\n".join(schema)
+        if not query_infos or not Config.prune_schema:
+            return "\n".join(schema)
+
+        relevant = self._relevant_columns(table_info, query_infos)
+        pruned = [line for col_name, line in zip(table_info.columns, schema) if col_name in relevant]
+        self.stats["schema_tokens_full"] += len("\n".join(schema)) // CHARS_PER_TOKEN
+        self.stats["schema_tokens_sent"] += len("\n".join(pruned)) // CHARS_PER_TOKEN
+        return "\n".join(pruned)
+
+    def _relevant_columns(self, table_info, query_infos: List[Dict]) -> set:
+        """
+        Keep the measure columns, columns with matched entities or mentioned by name, the time
+        column when the question has a period or trend, and columns shared with related tables
+        """
+        relevant = set(table_info.columns_with_role("measure"))
+        for query_info in query_infos:
+            question = query_info['sub_query'].lower()
+            relevant.update(entity['column'] for entity in query_info.get('extracted_entities', []))
+            if query_info.get('periods') or resolve_periods(question) or \
+                    (query_info.get('aggregation') or detect_aggregation(question)) == "trend":
+                relevant.update(table_info.columns_with_role("time"))
+            for col_name in table_info.columns:
+                # e.g. "by property" needs SQL_Property to group on
+                words = [word for word in col_name.lower().split('_') if len(word) > 3]
+                if any(word[:5] in question for word in words):
+                    relevant.add(col_name)
+
+        for related in table_info.relationships:
+            related_info = self.metadata.get_table_info(related)
+            if related_info:
+                relevant.update(set(table_info.columns) & set(related_info.columns))
+        return relevant & set(table_info.columns)
+
+    def _format_examples(self, query_infos: List[Dict]) -> str:
+        """Format the most similar validated examples for the prompt, or nothing without a store"""
+        if not self.examples or Config.few_shot_examples <= 0:
+            return ""
+        ranked = [
+            self.examples.search(query_info['sub_query'], query_info['table'], query_info.get('extracted_entities', []))
+            for query_info in query_infos
+        ]
+        # Take the best example of each sub-query in turn so every question is represented
+        examples = []
+        for rank in range(Config.few_shot_examples):
+            for results in ranked:
+                if rank < len(results) and results[rank] not in examples:
+                    examples.append(results[rank])
+        examples = examples[:Config.few_shot_examples]
+        if not examples:
+            return ""
+        return f"\nExamples of validated SQL for similar questions:\n{self.examples.format_examples(examples)}\n"
 
     def _format_entity_matches(self, entity_matches: List[Dict], table_info) -> str:
         """Format entity matches using the extracted entities"""
@@ -0,0 +1,149 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from fuzzywuzzy import process
+
+# Minimum fuzzy score for replacing an unknown column with a known one
+COLUMN_REPAIR_SCORE = 85
+
+# Where the statement starts in LLM output: a CTE definition ("WITH name AS (") or a SELECT,
+# so prose such as "a query with the totals" is not mistaken for the start
+STATEMENT_START = r'\bwith\s+(?:recursive\s+)?["`\w]+\s*(?:\([^)]*\))?\s+as\s*\(|\bselect\b'
+
+@dataclass
+class LintResult:
+    sql_query: str
+    fixes: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+class SQLLinter:
+    """
+    Local post-generation checks for LLM output: strips markdown fences and commentary,
+    parses the statement with sqlglot, checks table and column names against the metadata
+    and applies deterministic repairs (column name case, close misspellings, double-quoted
+    string values, unknown table names) before anyone pays for an LLM retry.
+    """
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    def lint(self, raw_output: str, table_name: str) -> LintResult:
+        """Clean, parse, check and repair a generated statement"""
+        sql_query = self.extract_sql(raw_output)
+        if not sql_query:
+            return LintResult(sql_query=raw_output.strip(), errors=["No SELECT statement found in the output"])
+
+        try:
+            tree = self._parse(sql_query)
+        except SqlglotError as e:
+            return LintResult(sql_query=sql_query, errors=[f"Parse error: {self._clean_message(e)}"])
+
+        result = LintResult(sql_query=sql_query)
+        # Any read-only query: a SELECT, with or without CTEs, or a UNION / INTERSECT / EXCEPT of them
+        if not isinstance(tree, exp.Query):
+            result.errors.append("The query must be a single SELECT statement")
+            return result
+
+        self._check_tables(tree, table_name, result)
+        self._check_columns(tree, table_name, result)
+
+        if result.fixes:
+            result.sql_query = tree.sql(dialect="sqlite", pretty=True)
+        return result
+
+    def extract_sql(self, raw_output: str) -> Optional[str]:
+        """Strip markdown fences, leading prose and trailing commentary from LLM output"""
+        text = raw_output.strip()
+        fenced = re.search(r'```(?:sql|sqlite)?\s*(.*?)```', text, re.IGNORECASE | re.DOTALL)
+        if fenced:
+            text = fenced.group(1).strip()
+
+        start = re.search(STATEMENT_START, text, re.IGNORECASE)
+        if not start:
+            return None
+        text = text[start.start():]
+
+        # Cut at the first statement terminator outside a string literal
+        in_quote = None
+        for i, char in enumerate(text):
+            if char in ("'", '"'):
+                in_quote = None if in_quote == char else (in_quote or char)
+            elif char == ';' and not in_quote:
+                return text[:i].strip()
+
+        # No terminator: drop trailing lines until the rest parses
+        lines = text.split('\n')
+        for end in range(len(lines), 0, -1):
+            candidate = "\n".join(lines[:end]).strip()
+            try:
+                self._parse(candidate)
+                return candidate
+            except SqlglotError:
+                continue
+        return text.strip()
+
+    def _parse(self, sql_query: str):
+        """Parse exactly one SQLite statement"""
+        statements = [s for s in sqlglot.parse(sql_query, read="sqlite") if s is not None]
+        if len(statements) != 1:
+            raise sqlglot.errors.ParseError("Expected exactly one statement")
+        return statements[0]
+
+    def _check_tables(self, tree, table_name: str, result: LintResult):
+        """Replace unknown table names with the target table; CTE names are not tables"""
+        ctes = {cte.alias.lower() for cte in tree.find_all(exp.CTE)}
+        for table in tree.find_all(exp.Table):
+            if table.name in self.metadata.tables or table.name.lower() in ctes:
+                continue
+            known = {name.lower(): name for name in self.metadata.tables}
+            replacement = known.get(table.name.lower()) or table_name
+            if replacement in self.metadata.tables:
+                result.fixes.append(f"Replaced unknown table '{table.name}' with '{replacement}'")
+                table.set("this", exp.to_identifier(replacement))
+            else:
+                result.errors.append(f"Unknown table '{table.name}'")
+
+    def _check_columns(self, tree, table_name: str, result: LintResult):
+        """Check column references against the metadata and repair what can be repaired"""
+        table_info = self.metadata.get_table_info(table_name)
+        if not table_info:
+            result.errors.append(f"Table '{table_name}' not found in metadata")
+            return
+
+        columns = list(table_info.columns)
+        by_lower = {name.lower(): name for name in columns}
+        aliases = {alias.alias for alias in tree.find_all(exp.Alias)}
+
+        for column in list(tree.find_all(exp.Column)):
+            name = column.name
+            if name in columns or name in aliases or column.this.__class__ is exp.Star:
+                continue
+
+            # "AC Wailea" in double quotes is an identifier in SQL; the value was meant
+            if column.this.quoted and not column.table and name.lower() not in by_lower:
+                result.fixes.append(f"Quoted \"{name}\" as a string value")
+                column.replace(exp.Literal.string(name))
+                continue
+
+            if name.lower() in by_lower:
+                fixed = by_lower[name.lower()]
+            else:
+                match = process.extractOne(name, columns)
+                fixed = match[0] if match and match[1] >= COLUMN_REPAIR_SCORE else None
+
+            if fixed:
+                result.fixes.append(f"Replaced unknown column '{name}' with '{fixed}'")
+                column.set("this", exp.to_identifier(fixed))
+            else:
+                result.errors.append(f"Unknown column '{name}' in table '{table_name}'")
+
+    def _clean_message(self, error: Exception) -> str:
+        """Drop the terminal colour codes sqlglot puts around the error position"""
+        return re.sub(r'\x1b\[[0-9;]*m', '', str(error)).strip()
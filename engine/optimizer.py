@@ -0,0 +1,192 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Statement shapes the optimizer leaves alone
+UNSUPPORTED_PATTERN = r'\b(limit|offset|having|union|intersect|except|join|with)\b|\(\s*select\b'
+AGGREGATE_PATTERN = r'\b(sum|avg|count|min|max|total|group_concat)\s*\('
+STATEMENT_PATTERN = re.compile(
+    r'^\s*select\s+(?P<select>.+?)\s+from\s+(?P<table>[\w"\[\]]+)\s+where\s+(?P<where>.+?)'
+    r'(?:\s+group\s+by\s+(?P<group>.+?))?(?:\s+order\s+by\s+(?P<order>.+?))?\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+EQUALITY_PATTERN = re.compile(r'^(?P<column>\w+|"[^"]+"|\[[^\]]+\])\s*=\s*\'(?P<value>(?:[^\']|\'\')*)\'$', re.DOTALL)
+
+@dataclass
+class ParsedQuery:
+    select: str
+    table: str
+    predicates: List[str]
+    group: Optional[str]
+    order: Optional[str]
+
+@dataclass
+class MergedQuery:
+    sql_query: str
+    column: str
+    members: Dict[int, str] = field(default_factory=dict)  # sub-query index -> filter value
+    helper_column: bool = False  # Filter column added to SELECT only to split the rows
+    ungrouped_aggregate: bool = False  # Originals returned one aggregate row each
+
+class SQLOptimizer:
+    """
+    Merges sibling sub-queries that differ only in the value of one equality filter,
+    e.g. the same metric for several properties, into a single
+    WHERE col IN (...) GROUP BY col statement, and splits the rows back per sub-query.
+    """
+
+    def merge_siblings(self, sql_queries: List[str]) -> List[MergedQuery]:
+        """Find groups of sibling queries and build one merged statement per group"""
+        parsed = {idx: self._parse(sql) for idx, sql in enumerate(sql_queries)}
+
+        # Every equality predicate is a candidate for the varying filter
+        candidates = {}
+        for idx, query in parsed.items():
+            if not query:
+                continue
+            for pos, predicate in enumerate(query.predicates):
+                match = EQUALITY_PATTERN.match(predicate)
+                if not match:
+                    continue
+                column = match.group('column')
+                key = (
+                    query.select, query.table, query.group, query.order, pos, column,
+                    tuple(p for i, p in enumerate(query.predicates) if i != pos)
+                )
+                candidates.setdefault(key, []).append((idx, match.group('value').replace("''", "'")))
+
+        merged, assigned = [], set()
+        for key, members in sorted(candidates.items(), key=lambda item: -len(item[1])):
+            members = [(idx, value) for idx, value in members if idx not in assigned]
+            if len(members) < 2 or len({value for _, value in members}) != len(members):
+                continue
+            merged.append(self._build_merged(parsed[members[0][0]], key[4], key[5], members))
+            assigned.update(idx for idx, _ in members)
+
+        return merged
+
+    def split_results(self, merged: MergedQuery, rows: List[Dict]) -> Dict[int, List[Dict]]:
+        """Distribute the rows of a merged statement back to its sub-queries"""
+        column = merged.column.strip('"[]')
+        split = {idx: [] for idx in merged.members}
+        by_value = {value: idx for idx, value in merged.members.items()}
+
+        for row in rows:
+            idx = by_value.get(row.get(column))
+            if idx is None:
+                continue
+            if merged.helper_column:
+                row = {k: v for k, v in row.items() if k != column}
+            split[idx].append(row)
+
+        # An ungrouped aggregate always returns one row, even when nothing matches
+        if merged.ungrouped_aggregate and rows:
+            empty_row = {k: None for k in rows[0] if not (merged.helper_column and k == column)}
+            for idx, member_rows in split.items():
+                if not member_rows:
+                    member_rows.append(dict(empty_row))
+
+        return split
+
+    def _parse(self, sql_query: str) -> Optional[ParsedQuery]:
+        """Parse the simple single-table SELECT shape, or None for anything else"""
+        if re.search(UNSUPPORTED_PATTERN, self._strip_literals(sql_query), re.IGNORECASE):
+            return None
+        match = STATEMENT_PATTERN.match(sql_query)
+        if not match:
+            return None
+
+        predicates = self._split_conjunction(match.group('where'))
+        if predicates is None:
+            return None
+        return ParsedQuery(
+            select=self._normalize(match.group('select')),
+            table=match.group('table'),
+            predicates=predicates,
+            group=self._normalize(match.group('group')) if match.group('group') else None,
+            order=self._normalize(match.group('order')) if match.group('order') else None,
+        )
+
+    def _split_conjunction(self, where: str) -> Optional[List[str]]:
+        """Split a WHERE clause on top-level AND, or None if it contains a top-level OR"""
+        predicates, current, depth, in_quote, i = [], [], 0, False, 0
+        while i < len(where):
+            char = where[i]
+            if char == "'":
+                in_quote = not in_quote
+            elif not in_quote and char == '(':
+                depth += 1
+            elif not in_quote and char == ')':
+                depth -= 1
+            elif not in_quote and depth == 0:
+                keyword = re.match(r'\s+(and|or)\s+', where[i:], re.IGNORECASE)
+                # BETWEEN x AND y is a single predicate
+                between = re.search(r'\bbetween\s+\S+$', "".join(current), re.IGNORECASE)
+                if keyword and not between:
+                    if keyword.group(1).lower() == 'or':
+                        return None
+                    predicates.append(self._normalize("".join(current)))
+                    current = []
+                    i += keyword.end()
+                    continue
+            current.append(char)
+            i += 1
+        predicates.append(self._normalize("".join(current)))
+        return predicates
+
+    def _build_merged(self, query: ParsedQuery, pos: int, column: str,
+                      members: List[Tuple[int, str]]) -> MergedQuery:
+        """Build the merged statement for one sibling group"""
+        values = ", ".join("'" + value.replace("'", "''") + "'" for _, value in members)
+        predicates = list(query.predicates)
+        predicates[pos] = f"{column} IN ({values})"
+
+        select_items = [item.strip() for item in self._split_top_level(query.select)]
+        helper_column = column not in select_items and '*' not in select_items
+        select = f"{column}, {query.select}" if helper_column else query.select
+
+        is_aggregate = bool(re.search(AGGREGATE_PATTERN, query.select, re.IGNORECASE))
+        group = query.group
+        if is_aggregate or group:
+            group = f"{column}, {group}" if group else column
+
+        lines = [f"SELECT {select}", f"FROM {query.table}", "WHERE " + "\n  AND ".join(predicates)]
+        if group:
+            lines.append(f"GROUP BY {group}")
+        if query.order:
+            lines.append(f"ORDER BY {query.order}")
+
+        return MergedQuery(
+            sql_query="\n".join(lines),
+            column=column,
+            members={idx: value for idx, value in members},
+            helper_column=helper_column,
+            ungrouped_aggregate=is_aggregate and not query.group,
+        )
+
+    def _split_top_level(self, text: str) -> List[str]:
+        """Split a comma-separated list, ignoring commas inside parentheses or quotes"""
+        items, current, depth, in_quote = [], [], 0, False
+        for char in text:
+            if char == "'":
+                in_quote = not in_quote
+            elif not in_quote and char == '(':
+                depth += 1
+            elif not in_quote and char == ')':
+                depth -= 1
+            elif not in_quote and depth == 0 and char == ',':
+                items.append("".join(current))
+                current = []
+                continue
+            current.append(char)
+        items.append("".join(current))
+        return items
+
+    def _strip_literals(self, sql_query: str) -> str:
+        """Blank out string literals so keywords inside values are ignored"""
+        return re.sub(r"'(?:[^']|'')*'", "''", sql_query)
+
+    def _normalize(self, text: str) -> str:
+        """Collapse whitespace outside string literals so formatting differences don't prevent a merge"""
+        parts = re.split(r"('(?:[^']|'')*')", text)
+        return "".join(part if part.startswith("'") else re.sub(r'\s+', ' ', part) for part in parts).strip()
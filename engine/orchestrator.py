@@ -1,14 +1,26 @@
-from typing import Dict, List, Tuple, Annotated, TypedDict
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple, Annotated, TypedDict
 from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import BaseMessage
-from langgraph.graph import StateGraph, Graph
-from langgraph.prebuilt.tool_executor import ToolExecutor
+from langgraph.graph import StateGraph, Graph, END
 from langchain_core.tools import BaseTool, StructuredTool, tool
 
+from config import Config
 from engine.decomposer import QueryDecomposer
 from engine.generator import SQLGenerator
+from engine.examples import ExampleStore, has_values
+from engine.context import ConversationStore, FollowUpRewriter
+from utils.telemetry import TELEMETRY
+from utils.llm import get_client
 from engine.executor import SQLExecutor
 from engine.analyzer import SQLAnalyzer
+from engine.optimizer import SQLOptimizer
+from utils.intent import resolve_periods, detect_aggregation
+
+# Progress callback of the query being processed, called with each workflow node's name before
+# the node runs; raising from it aborts the query between steps
+_progress: ContextVar[Optional[Callable[[str], None]]] = ContextVar("query_progress", default=None)
 
 class GraphState(TypedDict):
     query: str
@@ -18,22 +30,35 @@ class GraphState(TypedDict):
     final_analysis: Dict
     error: str
     steps_output: List[Dict]  # Track detailed steps like test_workflow
+    pending_indices: List[int]  # Sub-queries (re)generated and awaiting execution
+    validated_results: Dict[int, List[Dict]]  # Rows already fetched while validating speculative candidates
+    retry_count: int
+    started_at: float
+    llm_calls: List  # LLMCall and TelemetryEvent records of this request, see utils.telemetry
 
 class QueryOrchestrator:
     def __init__(self, llm: ChatAnthropic, db_connection):
         # Convert ChatAnthropic to compatible interface
         self.llm = self._create_compatible_llm(llm)
         self.decomposer = QueryDecomposer(self.llm)
-        self.generator = SQLGenerator(self.llm)
+        examples = ExampleStore() if Config.few_shot_examples or Config.example_reuse else None
+        self.generator = SQLGenerator(self.llm, examples=examples)
         self.executor = SQLExecutor(db_connection)
         self.analyzer = SQLAnalyzer(self.llm)
+        self.optimizer = SQLOptimizer()
+        self.conversations = ConversationStore()
+        self.follow_ups = FollowUpRewriter(self.decomposer.metadata)
         
-        # Initialize graph
+        # Initialize graph; follow-ups start from execution with SQL rewritten from the previous turn
         self.workflow = self._create_workflow()
+        self.follow_up_workflow = self._create_workflow(entry_point="execute")
 
     def _create_compatible_llm(self, llm: ChatAnthropic):
-        """Create a compatible LLM interface for core components"""
-        return lambda prompt: llm.invoke(prompt).content
+        """
+        Create a compatible LLM interface for core components: an Anthropic client with the
+        same key, so each stage can be routed to its own model (see Config.stage_routes)
+        """
+        return get_client(llm.anthropic_api_key.get_secret_value())
 
     def _decompose_step(self, state: GraphState) -> GraphState:
         """Handle query decomposition step"""
@@ -56,6 +81,8 @@ class QueryOrchestrator:
                     "query": query,
                     "table": table,
                     "entities": entities,
+                    "periods": resolve_periods(query),
+                    "aggregation": detect_aggregation(query),
                     "table_info": table_info,
                     "type": "direct" if len(sub_queries) == 1 else "decomposed",
                     "explanation": f"Query processed using {table} table"
@@ -79,28 +106,79 @@ class QueryOrchestrator:
             })
             return state
 
+    def _generation_input(self, query_info: Dict) -> Dict:
+        """Map a decomposition detail to the query info expected by the generator"""
+        return {
+            'sub_query': query_info['query'],
+            'table': query_info['table'],
+            'extracted_entities': query_info['entities'],
+            'periods': query_info.get('periods'),
+            'aggregation': query_info.get('aggregation')
+        }
+
     def _generate_step(self, state: GraphState) -> GraphState:
         """Handle SQL generation step"""
+        if self._failed_indices(state):
+            return self._repair_step(state)
+
         try:
-            generated_queries = []
-            for query_info in state["decomposed_queries"]:
-                # Generate SQL for this sub-query
-                query_data = {
-                    'sub_query': query_info['query'],
-                    'table': query_info['table'],
-                    'entities': query_info['entities']
-                }
-                
-                sql = self.generator.generate_sql(query_data)
+            query_data = [self._generation_input(query_info) for query_info in state["decomposed_queries"]]
+            schema_tokens = (self.generator.stats["schema_tokens_full"], self.generator.stats["schema_tokens_sent"])
+            batch_errors, validated = [], {}
+            if Config.speculative_candidates > 1:
+                # Several concurrent candidates per sub-query, first one that returns rows wins
+                outputs = []
+                for idx, data in enumerate(query_data):
+                    output = self._generate_branch(
+                        lambda data: self.generator.generate_sql_speculative(data, self._validate_candidate), data
+                    )
+                    if isinstance(output, tuple):
+                        sql, source, rows = output
+                        output = (sql, source)
+                        if rows is not None:
+                            validated[idx] = rows
+                    outputs.append(output)
+            elif Config.batch_generation:
+                # One LLM call for every sub-query that misses the cache and templates
+                outputs = self.generator.generate_sql_batch(query_data, batch_errors)
+            else:
+                outputs = [self._generate_branch(self.generator.generate_sql_with_source, data) for data in query_data]
+
+            # A sub-query whose SQL could not be generated is marked failed so the repair loop retries only it
+            generated_queries, query_results, pending = [], [None] * len(outputs), []
+            for idx, (query_info, output) in enumerate(zip(state["decomposed_queries"], outputs)):
+                if isinstance(output, Exception):
+                    sql, source = getattr(output, "sql_query", ""), "failed"
+                    query_results[idx] = {
+                        **query_info,
+                        "sql_query": sql,
+                        "sql_source": source,
+                        "executed_sql": None,
+                        "results": [],
+                        "error": str(output)
+                    }
+                else:
+                    sql, source = output
+                    pending.append(idx)
                 generated_queries.append({
                     **query_info,
-                    "sql_query": sql
+                    "sql_query": sql,
+                    "sql_source": source,
+                    "error": query_results[idx]["error"] if query_results[idx] else None
                 })
             
             state["generated_sql"] = generated_queries
+            state["query_results"] = query_results
+            state["pending_indices"] = pending
+            state["validated_results"] = validated
+            full_tokens = self.generator.stats["schema_tokens_full"] - schema_tokens[0]
+            sent_tokens = self.generator.stats["schema_tokens_sent"] - schema_tokens[1]
             state["steps_output"].append({
                 "step": "SQL Generation",
-                "queries": generated_queries,
+                "queries": list(generated_queries),
+                "template_hit_rate": self.generator.template_hit_rate(),
+                "schema_token_reduction": 1 - sent_tokens / full_tokens if full_tokens else 0.0,
+                "batch_errors": batch_errors,
                 "status": "completed"
             })
             return state
@@ -114,31 +192,104 @@ class QueryOrchestrator:
             })
             return state
 
+    def _generate_branch(self, generate: Callable[[Dict], Tuple[str, str]], data: Dict):
+        """Generate one sub-query, returning the ValueError instead of raising so its siblings still run"""
+        try:
+            return generate(data)
+        except ValueError as e:
+            return e
+
+    def _repair_step(self, state: GraphState) -> GraphState:
+        """Regenerate only the failed sub-queries, feeding back the SQLite error and the offending SQL"""
+        state["retry_count"] += 1
+        repaired, pending = [], []
+        for idx in self._failed_indices(state):
+            failed = state["query_results"][idx]
+            try:
+                sql = self.generator.repair_sql(
+                    self._generation_input(failed), failed["sql_query"], failed["error"]
+                )
+            except Exception as e:
+                # Keep the original failure; this branch is not retried again
+                TELEMETRY.record_event("repair", "repair_failed", f"sub-query {idx + 1}: {e}")
+                continue
+            state["generated_sql"][idx] = {**state["generated_sql"][idx], "sql_query": sql, "sql_source": "llm:repair"}
+            repaired.append(state["generated_sql"][idx])
+            pending.append(idx)
+
+        state["pending_indices"] = pending
+        state["validated_results"] = {}
+        state["steps_output"].append({
+            "step": "SQL Repair",
+            "attempt": state["retry_count"],
+            "queries": repaired,
+            "status": "completed"
+        })
+        return state
+
+    def _failed_indices(self, state: GraphState) -> List[int]:
+        """Indices of executed sub-queries that ended in an error"""
+        return [idx for idx, result in enumerate(state["query_results"]) if result.get("error")]
+
+    def _route_after_execute(self, state: GraphState) -> str:
+        """Retry failed branches while retries and time remain; skip analysis if every branch failed"""
+        failed = self._failed_indices(state)
+        if not failed:
+            return "analyze"
+
+        within_budget = time.time() - state["started_at"] < Config.request_time_budget
+        # The first repair covers branches that failed generation; later ones only run while repairs make progress
+        progressing = state["pending_indices"] or state["retry_count"] == 0
+        if state["retry_count"] < Config.max_sql_retries and within_budget and progressing:
+            return "generate"
+
+        return END if len(failed) == len(state["query_results"]) else "analyze"
+
     def _execute_step(self, state: GraphState) -> GraphState:
         """Handle SQL execution step"""
         try:
-            execution_results = []
-            for query_info in state["generated_sql"]:
-                # Validate and execute SQL
-                is_valid, error = self.executor.validate_query(query_info["sql_query"])
-                if is_valid:
-                    success, results, error = self.executor.execute_query(query_info["sql_query"])
-                    execution_results.append({
-                        **query_info,
-                        "results": results if success else [],
-                        "error": error if not success else None
-                    })
-                else:
-                    execution_results.append({
-                        **query_info,
-                        "results": [],
-                        "error": f"Validation failed: {error}"
-                    })
+            generated = state["generated_sql"]
+            pending = state["pending_indices"]
+            # Speculative winners were already run while validating them
+            outcomes = {idx: (True, rows, None) for idx, rows in state["validated_results"].items() if idx in pending}
+            executed_sql = {}
+            unexecuted = [idx for idx in pending if idx not in outcomes]
+
+            # Siblings that differ only in one filter value share a single scan
+            merged_queries = []
+            if Config.merge_sibling_queries:
+                merged_queries = self.optimizer.merge_siblings([generated[idx]["sql_query"] for idx in unexecuted])
+            for merged in merged_queries:
+                success, results, error = self._run_sql(merged.sql_query)
+                if not success:
+                    # Fall back to running the members individually
+                    continue
+                for member, member_rows in self.optimizer.split_results(merged, results).items():
+                    outcomes[unexecuted[member]] = (True, member_rows, None)
+                    executed_sql[unexecuted[member]] = merged.sql_query
+
+            for idx in pending:
+                if idx not in outcomes:
+                    outcomes[idx] = self._run_sql(generated[idx]["sql_query"])
+
+            execution_results = list(state["query_results"]) or [None] * len(generated)
+            for idx in pending:
+                query_info = generated[idx]
+                success, results, error = outcomes[idx]
+                if success and has_values(results) and query_info.get("sql_source", "").startswith(("llm", "example")):
+                    self.generator.remember_sql(self._generation_input(query_info), query_info["sql_query"])
+                execution_results[idx] = {
+                    **query_info,
+                    "executed_sql": executed_sql.get(idx, query_info["sql_query"]),
+                    "results": results if success else [],
+                    "error": error if not success else None
+                }
             
             state["query_results"] = execution_results
             state["steps_output"].append({
                 "step": "Query Execution",
-                "results": execution_results,
+                "results": [execution_results[idx] for idx in pending],
+                "merged_queries": len(merged_queries),
                 "status": "completed"
             })
             return state
@@ -152,6 +303,22 @@ class QueryOrchestrator:
             })
             return state
 
+    def _validate_candidate(self, sql_query: str) -> Tuple[bool, str, Optional[List[Dict]]]:
+        """A speculative candidate is valid when it compiles and returns rows, which are kept for execution"""
+        success, results, error = self._run_sql(sql_query)
+        if not success:
+            return False, error, None
+        if not results:
+            return False, "Query returned no rows", None
+        return True, "", results
+
+    def _run_sql(self, sql_query: str) -> Tuple[bool, List[Dict], str]:
+        """Validate and execute a single SQL statement"""
+        is_valid, error = self.executor.validate_query(sql_query)
+        if not is_valid:
+            return False, [], f"Validation failed: {error}"
+        return self.executor.execute_query(sql_query)
+
     def _analyze_step(self, state: GraphState) -> GraphState:
         """Handle results analysis step"""
         try:
@@ -175,29 +342,72 @@ class QueryOrchestrator:
             })
             return state
 
-    def _create_workflow(self) -> Graph:
+    def _instrumented(self, name: str, step):
+        """Wrap a workflow step so progress is reported and the LLM calls it makes are attached to its output"""
+        def run(state: GraphState) -> GraphState:
+            if (progress := _progress.get()) is not None:
+                progress(name)
+            first_output = len(state["steps_output"])
+            with TELEMETRY.collect() as calls:
+                state = step(state)
+            usage = TELEMETRY.summarize(calls)
+            for step_output in state["steps_output"][first_output:]:
+                step_output["llm_usage"] = usage
+            state["llm_calls"] = state["llm_calls"] + calls
+            return state
+        return run
+
+    def _create_workflow(self, entry_point: str = "decompose") -> Graph:
         """Create the workflow graph"""
         workflow = StateGraph(GraphState)
         
         # Add nodes
-        workflow.add_node("decompose", self._decompose_step)
-        workflow.add_node("generate", self._generate_step)
-        workflow.add_node("execute", self._execute_step)
-        workflow.add_node("analyze", self._analyze_step)
+        workflow.add_node("decompose", self._instrumented("decompose", self._decompose_step))
+        workflow.add_node("generate", self._instrumented("generate", self._generate_step))
+        workflow.add_node("execute", self._instrumented("execute", self._execute_step))
+        workflow.add_node("analyze", self._instrumented("analyze", self._analyze_step))
         
         # Add edges
         workflow.add_edge("decompose", "generate")
         workflow.add_edge("generate", "execute")
-        workflow.add_edge("execute", "analyze")
+        workflow.add_conditional_edges(
+            "execute",
+            self._route_after_execute,
+            {"generate": "generate", "analyze": "analyze", END: END}
+        )
         
         # Set entry and end points
-        workflow.set_entry_point("decompose")
+        workflow.set_entry_point(entry_point)
         workflow.set_finish_point("analyze")
         
         return workflow.compile()
 
-    def process_query(self, query: str) -> Dict:
-        """Process a natural language query following test workflow structure"""
+    def _follow_up(self, query: str, conversation_id: str, chat_history: List[Dict] = None) -> Optional[Tuple[str, List[Dict]]]:
+        """The resolved question and rewritten sub-queries when the query follows up the previous turn"""
+        turn = self.conversations.get(conversation_id)
+        if turn is None and chat_history:
+            turn = self.conversations.restore(conversation_id, chat_history)
+        if turn is None:
+            return None
+        details = self.follow_ups.rewrite(query, turn)
+        if details is None:
+            return None
+        return f"{turn.query} ({query.strip()})", details
+
+    def process_query(self, query: str, progress: Callable[[str], None] = None,
+                      conversation_id: str = None, chat_history: List[Dict] = None) -> Dict:
+        """
+        Process a natural language query following test workflow structure
+
+        Args:
+            query: Natural language question
+            progress: Optional callback receiving each workflow node's name before it runs
+            conversation_id: Chat the query belongs to; follow-ups to its previous turn are
+                answered by rewriting that turn's SQL
+            chat_history: Messages of the chat so far, used to restore the previous turn of a
+                chat this process has not answered yet
+        """
+        progress_token = _progress.set(progress)
         try:
             # Initialize state
             state = {
@@ -207,17 +417,48 @@ class QueryOrchestrator:
                 "query_results": [],
                 "final_analysis": {},
                 "error": "",
-                "steps_output": []
+                "steps_output": [],
+                "pending_indices": [],
+                "validated_results": {},
+                "retry_count": 0,
+                "started_at": time.time(),
+                "llm_calls": []
             }
+
+            workflow = self.workflow
+            follow_up = None
+            if conversation_id and Config.follow_up_rewrites:
+                follow_up = self._follow_up(query, conversation_id, chat_history)
+            if follow_up:
+                state["query"], details = follow_up
+                state["decomposed_queries"] = details
+                state["generated_sql"] = details
+                state["pending_indices"] = list(range(len(details)))
+                state["steps_output"].append({
+                    "step": "Follow-up Rewrite",
+                    "details": details,
+                    "status": "completed"
+                })
+                workflow = self.follow_up_workflow
             
             # Run the workflow
-            final_state = self.workflow.invoke(state)
+            final_state = workflow.invoke(state, {"recursion_limit": 10 + 2 * Config.max_sql_retries})
+
+            # Analysis is skipped when every branch failed
+            failed = self._failed_indices(final_state)
+            if failed and len(failed) == len(final_state["query_results"]) and not final_state["error"]:
+                final_state["error"] = "All sub-queries failed: " + "; ".join(
+                    final_state["query_results"][idx]["error"] for idx in failed
+                )
+            if conversation_id and not final_state["error"]:
+                self.conversations.remember(conversation_id, final_state["query"], final_state["query_results"])
             
             return {
                 "success": not bool(final_state["error"]),
                 "error": final_state["error"],
                 "steps": final_state["steps_output"],
-                "analysis": final_state.get("final_analysis", {})
+                "analysis": final_state.get("final_analysis", {}),
+                "llm_usage": TELEMETRY.summarize(final_state["llm_calls"])
             }
             
         except Exception as e:
@@ -225,4 +466,6 @@ class QueryOrchestrator:
                 "success": False,
                 "error": str(e),
                 "steps": state["steps_output"] if "state" in locals() else []
-            } 
\ No newline at end of file
+            }
+        finally:
+            _progress.reset(progress_token) 
\ No newline at end of file
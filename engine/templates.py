@@ -0,0 +1,204 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from config import Config
+from utils.intent import resolve_periods, detect_aggregation, detect_direction, detect_limit
+
+# Metrics that are ratios or averages, so they must be averaged rather than summed
+NON_ADDITIVE_METRICS = {'Occupancy %', 'Average Rate', 'RevPar', 'GOP Margin', 'NOI Margin'}
+
+# Intents no template expresses: averages, changes, ratios and plan comparisons go to the LLM
+UNSUPPORTED_INTENT = (
+    r'\b(average|avg|mean|median|yoy|year[- ]over[- ]year|change|changes|changed|growth|grew|grow|'
+    r'increase|decrease|margin|ratio|percent|percentage|budget|variance|forecast|vs\.? budget)\b|%'
+)
+
+# The thing a ranking question asks for: "which property", "what month"
+RANK_TARGET = r'\b(?:which|what)\s+([a-z&-]+(?:\s+[a-z&-]+)?)'
+
+@dataclass
+class TemplateMatch:
+    name: str
+    sql: str  # Parameterized with ? placeholders
+    params: List = field(default_factory=list)
+
+    def to_sql(self) -> str:
+        """Inline the parameters as SQLite literals so the SQL can be executed and displayed as text"""
+        parts = self.sql.split('?')
+        if len(parts) != len(self.params) + 1:
+            raise ValueError("Template placeholder count does not match its parameters")
+
+        sql = [parts[0]]
+        for param, part in zip(self.params, parts[1:]):
+            sql.append(_quote_literal(param))
+            sql.append(part)
+        return "".join(sql)
+
+def _quote_literal(value) -> str:
+    """Quote a value as a SQLite literal"""
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _alias_for(value: str) -> str:
+    """Turn a matched metric value into a readable column alias, e.g. 'Room Revenue' -> room_revenue"""
+    alias = re.sub(r'[^a-z0-9]+', '_', value.lower()).strip('_')
+    return alias or "total"
+
+class SQLTemplateEngine:
+    """
+    Deterministic SQL for the common question shapes: a metric for an entity and period,
+    comparisons, monthly trends, rankings and operator-level totals. Returns None whenever
+    the decomposition output is ambiguous so the caller can fall back to the LLM.
+    """
+
+    def __init__(self, min_score: int = Config.template_min_score):
+        self.min_score = min_score
+
+    def match(self, query_info: Dict, table_info) -> Optional[TemplateMatch]:
+        """
+        Match decomposed query info against the templates
+
+        Args:
+            query_info: Dict containing:
+                - sub_query: The natural language question
+                - table: The target table name
+                - extracted_entities: List of matched entities
+                - periods: Optional resolved month-start dates
+                - aggregation: Optional aggregation intent (total, compare, trend, rank)
+        """
+        measure_columns = table_info.columns_with_role("measure")
+        time_columns = table_info.columns_with_role("time")
+        if not measure_columns or not time_columns:
+            return None
+        measure, time_column = measure_columns[0], time_columns[0]
+
+        entities = query_info.get('extracted_entities', [])
+        if self._unsupported_intent(query_info['sub_query'], entities):
+            return None
+
+        filters = self._group_filters(entities, table_info)
+        if filters is None:
+            return None
+
+        # Exactly one metric value keeps the aggregation unambiguous
+        metric_filters = {col: values for col, values in filters.items()
+                          if table_info.columns[col].role == "metric"}
+        if len(metric_filters) != 1:
+            return None
+        metric_values = list(metric_filters.values())[0]
+        if len(metric_values) != 1:
+            return None
+        metric = metric_values[0]
+
+        periods = query_info.get('periods') or resolve_periods(query_info['sub_query'])
+        if not periods:
+            return None
+
+        aggregation = query_info.get('aggregation') or detect_aggregation(query_info['sub_query'])
+        entity_columns = table_info.columns_with_role("entity")
+        multi_valued = [col for col in entity_columns if len(filters.get(col, [])) > 1]
+
+        agg_fn = "AVG" if metric in NON_ADDITIVE_METRICS else "SUM"
+        select_expr = f"{agg_fn}({measure}) AS {_alias_for(metric)}"
+
+        where, params = [], []
+        for col, values in filters.items():
+            self._add_condition(where, params, col, values)
+        self._add_condition(where, params, time_column, periods)
+
+        if aggregation == "trend":
+            return self._build("trend", query_info['table'], multi_valued + [time_column],
+                               select_expr, where, params)
+
+        if aggregation == "rank":
+            # Rank by the most granular entity column that is not pinned to a single value
+            candidates = [col for col in entity_columns if len(filters.get(col, [])) != 1]
+            target = self._rank_target(query_info['sub_query'], table_info)
+            if target is not None:
+                # "which month" ranks by a non-entity column no template groups by
+                if target not in candidates:
+                    return None
+                candidates = [target]
+            if not candidates:
+                return None
+            direction = detect_direction(query_info['sub_query']).upper()
+            return self._build("rank", query_info['table'], [candidates[-1]], select_expr, where, params,
+                               order_by=f"{_alias_for(metric)} {direction}",
+                               limit=detect_limit(query_info['sub_query']))
+
+        if multi_valued:
+            return self._build("compare", query_info['table'], multi_valued, select_expr, where, params)
+
+        if aggregation == "compare":
+            # Comparing a single entity across several listed periods
+            if len(periods) > 1:
+                return self._build("compare", query_info['table'], [time_column], select_expr, where, params)
+            return None
+
+        filtered_entities = [col for col in entity_columns if col in filters]
+        if filtered_entities and entity_columns[-1] not in filters:
+            # e.g. "properties managed by Marriott": total at the operator level
+            return self._build("operator_total", query_info['table'], filtered_entities,
+                               select_expr, where, params)
+
+        return self._build("metric", query_info['table'], [], select_expr, where, params)
+
+    def _unsupported_intent(self, sub_query: str, entities: List[Dict]) -> bool:
+        """Whether the question asks for more than a sum, outside of the matched entity names"""
+        text = sub_query.lower()
+        for entity in entities:
+            for term in (entity.get('matched_value'), entity.get('search_term')):
+                if term:
+                    text = text.replace(str(term).lower(), ' ')
+        return re.search(UNSUPPORTED_INTENT, text) is not None
+
+    def _rank_target(self, sub_query: str, table_info) -> Optional[str]:
+        """
+        Column named by "which X" / "what X" in a ranking question: None when no X is named,
+        "" when X names no column (e.g. "which quarter"), which no template can rank by
+        """
+        match = re.search(RANK_TARGET, sub_query.lower())
+        if match is None:
+            return None
+        words = match.group(1).split()
+        if words[0] in ('is', 'was', 'are', 'were', 'has', 'had', 'did', 'does', 'do', 'the', 'a'):
+            # "what is the highest ...": no target named, rank by the entity columns
+            return None
+        # "which property had", "what operator" or a two-word alias such as "which line item"
+        return table_info.column_for(" ".join(words)) or table_info.column_for(words[0]) or ""
+
+    def _group_filters(self, entities: List[Dict], table_info) -> Optional[Dict[str, List[str]]]:
+        """Group matched entity values by column, or None if any match is too weak to trust"""
+        filters = {}
+        for entity in entities:
+            column_info = table_info.columns.get(entity.get('column'))
+            if not column_info or column_info.role not in ("entity", "metric"):
+                return None
+            if entity.get('score', 0) < self.min_score:
+                return None
+            values = filters.setdefault(entity['column'], [])
+            if entity['matched_value'] not in values:
+                values.append(entity['matched_value'])
+        return filters
+
+    def _add_condition(self, where: List[str], params: List, column: str, values: List):
+        """Add an equality or IN condition for the given values"""
+        if len(values) == 1:
+            where.append(f"{column} = ?")
+        else:
+            where.append(f"{column} IN ({', '.join('?' for _ in values)})")
+        params.extend(values)
+
+    def _build(self, name: str, table: str, group_by: List[str], select_expr: str,
+               where: List[str], params: List, order_by: str = None, limit: Optional[int] = None) -> TemplateMatch:
+        """Assemble the final parameterized statement; limit keeps the first rows, e.g. of a "top 3" ranking"""
+        lines = [f"SELECT {', '.join(group_by + [select_expr])}", f"FROM {table}"]
+        if where:
+            lines.append("WHERE " + "\n  AND ".join(where))
+        if group_by:
+            lines.append(f"GROUP BY {', '.join(group_by)}")
+            lines.append(f"ORDER BY {order_by or ', '.join(group_by)}")
+        if limit is not None:
+            lines.append(f"LIMIT {int(limit)}")
+        return TemplateMatch(name=name, sql="\n".join(lines), params=list(params))
@@ -1,20 +1,49 @@
 import sqlite3
 import os
-from anthropic import Anthropic
+import tempfile
 from dotenv import load_dotenv
 from config import Config
+from utils.llm import get_client
+from utils.telemetry import TELEMETRY
+
+# Stubbed LLM calls made by the tests stay out of the real trace
+TELEMETRY.trace_path = os.path.join(tempfile.mkdtemp(prefix="llm_trace_"), "llm_trace.jsonl")
 
 def get_test_db_connection():
     """Get test database connection"""
     return sqlite3.connect("final_working_database.db")
 
+def get_sample_db_connection():
+    """Get an in-memory database with a small slice of the income sheet, for tests that run offline"""
+    connection = sqlite3.connect(":memory:")
+    connection.execute(
+        "CREATE TABLE final_income_sheet_new_seq ("
+        "Operator TEXT, SQL_Property TEXT, SQL_Account_Name TEXT, SQL_Account_Category_Order TEXT, "
+        "Sub_Account_Category_Order TEXT, SQL_Account_Group_Name TEXT, Current_Actual_Month REAL, "
+        "YoY_Change REAL, Month TEXT)"
+    )
+    rows = [
+        ('Marriott', 'AC Wailea', 'Revenue', 'Room Revenue', 'Rooms', '-', 120000.0, 0.05, '2024-06-01'),
+        ('Marriott', 'AC Wailea', 'Revenue', 'Room Revenue', 'Rooms', '-', 125000.0, 0.04, '2024-07-01'),
+        ('Marriott', 'AC Wailea', 'Revenue', 'F&B Revenue', 'Food & Beverage', '-', 30000.0, 0.02, '2024-06-01'),
+        ('Marriott', 'Residence Inn Westshore Tampa', 'Revenue', 'Room Revenue', 'Rooms', '-', 90000.0, -0.01, '2024-06-01'),
+        ('Marriott', 'Residence Inn Westshore Tampa', 'Revenue', 'Room Revenue', 'Rooms', '-', 95000.0, 0.03, '2024-07-01'),
+        ('HHM', 'Hilton Garden Inn Bethesda', 'Revenue', 'Room Revenue', 'Rooms', '-', 80000.0, 0.01, '2024-06-01'),
+        ('HHM', 'Hilton Garden Inn Bethesda', 'Operational Data', 'Occupancy %', '-', '-', 0.81, 0.02, '2024-06-01'),
+        ('HHM', 'Hilton Garden Inn Bethesda', 'Operational Data', 'Occupancy %', '-', '-', 0.85, 0.03, '2024-07-01'),
+    ]
+    connection.executemany(
+        "INSERT INTO final_income_sheet_new_seq VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+    )
+    return connection
+
 def get_test_llm(model_type: str = "haiku", api_key: str = None):
     """Get test LLM client with appropriate model"""
     if not api_key:
         raise ValueError("API key is required")
     
-    # Create base client
-    client = Anthropic(api_key=api_key)
+    # Shared client, so the test scripts reuse one connection pool
+    client = get_client(api_key)
     
     # Create a wrapper function that mimics the behavior we want
     def wrapped_client(prompt: str):
@@ -31,7 +60,7 @@ def get_test_llm(model_type: str = "haiku", api_key: str = None):
     
     # Add invoke method to match object-style interface
     wrapped_client.api_key = api_key
-    wrapped_client.invoke = lambda prompt: type('Response', (), {'content': wrapped_client(prompt)})()
+    wrapped_client.invoke = lambda prompt, **kwargs: type('Response', (), {'content': wrapped_client(prompt)})()
     
     return wrapped_client
 
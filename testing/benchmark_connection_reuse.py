@@ -0,0 +1,96 @@
+"""
+Benchmark of Anthropic client connection reuse against a local mock of the Messages API.
+
+Compares a new client per component/rerun (what the app did before the shared registry)
+with the process-wide client from utils.llm.get_client, counting the TCP connections the
+server accepts and the latency per call.
+
+Run: python testing/benchmark_connection_reuse.py [calls]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from anthropic import Anthropic
+from config import Config
+from utils.llm import get_client
+
+MESSAGE = {
+    "id": "msg_benchmark", "type": "message", "role": "assistant", "model": Config.haiku_model,
+    "content": [{"type": "text", "text": "final_income_sheet_new_seq"}],
+    "stop_reason": "end_turn", "stop_sequence": None,
+    "usage": {"input_tokens": 10, "output_tokens": 5},
+}
+
+class MockMessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive
+
+    def setup(self):
+        super().setup()
+        # Headers and body are separate writes; without this, delayed ACKs stall keep-alive requests
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(MESSAGE).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_mock_server() -> ThreadingHTTPServer:
+    """Start the mock Messages API on a free local port"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockMessagesHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _call(client: Anthropic):
+    client.messages.create(model=Config.haiku_model, max_tokens=10,
+                           messages=[{"role": "user", "content": "Which table?"}])
+
+def run_benchmark(calls: int = 50) -> Dict[str, Dict]:
+    """Make the same number of calls with a fresh client each time and with the shared client"""
+    server = start_mock_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    results = {}
+    try:
+        for name in ("client_per_call", "shared_client"):
+            server.connections = 0
+            started_at = time.perf_counter()
+            for _ in range(calls):
+                if name == "client_per_call":
+                    client = Anthropic(api_key="benchmark", base_url=base_url)
+                    _call(client)
+                    client.close()
+                else:
+                    _call(get_client("benchmark", base_url=base_url))
+            elapsed = time.perf_counter() - started_at
+            results[name] = {
+                "calls": calls,
+                "connections": server.connections,
+                "ms_per_call": 1000 * elapsed / calls,
+            }
+    finally:
+        server.shutdown()
+    return results
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    for name, result in run_benchmark(calls).items():
+        print(f"{name}: {result['connections']} connections for {result['calls']} calls, "
+              f"{result['ms_per_call']:.2f} ms per call")
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from engine.generator import SQLGenerator
+from engine.cache import SQLCache
+
+TABLE = "final_income_sheet_new_seq"
+
+def query_info(sub_query, property_name, score=80):
+    return {
+        'sub_query': sub_query,
+        'table': TABLE,
+        'extracted_entities': [
+            {'search_term': property_name.lower(), 'column': 'SQL_Property',
+             'matched_value': property_name, 'score': score},
+            {'search_term': 'room revenue', 'column': 'SQL_Account_Category_Order',
+             'matched_value': 'Room Revenue', 'score': score},
+        ]
+    }
+
+class RecordingLLM:
+    def __init__(self, response):
+        self.response = response
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        return self.response(prompt) if callable(self.response) else self.response
+
+class TestBatchGeneration(unittest.TestCase):
+
+    def make_generator(self, llm):
+        return SQLGenerator(llm, sql_cache=SQLCache(tempfile.mkdtemp()))
+
+    def test_single_call_for_all_sub_queries(self):
+        sql = [
+            "SELECT SUM(Current_Actual_Month) FROM final_income_sheet_new_seq WHERE SQL_Property = 'AC Wailea'",
+            "SELECT SUM(Current_Actual_Month) FROM final_income_sheet_new_seq WHERE SQL_Property = 'Surfrider Malibu'",
+        ]
+        llm = RecordingLLM("```json\n" + json.dumps(sql) + "\n```")
+        generator = self.make_generator(llm)
+
+        outputs = generator.generate_sql_batch([
+            query_info("What is the Room Revenue for AC Wailea?", 'AC Wailea'),
+            query_info("What is the Room Revenue for Surfrider Malibu?", 'Surfrider Malibu'),
+        ])
+
+        self.assertEqual(outputs, [(sql[0], "llm:batch"), (sql[1], "llm:batch")])
+        self.assertEqual(len(llm.prompts), 1)
+        # The column schema is sent once, not once per sub-query
+        self.assertEqual(llm.prompts[0].count("- Current_Actual_Month:"), 1)
+        self.assertEqual(generator.stats["llm_requests"], 1)
+
+    def test_template_hits_are_not_sent_to_llm(self):
+        llm = RecordingLLM("SELECT 1")
+        generator = self.make_generator(llm)
+
+        outputs = generator.generate_sql_batch([
+            query_info("What is the Room Revenue for AC Wailea in June 2024?", 'AC Wailea', score=100),
+            query_info("What is the Room Revenue for Surfrider Malibu?", 'Surfrider Malibu'),
+        ])
+
+        self.assertEqual(outputs[0][1], "template:metric")
+        self.assertEqual(outputs[1], ("SELECT 1", "llm"))
+        self.assertNotIn("AC Wailea", llm.prompts[0])
+
+    def test_malformed_batch_falls_back_to_individual_prompts(self):
+        def respond(prompt):
+            return "not json" if "JSON Array" in prompt else "SELECT 2"
+        llm = RecordingLLM(respond)
+        generator = self.make_generator(llm)
+
+        outputs = generator.generate_sql_batch([
+            query_info("What is the Room Revenue for AC Wailea?", 'AC Wailea'),
+            query_info("What is the Room Revenue for Surfrider Malibu?", 'Surfrider Malibu'),
+        ])
+
+        self.assertEqual(outputs, [("SELECT 2", "llm"), ("SELECT 2", "llm")])
+        self.assertEqual(len(llm.prompts), 3)
+
+if __name__ == "__main__":
+    unittest.main()
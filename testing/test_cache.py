@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from engine.cache import SQLCache
+from engine.generator import SQLGenerator
+from engine.metadata import FinancialTableMetadata
+
+TABLE = "final_income_sheet_new_seq"
+SQL = "SELECT SUM(Current_Actual_Month) FROM final_income_sheet_new_seq WHERE SQL_Property = 'AC Wailea'"
+
+def query_info(sub_query, entities):
+    return {
+        'sub_query': sub_query,
+        'table': TABLE,
+        'extracted_entities': [
+            {'search_term': term, 'column': column, 'matched_value': value, 'score': 80}
+            for term, column, value in entities
+        ]
+    }
+
+class TestSQLCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.metadata = FinancialTableMetadata()
+        self.table_info = self.metadata.get_table_info(TABLE)
+
+    def test_reworded_question_hits_cache(self):
+        cache = SQLCache(self.cache_dir)
+        cache.put(query_info("room revenue AC Wailea June 2024", [
+            ('ac wailea', 'SQL_Property', 'AC Wailea'),
+            ('room revenue', 'SQL_Account_Category_Order', 'Room Revenue'),
+        ]), self.table_info, SQL)
+
+        reworded = query_info("how much did AC Wailea make on rooms in June 2024", [
+            ('rooms', 'SQL_Account_Category_Order', 'Room Revenue'),
+            ('AC Wailea', 'SQL_Property', 'AC Wailea'),
+        ])
+        self.assertEqual(cache.get(reworded, self.table_info), SQL)
+        # Entries survive a restart
+        self.assertEqual(SQLCache(self.cache_dir).get(reworded, self.table_info), SQL)
+
+    def test_different_period_misses(self):
+        cache = SQLCache(self.cache_dir)
+        info = query_info("room revenue AC Wailea June 2024", [('ac wailea', 'SQL_Property', 'AC Wailea')])
+        cache.put(info, self.table_info, SQL)
+        other = query_info("room revenue AC Wailea July 2024", [('ac wailea', 'SQL_Property', 'AC Wailea')])
+        self.assertIsNone(cache.get(other, self.table_info))
+
+    def test_opposite_or_limited_rankings_miss(self):
+        entities = [('room revenue', 'SQL_Account_Category_Order', 'Room Revenue')]
+        signatures = {
+            SQLCache.signature(query_info(question, entities))
+            for question in ("Which property had the highest room revenue in June 2024",
+                             "Which property had the lowest room revenue in June 2024",
+                             "Top 3 properties by room revenue in June 2024",
+                             "Total room revenue in June 2024",
+                             "Average room revenue in June 2024")
+        }
+        self.assertEqual(len(signatures), 5)
+        self.assertEqual(
+            SQLCache.signature(query_info("Which property had the lowest room revenue in June 2024", entities)),
+            SQLCache.signature(query_info("Property with the least room revenue, June 2024", entities))
+        )
+
+    def test_metadata_change_invalidates(self):
+        cache = SQLCache(self.cache_dir)
+        info = query_info("room revenue AC Wailea June 2024", [('ac wailea', 'SQL_Property', 'AC Wailea')])
+        cache.put(info, self.table_info, SQL)
+
+        self.table_info.columns['SQL_Property'].distinct_values.append('New Property')
+        self.assertIsNone(cache.get(info, self.table_info))
+        self.assertEqual(cache.entries, {})
+
+    def test_generator_skips_llm_on_hit(self):
+        calls = []
+        def llm(prompt):
+            calls.append(prompt)
+            return SQL
+
+        generator = SQLGenerator(llm, use_templates=False, sql_cache=SQLCache(self.cache_dir))
+        info = query_info("room revenue AC Wailea June 2024", [('ac wailea', 'SQL_Property', 'AC Wailea')])
+        self.assertEqual(generator.generate_sql_with_source(info), (SQL, "llm"))
+        generator.remember_sql(info, SQL)
+        self.assertEqual(generator.generate_sql_with_source(info), (SQL, "cache"))
+        self.assertEqual(len(calls), 1)
+
+if __name__ == "__main__":
+    unittest.main()
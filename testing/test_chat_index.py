@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from ui.manager import ChatManager, INDEX_FILENAME
+
+def chat(question):
+    return [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": f"Answer to {question}"},
+    ]
+
+class TestChatIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.chats_dir = tempfile.mkdtemp()
+        manager = ChatManager(self.chats_dir)
+        for idx in range(3):
+            manager.save_chat(f"chat{idx}", chat(f"Question {idx}"))
+
+    def read_calls(self, manager, method="list_chats"):
+        """Call a listing method and return the chats it had to read in full"""
+        with mock.patch.object(ChatManager, "_read_chat", autospec=True, side_effect=ChatManager._read_chat) as read:
+            getattr(manager, method)()
+        return sorted(os.path.basename(call.args[1]) for call in read.call_args_list)
+
+    def test_save_maintains_index(self):
+        with open(os.path.join(self.chats_dir, INDEX_FILENAME), encoding='utf-8') as f:
+            index = json.load(f)["chats"]
+        self.assertEqual(sorted(index), ["chat0", "chat1", "chat2"])
+        self.assertEqual(index["chat1"]["title"], "Question 1")
+
+        # A fresh manager lists every chat without opening any of them
+        manager = ChatManager(self.chats_dir)
+        self.assertEqual(self.read_calls(manager), [])
+        self.assertEqual([entry["title"] for entry in manager.list_chats()],
+                         ["Question 2", "Question 1", "Question 0"])
+        self.assertEqual(manager.count_chats(), 3)
+
+        # Appending a turn updates the title's timestamp in place
+        manager.save_chat("chat0", chat("Question 0") + chat("Follow-up"))
+        self.assertEqual(self.read_calls(manager), [])
+        self.assertEqual(manager.list_chats(limit=1)[0]["chat_id"], "chat0")
+
+    def test_changed_files_are_reindexed_incrementally(self):
+        other = ChatManager(self.chats_dir)
+        other.list_chats()
+
+        # Behind the index, one chat is added, one rewritten and one deleted
+        for chat_id, title in (("chat3", "Question 3"), ("chat1", "Renamed")):
+            with open(os.path.join(self.chats_dir, f"{chat_id}.json"), 'w', encoding='utf-8') as f:
+                json.dump({"chat_id": chat_id, "timestamp": "2030-01-01T00:00:00",
+                           "messages": chat(title), "title": title}, f)
+        os.utime(os.path.join(self.chats_dir, "chat1.json"), ns=(1, 1))
+        os.remove(os.path.join(self.chats_dir, "chat2.json"))
+
+        self.assertEqual(self.read_calls(other), ["chat1.json", "chat3.json"])
+        self.assertEqual({entry["chat_id"]: entry["title"] for entry in other.list_chats()},
+                         {"chat0": "Question 0", "chat1": "Renamed", "chat3": "Question 3"})
+        self.assertEqual(self.read_calls(other), [])
+
+    def test_missing_or_corrupt_index_is_rebuilt(self):
+        with open(os.path.join(self.chats_dir, INDEX_FILENAME), 'w', encoding='utf-8') as f:
+            f.write("{not json")
+        manager = ChatManager(self.chats_dir)
+        self.assertEqual(len(self.read_calls(manager, "count_chats")), 3)
+        self.assertEqual(ChatManager(self.chats_dir).count_chats(), 3)
+
+        self.assertTrue(manager.delete_chat("chat0"))
+        self.assertEqual(self.read_calls(ChatManager(self.chats_dir)), [])
+        self.assertEqual(ChatManager(self.chats_dir).count_chats(), 2)
+
+if __name__ == "__main__":
+    unittest.main()
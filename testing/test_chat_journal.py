@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import Config
+from ui.manager import ChatManager, SQLiteChatManager, INDEX_FILENAME, _writer
+
+def turn(idx):
+    return [
+        {"role": "user", "content": f"Question {idx}"},
+        {"role": "assistant", "content": f"Answer {idx}"},
+    ]
+
+class TestChatJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.chats_dir = tempfile.mkdtemp()
+        self.manager = ChatManager(self.chats_dir, compact_every=4)
+        self.snapshot = os.path.join(self.chats_dir, "chat.json")
+        self.journal = os.path.join(self.chats_dir, "chat.journal")
+
+    def read_snapshot(self):
+        with open(self.snapshot, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_turns_are_appended_then_compacted(self):
+        messages = turn(0)
+        self.manager.save_chat("chat", messages)
+        self.assertFalse(os.path.exists(self.journal))
+
+        messages += turn(1)
+        self.manager.save_chat("chat", messages)
+        self.assertEqual(len(self.read_snapshot()["messages"]), 2)
+        with open(self.journal, 'r', encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)["seq"] for line in f], [2, 3])
+        self.assertEqual(self.manager.load_chat("chat")["messages"], messages)
+
+        messages += turn(2) + turn(3)
+        self.manager.save_chat("chat", messages)
+        self.assertFalse(os.path.exists(self.journal))
+        self.assertEqual(len(self.read_snapshot()["messages"]), 8)
+        self.assertEqual(self.manager.load_chat("chat")["messages"], messages)
+
+    def test_replay_ignores_torn_lines_and_compacted_entries(self):
+        messages = turn(0) + turn(1)
+        self.manager.save_chat("chat", turn(0))
+        self.manager.save_chat("chat", messages)
+        with open(self.journal, 'r', encoding='utf-8') as f:
+            journal = f.read()
+        self.manager.compact("chat")
+
+        # A crash between replacing the snapshot and removing the journal, then a torn append
+        with open(self.journal, 'w', encoding='utf-8') as f:
+            f.write(journal + '{"seq": 4, "timest')
+        fresh = ChatManager(self.chats_dir)
+        self.assertEqual(fresh.load_chat("chat")["messages"], messages)
+        self.assertEqual(list(fresh.load_chats()), ["chat"])
+
+    def test_diverged_sessions_keep_both_turns(self):
+        self.manager.save_chat("chat", turn(0))
+        # Two sessions opened the chat and each asked a different question
+        first, second = turn(0) + turn(1), turn(0) + turn(2)
+        self.manager.save_chat("chat", first)
+        self.manager.save_chat("chat", second)
+        self.assertEqual(self.manager.load_chat("chat")["messages"], turn(0) + turn(1) + turn(2))
+
+        # Saving the second session again only adds its newer turn, and a stale copy changes nothing
+        self.manager.save_chat("chat", second + turn(3))
+        self.manager.save_chat("chat", first)
+        self.assertEqual(self.manager.load_chat("chat")["messages"], turn(0) + turn(1) + turn(2) + turn(3))
+
+    def test_changes_by_another_process_are_seen(self):
+        self.manager.save_chat("chat", turn(0))
+        ChatManager(self.chats_dir).save_chat("chat", turn(0) + turn(1))
+        self.manager.save_chat("chat", turn(0) + turn(2))
+        self.assertEqual(ChatManager(self.chats_dir).load_chat("chat")["messages"],
+                         turn(0) + turn(1) + turn(2))
+
+    def test_background_writes_are_visible_to_reads(self):
+        with mock.patch.object(Config, "chat_background_writes", True):
+            self.manager.save_chat_async("chat", turn(0))
+            self.assertEqual(self.manager.list_chats()[0]["title"], "Question 0")
+        self.assertTrue(self.manager.delete_chat("chat"))
+        self.assertEqual(os.listdir(self.chats_dir), [INDEX_FILENAME])
+
+    def check_listing_does_not_wait_for_writer(self, manager):
+        manager.save_chat("old", turn(0))
+        release = threading.Event()
+        with mock.patch.object(Config, "chat_background_writes", True):
+            _writer.submit(release.wait)
+            manager.save_chat_async("new", turn(1))
+            manager.append_messages_async("old", turn(2))
+            # Served while the writer is still blocked
+            self.assertEqual([chat["title"] for chat in manager.list_chats()], ["Question 0", "Question 1"])
+            self.assertEqual(manager.count_chats(), 2)
+            self.assertEqual(manager.list_chats(limit=1, offset=1)[0]["chat_id"], "new")
+            release.set()
+            self.assertEqual(manager.load_chat("old")["messages"], turn(0) + turn(2))
+        self.assertEqual(manager.count_chats(), 2)
+        self.assertEqual(manager._pending, {})
+
+    def test_listing_does_not_wait_for_writer(self):
+        self.check_listing_does_not_wait_for_writer(self.manager)
+
+    def test_sqlite_listing_does_not_wait_for_writer(self):
+        manager = SQLiteChatManager(os.path.join(self.chats_dir, "chats.db"), chats_dir=None)
+        self.check_listing_does_not_wait_for_writer(manager)
+        manager.conn.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from ui.manager import ChatManager, SQLiteChatManager
+
+ANSWER = repr({
+    "sub_queries": [{
+        "sub_query": "What is the EBITDA for Courtyard Dupont Circle in May 2024?",
+        "table": "final_income_sheet_new_seq",
+        "entities": [{"search_term": "Courtyard", "column": "SQL_Property",
+                      "matched_value": "Courtyard Washington DC Dupont Circle", "score": 90}],
+        "sql_query": "SELECT SUM(Current_Actual_Month) FROM final_income_sheet_new_seq WHERE SQL_Property = 'x'",
+    }],
+    "analysis": {"summary": "Margins improved against budget"},
+})
+
+def write_json_chat(chats_dir, chat_id, question, timestamp):
+    chat = {
+        "chat_id": chat_id,
+        "timestamp": timestamp,
+        "messages": [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": "{'sub_queries': []}"},
+        ],
+        "title": question,
+    }
+    with open(os.path.join(chats_dir, f"{chat_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump(chat, f)
+
+class TestSQLiteChatManager(unittest.TestCase):
+
+    def setUp(self):
+        self.chats_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(tempfile.mkdtemp(), "chats.db")
+
+    def test_migrates_json_chats_once(self):
+        write_json_chat(self.chats_dir, "old", "Revenue in May 2024?", "2025-01-19T20:34:24")
+        manager = SQLiteChatManager(self.db_path, self.chats_dir)
+        self.assertEqual(manager.count_chats(), 1)
+        chat = manager.load_chat("old")
+        self.assertEqual(chat["title"], "Revenue in May 2024?")
+        self.assertEqual(chat["messages"][1], {"role": "assistant", "content": ""})
+
+        self.assertEqual(SQLiteChatManager(self.db_path, self.chats_dir).migrate_json_chats(self.chats_dir), 0)
+
+    def test_deleting_migrated_chat_removes_its_journal(self):
+        ChatManager(self.chats_dir, compact_every=10).save_chat("old", [
+            {"role": "user", "content": "Revenue in May 2024?"}, {"role": "assistant", "content": "Answer"}
+        ])
+        ChatManager(self.chats_dir, compact_every=10).save_chat("old", [
+            {"role": "user", "content": "Revenue in May 2024?"}, {"role": "assistant", "content": "Answer"},
+            {"role": "user", "content": "And in June?"}
+        ])
+        manager = SQLiteChatManager(self.db_path, self.chats_dir)
+        self.assertEqual(len(manager.load_chat("old")["messages"]), 3)
+
+        self.assertTrue(manager.delete_chat("old"))
+        self.assertFalse(any(name.startswith("old.") for name in os.listdir(self.chats_dir)))
+        self.assertEqual(SQLiteChatManager(self.db_path, self.chats_dir).count_chats(), 0)
+
+    def test_paginated_titles_newest_first(self):
+        for idx in range(5):
+            write_json_chat(self.chats_dir, f"chat{idx}", f"Question {idx}", f"2025-01-0{idx + 1}T10:00:00")
+        manager = SQLiteChatManager(self.db_path, self.chats_dir)
+        first = manager.list_chats(limit=2)
+        self.assertEqual([chat["chat_id"] for chat in first], ["chat4", "chat3"])
+        self.assertNotIn("messages", first[0])
+        self.assertEqual([chat["chat_id"] for chat in manager.list_chats(limit=2, offset=4)], ["chat0"])
+
+    def test_save_appends_and_delete_cascades(self):
+        manager = SQLiteChatManager(self.db_path, self.chats_dir)
+        messages = [{"role": "user", "content": "Total revenue?"}]
+        manager.save_chat("new", messages)
+        messages.append({"role": "assistant", "content": {"summary": "42"}})
+        manager.save_chat("new", messages)
+        self.assertEqual(manager.load_chat("new")["messages"], messages)
+
+        self.assertTrue(manager.delete_chat("new"))
+        self.assertIsNone(manager.load_chat("new"))
+        self.assertEqual(manager.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0], 0)
+
+    def test_appended_messages_follow_the_stored_chat(self):
+        manager = SQLiteChatManager(self.db_path, self.chats_dir)
+        manager.append_messages("new", [{"role": "user", "content": "Total revenue?"}])
+        manager.append_messages("new", [{"role": "user", "content": "And EBITDA?"}])
+        manager.append_messages("new", [{"role": "assistant", "content": "42"}])
+        chat = manager.load_chat("new")
+        self.assertEqual(chat["title"], "Total revenue?")
+        self.assertEqual([message["content"] for message in chat["messages"]], ["Total revenue?", "And EBITDA?", "42"])
+        self.assertEqual(manager.search_chats("EBITDA")[0]["seq"], 1)
+
+    def test_full_text_search(self):
+        manager = SQLiteChatManager(self.db_path, self.chats_dir)
+        manager.save_chat("ebitda", [{"role": "user", "content": "EBITDA comparison"},
+                                     {"role": "assistant", "content": ANSWER}])
+        manager.save_chat("revenue", [{"role": "user", "content": "Room revenue by property"}])
+
+        self.assertEqual([hit["chat_id"] for hit in manager.search_chats("ebitda")], ["ebitda", "ebitda"])
+        self.assertEqual(manager.search_chats("dupont circle margins")[0]["seq"], 1)
+        self.assertEqual(manager.search_chats("current_actual")[0]["chat_id"], "ebitda")
+        self.assertEqual(manager.search_chats("reven")[0]["chat_id"], "revenue")
+        self.assertEqual(manager.search_chats('"); DROP'), [])
+
+        manager.delete_chat("ebitda")
+        self.assertEqual(manager.search_chats("ebitda"), [])
+
+    def test_existing_database_is_indexed(self):
+        SQLiteChatManager(self.db_path, self.chats_dir).save_chat(
+            "chat", [{"role": "user", "content": "Occupancy in July"}])
+        manager = SQLiteChatManager(self.db_path, self.chats_dir)
+        manager.conn.execute("DROP TABLE message_search")
+        manager._create_tables()
+        self.assertEqual(len(manager.search_chats("occupancy")), 1)
+
+    def test_json_manager_search(self):
+        manager = ChatManager(self.chats_dir)
+        manager.save_chat("ebitda", [{"role": "user", "content": "EBITDA comparison"},
+                                     {"role": "assistant", "content": ANSWER}])
+        self.assertEqual([hit["seq"] for hit in manager.search_chats("dupont margins")], [1])
+
+if __name__ == "__main__":
+    unittest.main()
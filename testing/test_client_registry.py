@@ -0,0 +1,35 @@
+import os
+import sys
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import Config
+from engine.decomposer import QueryDecomposer
+from utils.llm import get_client
+from testing.benchmark_connection_reuse import run_benchmark
+
+class KeyOnly:
+    api_key = "registry-test"
+
+class TestClientRegistry(unittest.TestCase):
+
+    def test_one_client_per_key(self):
+        client = get_client("registry-test")
+        self.assertIs(get_client("registry-test"), client)
+        self.assertIsNot(get_client("registry-other"), client)
+        self.assertIs(QueryDecomposer(KeyOnly()).llm, client)
+
+    def test_pool_limits(self):
+        pool = get_client("registry-test")._client._transport._pool
+        self.assertEqual(pool._max_connections, Config.http_max_connections)
+        self.assertEqual(pool._max_keepalive_connections, Config.http_max_keepalive_connections)
+
+    def test_shared_client_reuses_connection(self):
+        results = run_benchmark(calls=5)
+        self.assertEqual(results["client_per_call"]["connections"], 5)
+        self.assertEqual(results["shared_client"]["connections"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from engine.examples import ExampleStore, question_pattern
+from engine.generator import SQLGenerator
+from engine.cache import SQLCache
+from engine.metadata import FinancialTableMetadata
+from ui.manager import ChatManager
+
+TABLE = "final_income_sheet_new_seq"
+STORED_SQL = (
+    "SELECT SUM(Current_Actual_Month) AS room_expense\n"
+    "FROM final_income_sheet_new_seq\n"
+    "WHERE SQL_Property = 'Surfrider Malibu'\n"
+    "  AND SQL_Account_Category_Order = 'Room Expense'\n"
+    "  AND Month BETWEEN '2023-11-01' AND '2023-11-30'"
+)
+
+def entity(term, column, value):
+    return {'search_term': term, 'column': column, 'matched_value': value, 'score': 100}
+
+STORED_ENTITIES = [entity('room expense', 'SQL_Account_Category_Order', 'Room Expense'),
+                   entity('surfrider malibu', 'SQL_Property', 'Surfrider Malibu')]
+
+def write_chat(chats_dir, sub_queries):
+    content = {'sub_queries': sub_queries, 'success': True}
+    chat = {'chat_id': '20250101_000000', 'title': 'test', 'messages': [
+        {'role': 'user', 'content': 'question'},
+        {'role': 'assistant', 'content': str(content)},
+    ]}
+    with open(os.path.join(chats_dir, '20250101_000000.json'), 'w') as f:
+        json.dump(chat, f)
+
+class TestExampleStore(unittest.TestCase):
+
+    def setUp(self):
+        self.chats_dir = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.table_info = FinancialTableMetadata().get_table_info(TABLE)
+        write_chat(self.chats_dir, [
+            {'sub_query': 'what is the room expense of surfrider malibu for the month of november 2023?',
+             'table': TABLE, 'entities': STORED_ENTITIES, 'sql_query': STORED_SQL + ';',
+             'execution_results': {'success': True, 'error': None, 'data': [{'room_expense': 52474.0}]}},
+            {'sub_query': 'what is the revenue of the resort?', 'table': TABLE, 'entities': [],
+             'sql_query': 'SELECT 1', 'execution_results': {'success': False, 'error': 'x', 'data': []}},
+        ])
+        self.store = ExampleStore(chats_dir=self.chats_dir, cache_dir=self.cache_dir)
+
+    def test_harvests_only_successful_sub_queries(self):
+        self.assertEqual(len(self.store.examples), 1)
+        self.assertEqual(self.store.examples[0].periods, ['2023-11-01'])
+
+    def test_null_only_results_are_not_harvested(self):
+        chats_dir = tempfile.mkdtemp()
+        write_chat(chats_dir, [
+            {'sub_query': 'what is the revenue of ac waliea in may 2024?', 'table': TABLE, 'entities': [],
+             'sql_query': f"SELECT SUM(Current_Actual_Month) AS revenue FROM {TABLE} WHERE SQL_Property = 'ac waliea'",
+             'execution_results': {'success': True, 'error': None, 'data': [{'revenue': None}]}},
+        ])
+        store = ExampleStore(chats_dir=chats_dir, cache_dir=tempfile.mkdtemp())
+        self.assertEqual(store.examples, [])
+
+        # The same answer saved as a typed record
+        typed_dir = tempfile.mkdtemp()
+        ChatManager(typed_dir).save_chat("chat", [
+            {'role': 'user', 'content': 'what is the revenue of ac waliea in may 2024?'},
+            {'role': 'assistant', 'content': 'No data', 'sub_queries': [{
+                'sub_query': 'what is the revenue of ac waliea in may 2024?', 'table': TABLE, 'entities': [],
+                'sql_query': f"SELECT SUM(Current_Actual_Month) AS revenue FROM {TABLE} WHERE SQL_Property = 'ac waliea'",
+                'execution_results': {'success': True, 'error': None, 'data': [{'revenue': None}]}}]},
+        ])
+        self.assertEqual(ExampleStore(chats_dir=typed_dir, cache_dir=tempfile.mkdtemp()).examples, [])
+
+    def test_pattern_masks_entities_and_periods(self):
+        self.assertEqual(
+            question_pattern("What is the Room Expense of Surfrider Malibu in Nov 2023?", STORED_ENTITIES),
+            "what is the <sql_account_category_order> of <sql_property> in <period>"
+        )
+
+    def test_search_ranks_similar_questions(self):
+        self.store.add("How many rooms were sold at AC Wailea?", "SELECT 2", TABLE,
+                       [entity('ac wailea', 'SQL_Property', 'AC Wailea')])
+        results = self.store.search("what was the room expenses of AC Wailea for december 2023",
+                                    TABLE, [entity('ac wailea', 'SQL_Property', 'AC Wailea')])
+        self.assertEqual(results[0].sql_query, STORED_SQL + ';')
+        self.assertEqual(self.store.search("room expense", "other_table"), [])
+
+    def test_reuse_substitutes_entity_and_month(self):
+        sql = self.store.reuse(
+            "What is the room expense of AC Wailea for the month of February 2024?", TABLE,
+            [entity('room expense', 'SQL_Account_Category_Order', 'Room Expense'),
+             entity('ac wailea', 'SQL_Property', 'AC Wailea')],
+            self.table_info
+        )
+        self.assertIn("SQL_Property = 'AC Wailea'", sql)
+        self.assertIn("BETWEEN '2024-02-01' AND '2024-02-29'", sql)
+
+    def test_reuse_refuses_unsafe_substitutions(self):
+        # A different metric changes the aggregate, so it is never swapped
+        self.assertIsNone(self.store.reuse(
+            "what is the occupancy % of surfrider malibu for the month of november 2023?", TABLE,
+            [entity('occupancy %', 'SQL_Account_Category_Order', 'Occupancy %'),
+             entity('surfrider malibu', 'SQL_Property', 'Surfrider Malibu')],
+            self.table_info
+        ))
+        # Different wording
+        self.assertIsNone(self.store.reuse(
+            "show the room expense trend of surfrider malibu since november 2023", TABLE, STORED_ENTITIES,
+            self.table_info
+        ))
+
+    def test_executions_are_persisted(self):
+        self.store.add("Total revenue for AC Wailea", "SELECT 3", TABLE,
+                       [entity('ac wailea', 'SQL_Property', 'AC Wailea')])
+        reloaded = ExampleStore(chats_dir=tempfile.mkdtemp(), cache_dir=self.cache_dir)
+        self.assertEqual([example.sql_query for example in reloaded.examples], ["SELECT 3"])
+
+    def test_generator_uses_examples(self):
+        prompts = []
+
+        def llm(prompt):
+            prompts.append(prompt)
+            return "SELECT SUM(Current_Actual_Month) FROM final_income_sheet_new_seq"
+
+        generator = SQLGenerator(llm, use_templates=False, sql_cache=SQLCache(tempfile.mkdtemp()),
+                                 examples=self.store)
+        _, source = generator.generate_sql_with_source({
+            'sub_query': "what is the room expense of AC Wailea for the month of march 2024?", 'table': TABLE,
+            'extracted_entities': [entity('room expense', 'SQL_Account_Category_Order', 'Room Expense'),
+                                   entity('ac wailea', 'SQL_Property', 'AC Wailea')]
+        })
+        self.assertEqual(source, "example")
+        self.assertEqual(prompts, [])
+
+        generator.generate_sql_with_source({
+            'sub_query': "Total room expense of AC Wailea in 2023", 'table': TABLE,
+            'extracted_entities': [entity('room expense', 'SQL_Account_Category_Order', 'Room Expense'),
+                                   entity('ac wailea', 'SQL_Property', 'AC Wailea')]
+        })
+        self.assertIn("Examples of validated SQL for similar questions", prompts[0])
+        self.assertIn("Surfrider Malibu", prompts[0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import csv
+import io
+import unittest
+import pyarrow.parquet as pq
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+from ui.export import EXPORT_FORMATS, iter_csv, export_result
+
+ROWS = [{"SQL_Property": f"Property {idx}", "Month": "2024-05", "revenue": idx * 1.5} for idx in range(25)]
+
+class TestExport(unittest.TestCase):
+
+    def test_csv_is_encoded_in_chunks(self):
+        chunks = list(iter_csv(ROWS, chunk_rows=10))
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[0].startswith(b"SQL_Property,Month,revenue\r\n"))
+        self.assertFalse(chunks[1].startswith(b"SQL_Property"))
+
+        parsed = list(csv.DictReader(io.StringIO(b"".join(chunks).decode('utf-8'))))
+        self.assertEqual([row["SQL_Property"] for row in parsed], [row["SQL_Property"] for row in ROWS])
+
+    def test_parquet_round_trip_with_row_groups(self):
+        rows = ROWS + [{"SQL_Property": "Property X", "Month": "2024-06", "revenue": 3}]
+        output = export_result(rows, "parquet", chunk_rows=10)
+        parquet = pq.ParquetFile(output)
+        self.assertEqual(parquet.metadata.num_row_groups, 3)
+        self.assertEqual(parquet.read().to_pylist()[-1], {"SQL_Property": "Property X", "Month": "2024-06", "revenue": 3.0})
+
+    def test_downloads_convert_for_streamlit(self):
+        for fmt in EXPORT_FORMATS:
+            data, _ = convert_data_to_bytes_and_infer_mime(export_result(ROWS, fmt), ValueError("unsupported"))
+            self.assertTrue(data)
+        data, _ = convert_data_to_bytes_and_infer_mime(export_result(ROWS, "csv"), ValueError("unsupported"))
+        self.assertEqual(data, b"".join(iter_csv(ROWS)))
+
+    def test_parquet_schema_spans_all_chunks(self):
+        rows = [{"SQL_Property": None, "revenue": 1} for _ in range(10)]
+        rows += [{"SQL_Property": "AC Wailea", "revenue": 2.5, "Month": "2024-06"}]
+        table = pq.read_table(export_result(rows, "parquet", chunk_rows=10))
+        self.assertEqual(str(table.schema.field("SQL_Property").type), "string")
+        self.assertEqual(str(table.schema.field("revenue").type), "double")
+        self.assertEqual(table.to_pylist()[-1], {"SQL_Property": "AC Wailea", "revenue": 2.5, "Month": "2024-06"})
+        self.assertIsNone(table.to_pylist()[0]["Month"])
+
+    def test_empty_and_unknown(self):
+        self.assertEqual(export_result([], "csv").read(), b"")
+        self.assertEqual(export_result([], "parquet").read(), b"")
+        with self.assertRaises(ValueError):
+            export_result(ROWS, "xlsx")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import Config
+from engine.context import TurnContext, FollowUpRewriter, add_grouping
+from ui.messages import assistant_message
+from testing.test_repair_loop import StubLLM, GOOD_SQL, TABLE, make_orchestrator
+
+PREVIOUS_SQL = (
+    f"SELECT SUM(Current_Actual_Month) AS revenue FROM {TABLE} "
+    "WHERE SQL_Property = 'AC Wailea' AND SQL_Account_Name = 'Revenue' AND Month = '2024-06-01'"
+)
+
+def previous_turn(sql_query=PREVIOUS_SQL):
+    return TurnContext(query="Revenue for AC Wailea in June 2024", sub_queries=[{
+        "query": "Revenue for AC Wailea in June 2024",
+        "table": TABLE,
+        "entities": [
+            {"search_term": "AC Wailea", "column": "SQL_Property", "matched_value": "AC Wailea", "score": 100},
+            {"search_term": "revenue", "column": "SQL_Account_Name", "matched_value": "Revenue", "score": 100},
+        ],
+        "periods": ["2024-06-01"],
+        "aggregation": "total",
+        "sql_query": sql_query,
+        "results": [{"revenue": 150000.0}],
+    }])
+
+class TestFollowUpRewriter(unittest.TestCase):
+
+    def setUp(self):
+        self.rewriter = FollowUpRewriter()
+
+    def test_period_follow_ups(self):
+        [detail] = self.rewriter.rewrite("And for July?", previous_turn())
+        self.assertEqual(detail["sql_query"], PREVIOUS_SQL.replace("2024-06-01", "2024-07-01"))
+        self.assertEqual((detail["periods"], detail["sql_source"]), (["2024-07-01"], "follow_up"))
+
+        [detail] = self.rewriter.rewrite("what about Q3 2024?", previous_turn())
+        self.assertIn("Month IN ('2024-07-01', '2024-08-01', '2024-09-01')", detail["sql_query"])
+        self.assertIn("SQL_Property = 'AC Wailea'", detail["sql_query"])
+
+    def test_entity_follow_up_keeps_other_filters(self):
+        [detail] = self.rewriter.rewrite("and for Residence Inn Westshore Tampa in July?", previous_turn())
+        self.assertIn("SQL_Property = 'Residence Inn Westshore Tampa'", detail["sql_query"])
+        self.assertIn("Month = '2024-07-01'", detail["sql_query"])
+        self.assertEqual(detail["entities"][0]["matched_value"], "Residence Inn Westshore Tampa")
+
+    def test_breakdown_follow_up(self):
+        [detail] = self.rewriter.rewrite("Now break that down by department", previous_turn())
+        self.assertIn("SELECT\n  SQL_Account_Category_Order,", detail["sql_query"])
+        self.assertIn("GROUP BY\n  SQL_Account_Category_Order", detail["sql_query"])
+        # Ranked queries would change meaning if grouped further
+        self.assertIsNone(add_grouping(PREVIOUS_SQL + " GROUP BY SQL_Property LIMIT 3", "Month"))
+
+    def test_new_questions_are_not_follow_ups(self):
+        for query in ("What is the EBITDA for Marriott in 2023?",
+                      "and what is the total EBITDA for Marriott in 2023?",
+                      "break that down by colour",
+                      "and then?"):
+            self.assertIsNone(self.rewriter.rewrite(query, previous_turn()), query)
+
+class TestConversationFollowUps(unittest.TestCase):
+
+    def test_follow_up_skips_decomposition_and_generation(self):
+        llm = StubLLM(repair_sql=None, batch_sql=[GOOD_SQL.format('AC Wailea'),
+                                                  GOOD_SQL.format('Residence Inn Westshore Tampa')])
+        orchestrator = make_orchestrator(llm)
+        first = orchestrator.process_query("Compare room revenue", conversation_id="chat")
+        self.assertTrue(first["success"], first["error"])
+
+        prompts = len(llm.prompts)
+        result = orchestrator.process_query("and by month?", conversation_id="chat")
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual([step["step"] for step in result["steps"]], ["Follow-up Rewrite", "Query Execution", "Analysis"])
+        # Only the analysis called the LLM
+        self.assertEqual(len(llm.prompts), prompts + 1)
+        self.assertEqual(result["steps"][1]["results"][0]["results"],
+                         [{"Month": "2024-06-01", "total": 150000.0}, {"Month": "2024-07-01", "total": 125000.0}])
+
+        # Another chat has no previous turn to follow up
+        other = orchestrator.process_query("and by month?", conversation_id="other")
+        self.assertEqual(other["steps"][0]["step"], "Query Understanding and Decomposition")
+
+    def test_reopened_chat_is_restored_from_history(self):
+        llm = StubLLM(repair_sql=None, batch_sql=[GOOD_SQL.format('AC Wailea'),
+                                                  GOOD_SQL.format('Residence Inn Westshore Tampa')])
+        with mock.patch.object(Config, "merge_sibling_queries", False):
+            first = make_orchestrator(llm).process_query("Compare room revenue")
+        history = [{"role": "user", "content": "Compare room revenue"}, assistant_message(first, "Answer")]
+
+        result = make_orchestrator(llm).process_query("and by month?", conversation_id="chat", chat_history=history)
+        self.assertEqual(result["steps"][0]["step"], "Follow-up Rewrite")
+        self.assertEqual(len(result["steps"][1]["results"][1]["results"]), 2)
+
+        # A merged sibling scan is stored as the SQL of both sub-queries, so it cannot be rewritten per sub-query
+        merged = make_orchestrator(llm).process_query("Compare room revenue")
+        history = [{"role": "user", "content": "Compare room revenue"}, assistant_message(merged, "Answer")]
+        result = make_orchestrator(llm).process_query("and by month?", conversation_id="chat", chat_history=history)
+        self.assertEqual(result["steps"][0]["step"], "Query Understanding and Decomposition")
+
+if __name__ == "__main__":
+    unittest.main()
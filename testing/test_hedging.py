@@ -0,0 +1,108 @@
+import os
+import sys
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import Config
+from utils.llm import call_llm
+from utils.latency import LatencyTracker, HedgeBudget
+from utils.telemetry import TELEMETRY
+
+HAIKU, SONNET = Config.haiku_model, Config.sonnet_model
+
+class StragglerMessages:
+    """The first request hangs until released, later ones answer at once"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if len(self.calls) == 1:
+            self.release.wait(5)
+            return SimpleNamespace(content=[SimpleNamespace(text="slow")])
+        return SimpleNamespace(content=[SimpleNamespace(text="fast")])
+
+class StragglerClient:
+    def __init__(self):
+        self.messages = StragglerMessages()
+
+def warmed_tracker(latency: float, stage: str = "analysis", model: str = HAIKU) -> LatencyTracker:
+    tracker = LatencyTracker(window=50, min_samples=20)
+    for _ in range(20):
+        tracker.observe(stage, model, latency)
+    return tracker
+
+class TestLatencyTracker(unittest.TestCase):
+
+    def test_defaults_until_enough_samples(self):
+        tracker = LatencyTracker(window=50, min_samples=20)
+        tracker.observe("analysis", HAIKU, 1.0)
+        self.assertIsNone(tracker.percentile("analysis", HAIKU, 0.9))
+        self.assertEqual(tracker.timeout_for("analysis", HAIKU), Config.http_timeout)
+        with mock.patch.object(Config, "hedging_enabled", True):
+            self.assertIsNone(tracker.hedge_delay("analysis", HAIKU))
+
+    def test_percentiles_and_bounded_timeout(self):
+        tracker = LatencyTracker(window=100, min_samples=20)
+        for idx in range(1, 101):
+            tracker.observe("generation", SONNET, idx / 10)
+        self.assertAlmostEqual(tracker.percentile("generation", SONNET, 0.9), 9.1)
+        self.assertAlmostEqual(tracker.timeout_for("generation", SONNET), 10.0 * Config.timeout_multiplier)
+        self.assertEqual(warmed_tracker(0.1).timeout_for("analysis", HAIKU), Config.min_llm_timeout)
+        self.assertEqual(warmed_tracker(100.0).timeout_for("analysis", HAIKU), Config.http_timeout)
+
+    def test_models_are_tracked_separately(self):
+        # Analysis escalated to the larger model keeps the static timeout until that model has its own samples
+        tracker = warmed_tracker(0.1)
+        self.assertEqual(tracker.timeout_for("analysis", HAIKU), Config.min_llm_timeout)
+        self.assertEqual(tracker.timeout_for("analysis", SONNET), Config.http_timeout)
+        with mock.patch.object(Config, "hedging_enabled", True):
+            self.assertIsNone(tracker.hedge_delay("analysis", SONNET))
+
+    def test_hedge_budget(self):
+        budget = HedgeBudget(ratio=0.1, burst=1)
+        budget.count_request()
+        self.assertTrue(budget.try_acquire())
+        self.assertFalse(budget.try_acquire())
+        for _ in range(9):
+            budget.count_request()
+        self.assertTrue(budget.try_acquire())
+        self.assertFalse(budget.try_acquire())
+
+class TestHedgedCalls(unittest.TestCase):
+
+    def call(self, client, budget):
+        with mock.patch.object(Config, "hedging_enabled", True), \
+                mock.patch("utils.llm.LATENCY", warmed_tracker(0.05)), \
+                mock.patch("utils.llm.HEDGE_BUDGET", budget), \
+                TELEMETRY.collect() as calls:
+            timer = threading.Timer(0.5, client.messages.release.set)
+            timer.start()
+            text = call_llm(client, "Analyze the results", stage="analysis")
+            timer.join()
+        return text, calls
+
+    def test_slow_request_is_hedged(self):
+        client = StragglerClient()
+        text, calls = self.call(client, HedgeBudget(ratio=0.05, burst=1))
+        self.assertEqual(text, "fast")
+        self.assertEqual(len(client.messages.calls), 2)
+        self.assertEqual(client.messages.calls[0]["timeout"], Config.min_llm_timeout)
+        self.assertEqual([call.hedge for call in calls if call.hedge], [True])
+
+    def test_spent_budget_waits_for_original(self):
+        client = StragglerClient()
+        text, calls = self.call(client, HedgeBudget(ratio=0, burst=0))
+        self.assertEqual(text, "slow")
+        self.assertEqual(len(client.messages.calls), 1)
+        self.assertFalse(any(call.hedge for call in calls))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from ui.jobs import JobManager
+from ui.manager import ChatManager
+from testing.test_repair_loop import StubLLM, GOOD_SQL, make_orchestrator
+
+def wait_for(job_manager, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while not job_manager.get(job_id).finished and time.time() < deadline:
+        time.sleep(0.01)
+    return job_manager.get(job_id)
+
+class TestJobManager(unittest.TestCase):
+
+    def setUp(self):
+        self.jobs = JobManager(max_workers=1)
+
+    def test_job_reports_steps_and_result(self):
+        steps = []
+
+        def run(progress):
+            for step in ("decompose", "generate"):
+                progress(step)
+                steps.append(step)
+            return {"role": "assistant", "content": "42"}
+
+        job = wait_for(self.jobs, self.jobs.submit(run, "Total revenue?", "chat"))
+        self.assertEqual(job.status, "done")
+        self.assertEqual(job.result["content"], "42")
+        self.assertEqual((job.step, steps), ("generate", ["decompose", "generate"]))
+        self.assertEqual(self.jobs.active(), [])
+
+    def test_cancel_running_and_queued_jobs(self):
+        started, release = threading.Event(), threading.Event()
+
+        def run(progress):
+            progress("decompose")
+            started.set()
+            release.wait(5)
+            progress("generate")
+            return {"role": "assistant", "content": "too late"}
+
+        running = self.jobs.submit(run, "First", "chat")
+        queued = self.jobs.submit(run, "Second", "other")
+        started.wait(5)
+        self.assertEqual([job.query for job in self.jobs.active("other")], ["Second"])
+
+        self.assertTrue(self.jobs.cancel(queued))
+        self.assertTrue(self.jobs.cancel(running))
+        release.set()
+        self.assertEqual(wait_for(self.jobs, running).status, "cancelled")
+        self.assertEqual(self.jobs.get(queued).status, "cancelled")
+        self.assertFalse(self.jobs.cancel(running))
+
+    def test_failed_job_keeps_error(self):
+        def run(progress):
+            raise RuntimeError("database is locked")
+
+        job = wait_for(self.jobs, self.jobs.submit(run, "Total revenue?", "chat"))
+        self.assertEqual((job.status, job.error), ("failed", "database is locked"))
+
+    def test_answers_are_saved_when_jobs_finish(self):
+        chats = ChatManager(tempfile.mkdtemp())
+        seen = []
+
+        def persist(job, status):
+            # Pollers only see the job finish once its answer is saved
+            seen.append((job.finished, status))
+            answer = job.result if status == "done" else {"role": "assistant", "content": status}
+            chats.append_messages(job.chat_id, [answer])
+
+        started, release = threading.Event(), threading.Event()
+
+        def slow(progress):
+            started.set()
+            release.wait(5)
+            return {"role": "assistant", "content": "42"}
+
+        chats.save_chat("chat", [{"role": "user", "content": "Total revenue?"}])
+        done = self.jobs.submit(slow, "Total revenue?", "chat", on_finish=persist)
+        started.wait(5)
+        # A second question while the first one runs is queued, then cancelled before it starts
+        chats.append_messages("chat", [{"role": "user", "content": "And EBITDA?"}])
+        self.jobs.cancel(self.jobs.submit(slow, "And EBITDA?", "chat", on_finish=persist))
+        release.set()
+        wait_for(self.jobs, done)
+
+        self.assertEqual(seen, [(False, "cancelled"), (False, "done")])
+        self.assertEqual([message["content"] for message in chats.load_chat("chat")["messages"]],
+                         ["Total revenue?", "And EBITDA?", "cancelled", "42"])
+
+    def test_orchestrator_reports_progress(self):
+        llm = StubLLM(repair_sql=GOOD_SQL.format('Residence Inn Westshore Tampa'),
+                      batch_sql=[GOOD_SQL.format('AC Wailea'), GOOD_SQL.format('Residence Inn Westshore Tampa')])
+        steps = []
+        result = make_orchestrator(llm).process_query("Compare room revenue", progress=steps.append)
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual(steps, ["decompose", "generate", "execute", "analyze"])
+
+if __name__ == "__main__":
+    unittest.main()
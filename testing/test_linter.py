@@ -0,0 +1,108 @@
+import os
+import sys
+import tempfile
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from engine.linter import SQLLinter
+from engine.generator import SQLGenerator
+from engine.cache import SQLCache
+from engine.metadata import FinancialTableMetadata
+from engine.executor import SQLExecutor
+from testing import get_sample_db_connection
+
+TABLE = "final_income_sheet_new_seq"
+
+class TestSQLLinter(unittest.TestCase):
+
+    def setUp(self):
+        self.linter = SQLLinter(FinancialTableMetadata())
+
+    def test_strips_fences_and_commentary(self):
+        result = self.linter.lint(
+            "Here is the query:\n```sql\nSELECT SUM(Current_Actual_Month) AS total\n"
+            f"FROM {TABLE}\nWHERE SQL_Property = 'AC Wailea';\n```\nThis sums the monthly actuals.",
+            TABLE
+        )
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.fixes, [])
+        self.assertEqual(
+            result.sql_query,
+            f"SELECT SUM(Current_Actual_Month) AS total\nFROM {TABLE}\nWHERE SQL_Property = 'AC Wailea'"
+        )
+
+    def test_trailing_prose_without_terminator(self):
+        result = self.linter.lint(
+            f"SELECT Month FROM {TABLE} WHERE SQL_Property = 'AC Wailea'\nThis lists the months.", TABLE
+        )
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.sql_query, f"SELECT Month FROM {TABLE} WHERE SQL_Property = 'AC Wailea'")
+
+    def test_common_table_expressions(self):
+        sql = (
+            f"WITH monthly AS (\n  SELECT Month, SUM(Current_Actual_Month) AS total\n  FROM {TABLE}\n"
+            "  GROUP BY Month\n)\nSELECT Month, total FROM monthly ORDER BY total DESC LIMIT 1"
+        )
+        result = self.linter.lint(f"Here is a query with the monthly totals:\n```sql\n{sql};\n```", TABLE)
+        self.assertTrue(result.is_valid, result.errors)
+        self.assertEqual(result.fixes, [])
+        self.assertEqual(result.sql_query, sql)
+
+    def test_read_only_compound_queries_lint_and_execute(self):
+        executor = SQLExecutor(get_sample_db_connection())
+        cte = (
+            f"WITH monthly AS (\n  SELECT Month, SUM(Current_Actual_Month) AS total\n  FROM {TABLE}\n"
+            "  GROUP BY Month\n)\nSELECT Month, total FROM monthly ORDER BY total DESC LIMIT 1"
+        )
+        union = (
+            f"SELECT SQL_Property FROM {TABLE} WHERE Operator = 'HHM'\n"
+            f"UNION ALL\nSELECT SQL_Property FROM {TABLE} WHERE Month = '2024-07-01'"
+        )
+        for sql in (cte, union):
+            result = self.linter.lint(sql, TABLE)
+            self.assertTrue(result.is_valid, result.errors)
+            success, rows, error = executor.execute_query(result.sql_query)
+            self.assertTrue(success, error)
+            self.assertTrue(rows)
+        self.assertFalse(executor.execute_query(f"WITH x AS (SELECT 1) DELETE FROM {TABLE}")[0])
+        self.assertEqual(self.linter.lint(f"DELETE FROM {TABLE}", TABLE).errors,
+                         ["No SELECT statement found in the output"])
+
+    def test_deterministic_repairs(self):
+        result = self.linter.lint(
+            'SELECT SUM(current_actual_month) AS total FROM income_sheet '
+            'WHERE SQL_Propety = "AC Wailea" ORDER BY total', TABLE
+        )
+        self.assertTrue(result.is_valid)
+        self.assertEqual(len(result.fixes), 4)
+        self.assertIn(f"FROM {TABLE}", result.sql_query)
+        self.assertIn("SQL_Property = 'AC Wailea'", result.sql_query)
+        self.assertIn("SUM(Current_Actual_Month)", result.sql_query)
+
+    def test_unrepairable_errors(self):
+        self.assertEqual(self.linter.lint("I cannot answer that.", TABLE).errors,
+                         ["No SELECT statement found in the output"])
+        self.assertEqual(self.linter.lint(f"SELECT Revenue FROM {TABLE}", TABLE).errors,
+                         [f"Unknown column 'Revenue' in table '{TABLE}'"])
+        self.assertTrue(self.linter.lint(f"SELECT FROM WHERE {TABLE}", TABLE).errors[0].startswith("Parse error"))
+
+    def test_llm_repair_is_last_resort(self):
+        prompts = []
+        def llm(prompt):
+            prompts.append(prompt)
+            if "failed" in prompt:
+                return f"SELECT SUM(Current_Actual_Month) FROM {TABLE}"
+            return f"SELECT SUM(Revenue) FROM {TABLE}"
+
+        generator = SQLGenerator(llm, use_templates=False, sql_cache=SQLCache(tempfile.mkdtemp()))
+        sql = generator.generate_sql({'sub_query': "Total revenue", 'table': TABLE, 'extracted_entities': []})
+
+        self.assertEqual(sql, f"SELECT SUM(Current_Actual_Month) FROM {TABLE}")
+        self.assertEqual(len(prompts), 2)
+        self.assertIn(f"Unknown column 'Revenue' in table '{TABLE}'", prompts[1])
+        self.assertEqual(generator.stats["llm_repairs"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from engine.examples import ExampleStore
+from ui.manager import ChatManager, SQLiteChatManager
+from ui.messages import ResultStore, assistant_message, encode_message, decode_message, convert_chats
+
+ROWS = [{"SQL_Property": f"Property {idx}", "revenue": idx * 1000.0} for idx in range(50)]
+
+def pipeline_results(rows):
+    return {
+        "success": True,
+        "steps": [{
+            "step": "Query Execution",
+            "results": [{
+                "sub_query_number": 1,
+                "query": "Total revenue by property in May 2024",
+                "table": "final_income_sheet_new_seq",
+                "entities": [{"search_term": "revenue", "column": "Sub_Account_Category_Order",
+                              "matched_value": "Total Revenue", "score": 95}],
+                "sql_query": "SELECT SQL_Property, SUM(Current_Actual_Month) AS revenue FROM t GROUP BY SQL_Property",
+                "results": rows,
+                "error": None,
+            }],
+        }],
+        "analysis": {"analysis": {"summary": "Revenue is concentrated in two properties"}},
+    }
+
+class TestTypedMessages(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ResultStore(tempfile.mkdtemp())
+
+    def test_large_results_are_stored_once_by_hash(self):
+        message = assistant_message(pipeline_results(ROWS), "Formatted answer")
+        first = encode_message(message, self.store)
+        second = encode_message(dict(message), self.store)
+
+        sub_query = first["sub_queries"][0]
+        self.assertIsNone(sub_query["rows"])
+        self.assertEqual(sub_query["row_count"], 50)
+        self.assertEqual(sub_query["result_ref"], second["sub_queries"][0]["result_ref"])
+        self.assertEqual(os.listdir(self.store.results_dir), [f"{sub_query['result_ref']}.json.gz"])
+        self.assertEqual(decode_message(first, self.store), message)
+
+    def test_small_results_stay_inline(self):
+        record = encode_message(assistant_message(pipeline_results(ROWS[:2]), "Answer"), self.store)
+        self.assertEqual(record["sub_queries"][0]["rows"], ROWS[:2])
+        self.assertEqual(os.listdir(self.store.results_dir), [])
+
+    def test_legacy_repr_is_converted(self):
+        legacy = assistant_message(pipeline_results(ROWS), "")
+        legacy = {"role": "assistant", "content": repr({
+            "sub_queries": legacy["sub_queries"], "analysis": legacy["analysis"], "success": True
+        })}
+        decoded = decode_message(encode_message(legacy, self.store), self.store)
+        self.assertEqual(decoded["content"], "Revenue is concentrated in two properties")
+        self.assertEqual(decoded["sub_queries"][0]["execution_results"]["data"], ROWS)
+        self.assertEqual(decode_message({"role": "user", "content": "Hi"}, self.store), {"role": "user", "content": "Hi"})
+
+    def test_examples_are_harvested_from_records(self):
+        chats_dir = tempfile.mkdtemp()
+        ChatManager(chats_dir).save_chat("chat", [
+            {"role": "user", "content": "Total revenue by property in May 2024"},
+            assistant_message(pipeline_results(ROWS), "Formatted answer"),
+        ])
+        store = ExampleStore(chats_dir=chats_dir, cache_dir=tempfile.mkdtemp())
+        self.assertEqual([example.table for example in store.examples], ["final_income_sheet_new_seq"])
+
+    def test_converter_shrinks_saved_chats(self):
+        chats_dir = os.path.join(tempfile.mkdtemp(), "chats")
+        shutil.copytree(os.path.join(project_root, "saved_chats"), chats_dir,
+                        ignore=shutil.ignore_patterns("chats.db*", "results"))
+        before = ChatManager(chats_dir).load_chats()
+
+        stats = convert_chats(chats_dir)
+        self.assertEqual(stats["converted"], stats["chats"])
+        self.assertLess(stats["bytes_after"], stats["bytes_before"])
+
+        after = ChatManager(chats_dir).load_chats()
+        self.assertEqual(sorted(after), sorted(before))
+        for chat_id, chat in before.items():
+            self.assertEqual(after[chat_id]["title"], chat["title"])
+            self.assertEqual(len(after[chat_id]["messages"]), len(chat["messages"]))
+        self.assertEqual(convert_chats(chats_dir)["converted"], 0)
+
+class TestResultSweep(unittest.TestCase):
+
+    def chat(self, rows):
+        return [{"role": "user", "content": "Total revenue by property in May 2024"},
+                assistant_message(pipeline_results(rows), "Formatted answer")]
+
+    def check_sweep(self, manager):
+        # Two chats share one result set, a third has its own
+        manager.save_chat("first", self.chat(ROWS))
+        manager.save_chat("second", self.chat(ROWS))
+        manager.save_chat("third", self.chat(ROWS[:40]))
+        self.assertEqual(len(os.listdir(manager.results.results_dir)), 2)
+
+        manager.delete_chat("first")
+        self.assertEqual(len(os.listdir(manager.results.results_dir)), 2)
+        manager.delete_chat("third")
+        self.assertEqual(len(os.listdir(manager.results.results_dir)), 1)
+        self.assertEqual(manager.load_chat("second")["messages"][1]["sub_queries"][0]["execution_results"]["data"], ROWS)
+        manager.delete_chat("second")
+        self.assertEqual(os.listdir(manager.results.results_dir), [])
+
+    def test_json_manager_removes_unreferenced_results(self):
+        self.check_sweep(ChatManager(tempfile.mkdtemp()))
+
+    def test_sqlite_manager_removes_unreferenced_results(self):
+        directory = tempfile.mkdtemp()
+        manager = SQLiteChatManager(os.path.join(directory, "chats.db"), chats_dir=None)
+        self.check_sweep(manager)
+        manager.conn.close()
+
+    def test_references_are_counted_once(self):
+        manager = ChatManager(tempfile.mkdtemp(), compact_every=2)
+        manager.save_chat("chat", self.chat(ROWS)[:1])
+        manager.save_chat("chat", self.chat(ROWS))
+        manager.compact("chat")
+        orphan = manager.results.put(ROWS[:30])
+        manager.save_chat("other", self.chat(ROWS[:40]))
+        manager.save_chat("scratch", self.chat(ROWS))
+
+        # The first delete counts the stored references and sweeps the orphan
+        manager.delete_chat("scratch")
+        self.assertEqual(len(os.listdir(manager.results.results_dir)), 2)
+        self.assertNotIn(f"{orphan}.json.gz", os.listdir(manager.results.results_dir))
+
+        # Later writes and deletes keep the counts without rereading every chat
+        with patch.object(manager, "_referenced_results", side_effect=AssertionError("rescanned")):
+            manager.save_chat("copy", self.chat(ROWS))
+            manager.delete_chat("chat")
+            self.assertEqual(len(os.listdir(manager.results.results_dir)), 2)
+            manager.delete_chat("copy")
+            manager.delete_chat("other")
+        self.assertEqual(os.listdir(manager.results.results_dir), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import Config
+from engine.decomposer import QueryDecomposer
+from engine.generator import SQLGenerator
+from engine.analyzer import SQLAnalyzer
+from engine.orchestrator import QueryOrchestrator
+from engine.cache import SQLCache
+from utils.telemetry import TELEMETRY, TelemetryEvent
+from langchain_anthropic import ChatAnthropic
+
+TABLE = "final_income_sheet_new_seq"
+
+class RoutedMessages:
+    def __init__(self, responses):
+        self.responses = responses  # model -> response text
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(content=[SimpleNamespace(text=self.responses[kwargs["model"]])])
+
+class RoutedClient:
+    """Anthropic client stand-in answering differently per model"""
+    api_key = "test"
+
+    def __init__(self, responses):
+        self.messages = RoutedMessages(responses)
+
+    def models(self):
+        return [call["model"] for call in self.messages.calls]
+
+class TestModelRouting(unittest.TestCase):
+
+    def make_decomposer(self, client):
+        decomposer = QueryDecomposer(client)
+        decomposer.llm = client
+        return decomposer
+
+    def test_small_stages_use_small_model_and_limits(self):
+        client = RoutedClient({Config.haiku_model: TABLE})
+        self.assertEqual(self.make_decomposer(client)._select_relevant_table("Room revenue"), TABLE)
+
+        call = client.messages.calls[0]
+        self.assertEqual(call["model"], Config.haiku_model)
+        self.assertEqual(call["max_tokens"], Config.stage_routes["table_selection"].max_tokens)
+        self.assertEqual(call["stop_sequences"], ["\n"])
+
+    def test_invalid_output_escalates_once(self):
+        client = RoutedClient({Config.haiku_model: "income sheet", Config.sonnet_model: TABLE})
+        self.assertEqual(self.make_decomposer(client)._select_relevant_table("Room revenue"), TABLE)
+        self.assertEqual(client.models(), [Config.haiku_model, Config.sonnet_model])
+
+        analysis = '{"summary": "ok", "insights": [], "trends": [], "implications": [], "relationships": []}'
+        client = RoutedClient({Config.haiku_model: "not json", Config.sonnet_model: analysis})
+        result = SQLAnalyzer(client).analyze_results(
+            {'original_query': "Room revenue"}, [{'sub_query': "Room revenue", 'sql_query': "SELECT 1", 'results': []}]
+        )
+        self.assertEqual(result["analysis"]["summary"], "ok")
+        self.assertEqual(client.models(), [Config.haiku_model, Config.sonnet_model])
+
+    def test_escalation_is_recorded(self):
+        client = RoutedClient({Config.haiku_model: "income sheet", Config.sonnet_model: TABLE})
+        with TELEMETRY.collect() as records:
+            self.make_decomposer(client)._select_relevant_table("Room revenue")
+
+        usage = TELEMETRY.summarize(records)
+        self.assertEqual(usage["calls"], 2)
+        self.assertEqual(usage["stages"]["table_selection"]["events"], {"escalation": 1})
+        event = next(record for record in records if isinstance(record, TelemetryEvent))
+        self.assertEqual(event.detail, f"{Config.haiku_model} -> {Config.sonnet_model}")
+
+    def test_generation_uses_large_model(self):
+        client = RoutedClient({Config.sonnet_model: f"SELECT SUM(Current_Actual_Month) FROM {TABLE}"})
+        generator = SQLGenerator(client, use_templates=False, sql_cache=SQLCache(tempfile.mkdtemp()))
+        generator.generate_sql({'sub_query': "Total revenue", 'table': TABLE, 'extracted_entities': []})
+        self.assertEqual(client.models(), [Config.sonnet_model])
+
+    def test_orchestrator_routes_through_anthropic_client(self):
+        client = QueryOrchestrator._create_compatible_llm(
+            None, ChatAnthropic(model=Config.sonnet_model, anthropic_api_key="test-key")
+        )
+        self.assertEqual(client.api_key, "test-key")
+        self.assertTrue(hasattr(client, "messages"))
+
+if __name__ == "__main__":
+    unittest.main()
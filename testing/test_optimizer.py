@@ -0,0 +1,77 @@
+import os
+import sys
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from engine.optimizer import SQLOptimizer
+from engine.executor import SQLExecutor
+from testing import get_sample_db_connection
+
+def revenue_sql(property_name, month='2024-06-01'):
+    return (
+        "SELECT SUM(Current_Actual_Month) AS room_revenue\n"
+        "FROM final_income_sheet_new_seq\n"
+        f"WHERE SQL_Property = '{property_name}'\n"
+        "  AND SQL_Account_Category_Order = 'Room Revenue'\n"
+        f"  AND Month = '{month}';"
+    )
+
+class TestSQLOptimizer(unittest.TestCase):
+
+    def setUp(self):
+        self.optimizer = SQLOptimizer()
+        self.executor = SQLExecutor(get_sample_db_connection())
+
+    def run_merged(self, sql_queries):
+        merged = self.optimizer.merge_siblings(sql_queries)
+        self.assertEqual(len(merged), 1)
+        success, rows, error = self.executor.execute_query(merged[0].sql_query)
+        self.assertTrue(success, error)
+        return merged[0], self.optimizer.split_results(merged[0], rows)
+
+    def test_merges_sibling_properties(self):
+        sql_queries = [revenue_sql('AC Wailea'), revenue_sql('Residence Inn Westshore Tampa')]
+        merged, split = self.run_merged(sql_queries)
+
+        self.assertIn("SQL_Property IN ('AC Wailea', 'Residence Inn Westshore Tampa')", merged.sql_query)
+        self.assertIn("GROUP BY SQL_Property", merged.sql_query)
+        # Each sub-query gets exactly the rows its own SQL would have returned
+        for idx, sql in enumerate(sql_queries):
+            _, expected, _ = self.executor.execute_query(sql)
+            self.assertEqual(split[idx], expected)
+
+    def test_missing_member_keeps_aggregate_row(self):
+        _, split = self.run_merged([revenue_sql('AC Wailea'), revenue_sql('Surfrider Malibu')])
+        self.assertEqual(split[1], [{'room_revenue': None}])
+
+    def test_row_level_queries(self):
+        sql_queries = [
+            "SELECT Month, Current_Actual_Month FROM final_income_sheet_new_seq "
+            f"WHERE SQL_Property = '{name}' AND SQL_Account_Category_Order = 'Room Revenue' ORDER BY Month"
+            for name in ('AC Wailea', 'Residence Inn Westshore Tampa')
+        ]
+        merged, split = self.run_merged(sql_queries)
+        self.assertNotIn("GROUP BY", merged.sql_query)
+        for idx, sql in enumerate(sql_queries):
+            _, expected, _ = self.executor.execute_query(sql)
+            self.assertEqual(split[idx], expected)
+
+    def test_non_siblings_are_left_alone(self):
+        # Two filters differ
+        self.assertEqual(self.optimizer.merge_siblings([
+            revenue_sql('AC Wailea', '2024-06-01'), revenue_sql('Residence Inn Westshore Tampa', '2024-07-01')
+        ]), [])
+        # Unsupported shapes
+        self.assertEqual(self.optimizer.merge_siblings([
+            revenue_sql('AC Wailea').rstrip(';') + " LIMIT 1",
+            revenue_sql('Residence Inn Westshore Tampa').rstrip(';') + " LIMIT 1",
+        ]), [])
+        self.assertEqual(self.optimizer.merge_siblings([
+            "SELECT * FROM final_income_sheet_new_seq WHERE SQL_Property = 'AC Wailea' OR Month = '2024-06-01'",
+            "SELECT * FROM final_income_sheet_new_seq WHERE SQL_Property = 'Surfrider Malibu' OR Month = '2024-06-01'",
+        ]), [])
+
+if __name__ == "__main__":
+    unittest.main()
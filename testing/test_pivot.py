@@ -0,0 +1,58 @@
+import os
+import sys
+import unittest
+import pandas as pd
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from ui.pivot import PivotSpec, pivot_result, apply_filters, dimension_columns, measure_columns
+
+FRAME = pd.DataFrame([
+    {"SQL_Property": "AC Wailea", "Month": "2024-06-01", "revenue": 120000.0},
+    {"SQL_Property": "AC Wailea", "Month": "2024-07-01", "revenue": 125000.0},
+    {"SQL_Property": "Residence Inn Westshore Tampa", "Month": "2024-06-01", "revenue": 90000.0},
+    {"SQL_Property": "Residence Inn Westshore Tampa", "Month": "2024-07-01", "revenue": 80000.0},
+    {"SQL_Property": "Hilton Garden Inn Bethesda", "Month": "2024-06-01", "revenue": 0.0},
+    {"SQL_Property": "Hilton Garden Inn Bethesda", "Month": "2024-07-01", "revenue": 10000.0},
+])
+
+class TestPivot(unittest.TestCase):
+
+    def test_columns_are_classified(self):
+        self.assertEqual(dimension_columns(FRAME), ["SQL_Property", "Month"])
+        self.assertEqual(dimension_columns(FRAME, max_values=2), ["Month"])
+        self.assertEqual(measure_columns(FRAME), ["revenue"])
+
+    def test_filter(self):
+        filtered = apply_filters(FRAME, {"SQL_Property": ["AC Wailea"], "Month": []})
+        self.assertEqual(filtered["revenue"].tolist(), [120000.0, 125000.0])
+
+    def test_months_pivot_into_columns_sorted_by_change(self):
+        spec = PivotSpec(rows=["SQL_Property"], columns="Month", value="revenue", sort_by="Change")
+        result = pivot_result(FRAME, spec)
+        self.assertEqual(list(result.columns),
+                         ["SQL_Property", "2024-06-01", "2024-07-01", "Change", "Change %"])
+        self.assertEqual(result["SQL_Property"].tolist(),
+                         ["Hilton Garden Inn Bethesda", "AC Wailea", "Residence Inn Westshore Tampa"])
+        self.assertEqual(result["Change"].tolist(), [10000.0, 5000.0, -10000.0])
+        # No percentage change from zero
+        self.assertTrue(pd.isna(result["Change %"].iloc[0]))
+
+    def test_group_and_total(self):
+        grouped = pivot_result(FRAME, PivotSpec(rows=["Month"], value="revenue", aggfunc="mean"))
+        self.assertEqual(grouped.to_dict("records"), [{"Month": "2024-06-01", "revenue": 70000.0},
+                                                      {"Month": "2024-07-01", "revenue": 71666.66666666667}])
+        total = pivot_result(FRAME, PivotSpec(columns="Month", value="revenue",
+                                              filters={"SQL_Property": ["AC Wailea"]}))
+        self.assertEqual(total.to_dict("records"), [{"2024-06-01": 120000.0, "2024-07-01": 125000.0,
+                                                     "Change": 5000.0, "Change %": 5000.0 / 120000.0}])
+
+    def test_invalid_specs(self):
+        with self.assertRaises(ValueError):
+            pivot_result(FRAME, PivotSpec(rows=["Department"], value="revenue"))
+        with self.assertRaises(ValueError):
+            pivot_result(FRAME, PivotSpec(rows=["Month"], columns="Month", value="revenue"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import Config
+from engine.generator import SQLGenerator
+from engine.decomposer import QueryDecomposer
+from engine.analyzer import SQLAnalyzer
+from engine.cache import SQLCache
+from utils.llm import CachedPrompt, prompt_content
+
+TABLE = "final_income_sheet_new_seq"
+
+class StubMessages:
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(content=[SimpleNamespace(text=self.response)])
+
+class StubClient:
+    """Records the requests an Anthropic client would send"""
+    api_key = "test"
+
+    def __init__(self, response):
+        self.messages = StubMessages(response)
+
+    def contents(self):
+        return [call["messages"][0]["content"] for call in self.messages.calls]
+
+def query_info(sub_query, property_name):
+    return {
+        'sub_query': sub_query, 'table': TABLE,
+        'extracted_entities': [{'search_term': property_name.lower(), 'column': 'SQL_Property',
+                                'matched_value': property_name, 'score': 80}]
+    }
+
+class TestPromptCaching(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(Config, "prompt_caching", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_stable_prefix(self, contents):
+        for content in contents:
+            self.assertIsInstance(content, list)
+            self.assertEqual(content[0]["cache_control"], {"type": "ephemeral"})
+            self.assertNotIn("cache_control", content[-1])
+        prefixes = [content[0]["text"] for content in contents]
+        self.assertEqual(len(set(prefixes)), 1)
+        self.assertNotEqual(contents[0][-1]["text"], contents[1][-1]["text"])
+
+    def test_generator_prefix_is_byte_stable(self):
+        client = StubClient("SELECT SUM(Current_Actual_Month) FROM final_income_sheet_new_seq")
+        generator = SQLGenerator(client, use_templates=False, sql_cache=SQLCache(tempfile.mkdtemp()))
+        generator.generate_sql(query_info("Room Revenue for AC Wailea", 'AC Wailea'))
+        generator.generate_sql(query_info("Occupancy by month for Surfrider Malibu in 2023", 'Surfrider Malibu'))
+
+        contents = client.contents()
+        self.assert_stable_prefix(contents)
+        self.assertIn("- YoY_Change:", contents[0][0]["text"])
+        self.assertIn("Surfrider Malibu", contents[1][1]["text"])
+
+    def test_decomposer_and_analyzer_prefixes_are_byte_stable(self):
+        client = StubClient(TABLE)
+        decomposer = QueryDecomposer(client)
+        decomposer.llm = client
+        decomposer._select_relevant_table("Room Revenue for AC Wailea")
+        decomposer._select_relevant_table("Occupancy for Surfrider Malibu")
+        self.assert_stable_prefix(client.contents())
+
+        client = StubClient("{}")
+        analyzer = SQLAnalyzer(client)
+        for question in ("Room Revenue for AC Wailea", "Occupancy for Surfrider Malibu"):
+            analyzer.analyze_results({'original_query': question},
+                                     [{'sub_query': question, 'sql_query': "SELECT 1", 'results': [{'x': 1}]}])
+        self.assert_stable_prefix(client.contents())
+
+    def test_flag_off_sends_plain_text(self):
+        client = StubClient("SELECT SUM(Current_Actual_Month) FROM final_income_sheet_new_seq")
+        generator = SQLGenerator(client, use_templates=False, sql_cache=SQLCache(tempfile.mkdtemp()))
+        with mock.patch.object(Config, "prompt_caching", False):
+            generator.generate_sql(query_info("Room Revenue for AC Wailea", 'AC Wailea'))
+        self.assertIsInstance(client.contents()[0], str)
+
+    def test_cached_prompt_is_a_string(self):
+        prompt = CachedPrompt("static ", "question")
+        self.assertEqual(prompt, "static question")
+        self.assertIn("question", prompt)
+        self.assertEqual(prompt_content(prompt)[1], {"type": "text", "text": "question"})
+        self.assertEqual(prompt_content("plain"), "plain")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import Config
+from engine.orchestrator import QueryOrchestrator
+from engine.decomposer import QueryDecomposer
+from engine.cache import SQLCache
+from engine.examples import ExampleStore
+from testing import get_sample_db_connection
+
+TABLE = "final_income_sheet_new_seq"
+GOOD_SQL = f"SELECT SUM(Current_Actual_Month) AS total FROM {TABLE} WHERE SQL_Property = '{{}}'"
+# Parses and lints fine, but SQLite rejects it at execution time
+BAD_SQL = f"SELECT Month FROM {TABLE} WHERE SUM(Current_Actual_Month) > 0"
+
+# Rejected by the linter before it reaches the database
+INVALID_SQL = f"SELECT Bogus_Column FROM {TABLE}"
+
+class StubLLM:
+    api_key = "test"
+
+    def __init__(self, repair_sql, batch_sql=None):
+        self.repair_sql = repair_sql
+        self.batch_sql = batch_sql or [GOOD_SQL.format('AC Wailea'), BAD_SQL]
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        if "Failed SQL Query" in prompt:
+            return self.repair_sql
+        if "JSON Array" in prompt:
+            return json.dumps(self.batch_sql)
+        return "{}"
+
+class SequencedRepairLLM(StubLLM):
+    """Answers repair prompts with the given statements in turn"""
+
+    def __init__(self, repairs, batch_sql):
+        super().__init__(repair_sql=None, batch_sql=batch_sql)
+        self.repairs = list(repairs)
+
+    def __call__(self, prompt):
+        if "Failed SQL Query" in prompt:
+            self.prompts.append(prompt)
+            return self.repairs.pop(0)
+        return super().__call__(prompt)
+
+class StubDecomposer(QueryDecomposer):
+    def _decompose_complex_query(self, query, chat_history=None):
+        return ["Room revenue for AC Wailea", "Room revenue for Residence Inn Westshore Tampa"]
+
+    def _select_relevant_table(self, query):
+        return TABLE
+
+    def _extract_entities(self, query, table_info):
+        return []
+
+class StubOrchestrator(QueryOrchestrator):
+    def _create_compatible_llm(self, llm):
+        return llm
+
+def make_orchestrator(llm):
+    orchestrator = StubOrchestrator(llm, get_sample_db_connection())
+    orchestrator.decomposer = StubDecomposer(llm)
+    orchestrator.generator.cache = SQLCache(tempfile.mkdtemp())
+    orchestrator.generator.examples = ExampleStore(chats_dir=tempfile.mkdtemp(), cache_dir=tempfile.mkdtemp())
+    return orchestrator
+
+class TestRepairLoop(unittest.TestCase):
+
+    def test_only_failed_branch_is_retried(self):
+        llm = StubLLM(repair_sql=GOOD_SQL.format('Residence Inn Westshore Tampa'))
+        result = make_orchestrator(llm).process_query("Compare room revenue")
+
+        self.assertTrue(result["success"], result["error"])
+        steps = [step["step"] for step in result["steps"]]
+        self.assertEqual(steps, ["Query Understanding and Decomposition", "SQL Generation", "Query Execution",
+                                 "SQL Repair", "Query Execution", "Analysis"])
+        repair_prompts = [p for p in llm.prompts if "Failed SQL Query" in p]
+        self.assertEqual(len(repair_prompts), 1)
+        self.assertIn(BAD_SQL, repair_prompts[0])
+        self.assertIn("misuse of aggregate", repair_prompts[0])
+        # The retry re-executes only the repaired branch
+        self.assertEqual(len(result["steps"][4]["results"]), 1)
+        self.assertEqual(result["steps"][4]["results"][0]["results"], [{'total': 185000.0}])
+
+    def test_retries_are_bounded(self):
+        llm = StubLLM(repair_sql=BAD_SQL)
+        with mock.patch.object(Config, "max_sql_retries", 2):
+            result = make_orchestrator(llm).process_query("Compare room revenue")
+
+        self.assertEqual(sum(1 for p in llm.prompts if "Failed SQL Query" in p), 2)
+        # One branch succeeded, so the analysis still runs
+        self.assertEqual(result["steps"][-1]["step"], "Analysis")
+
+    def test_failed_repair_is_recorded(self):
+        llm = StubLLM(repair_sql=INVALID_SQL)
+        result = make_orchestrator(llm).process_query("Compare room revenue")
+
+        repair = next(step for step in result["steps"] if step["step"] == "SQL Repair")
+        self.assertEqual(repair["queries"], [])
+        self.assertEqual(repair["llm_usage"]["stages"]["repair"]["events"], {"repair_failed": 1})
+        self.assertEqual(result["llm_usage"]["stages"]["repair"]["events"], {"repair_failed": 1})
+
+    def test_time_budget_stops_retries(self):
+        llm = StubLLM(repair_sql=GOOD_SQL.format('Residence Inn Westshore Tampa'))
+        with mock.patch.object(Config, "request_time_budget", 0):
+            result = make_orchestrator(llm).process_query("Compare room revenue")
+        self.assertNotIn("SQL Repair", [step["step"] for step in result["steps"]])
+
+    def test_analysis_skipped_when_every_branch_fails(self):
+        llm = StubLLM(repair_sql=BAD_SQL, batch_sql=[BAD_SQL, BAD_SQL])
+        result = make_orchestrator(llm).process_query("Compare room revenue")
+
+        self.assertFalse(result["success"])
+        self.assertTrue(result["error"].startswith("All sub-queries failed"))
+        self.assertNotIn("Analysis", [step["step"] for step in result["steps"]])
+
+    def test_generation_failure_only_fails_its_branch(self):
+        # The second statement fails linting and its first repair, so generation marks only that branch failed
+        llm = SequencedRepairLLM(repairs=[INVALID_SQL, GOOD_SQL.format('Residence Inn Westshore Tampa')],
+                                 batch_sql=[GOOD_SQL.format('AC Wailea'), INVALID_SQL])
+        result = make_orchestrator(llm).process_query("Compare room revenue")
+
+        self.assertTrue(result["success"], result["error"])
+        steps = [step["step"] for step in result["steps"]]
+        self.assertEqual(steps, ["Query Understanding and Decomposition", "SQL Generation", "Query Execution",
+                                 "SQL Repair", "Query Execution", "Analysis"])
+        generated = result["steps"][1]["queries"]
+        self.assertIsNone(generated[0]["error"])
+        self.assertEqual(generated[1]["sql_source"], "failed")
+        self.assertIn("Unknown column", generated[1]["error"])
+        self.assertEqual(len(result["steps"][2]["results"]), 1)
+        self.assertEqual(result["steps"][4]["results"][0]["results"], [{'total': 185000.0}])
+
+    def test_null_only_results_are_not_remembered(self):
+        # SUM over no rows is NULL: the statement ran, but nothing shows it answered the question
+        llm = StubLLM(repair_sql=None, batch_sql=[GOOD_SQL.format('AC Wailea'), GOOD_SQL.format('AC Waliea')])
+        orchestrator = make_orchestrator(llm)
+        result = orchestrator.process_query("Compare room revenue")
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual([example.sql_query for example in orchestrator.generator.examples.examples],
+                         [GOOD_SQL.format('AC Wailea')])
+
+    def test_batch_failure_is_reported(self):
+        # One statement for two questions fails the batch, and each sub-query is generated individually
+        llm = StubLLM(repair_sql=None, batch_sql=[GOOD_SQL.format('AC Wailea')])
+        orchestrator = make_orchestrator(llm)
+        errors = []
+        queries = [{"sub_query": f"Room revenue for {name}", "table": TABLE, "extracted_entities": []}
+                   for name in ("AC Wailea", "Residence Inn Westshore Tampa")]
+        with mock.patch.object(orchestrator.generator, "generate_sql_with_source",
+                               side_effect=[(GOOD_SQL.format('AC Wailea'), "llm"), ValueError("no SQL")]):
+            outputs = orchestrator.generator.generate_sql_batch(queries, errors)
+        self.assertEqual(outputs[0], (GOOD_SQL.format('AC Wailea'), "llm"))
+        self.assertIsInstance(outputs[1], ValueError)
+        self.assertEqual(len(errors), 1)
+        self.assertIn("generated individually", errors[0])
+
+if __name__ == "__main__":
+    unittest.main()
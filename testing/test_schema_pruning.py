@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import Config
+from engine.generator import SQLGenerator
+from engine.cache import SQLCache
+
+TABLE = "final_income_sheet_new_seq"
+
+def entity(term, column, value):
+    return {'search_term': term, 'column': column, 'matched_value': value, 'score': 100}
+
+class TestSchemaPruning(unittest.TestCase):
+
+    def setUp(self):
+        self.prompts = []
+
+        def llm(prompt):
+            self.prompts.append(prompt)
+            return "SELECT SUM(Current_Actual_Month) FROM final_income_sheet_new_seq"
+
+        self.generator = SQLGenerator(llm, use_templates=False, sql_cache=SQLCache(tempfile.mkdtemp()))
+        self.table_info = self.generator.metadata.get_table_info(TABLE)
+
+    def columns_in(self, schema):
+        return [line[2:].split(':')[0] for line in schema.split('\n')]
+
+    def test_keeps_measure_entity_and_time_columns(self):
+        schema = self.generator._format_table_schema(self.table_info, [{
+            'sub_query': "Room Revenue for AC Wailea in June 2024",
+            'extracted_entities': [entity('ac wailea', 'SQL_Property', 'AC Wailea'),
+                                   entity('room revenue', 'SQL_Account_Category_Order', 'Room Revenue')]
+        }])
+        self.assertEqual(self.columns_in(schema),
+                         ['SQL_Property', 'SQL_Account_Category_Order', 'Current_Actual_Month', 'Month'])
+        self.assertGreater(self.generator.schema_token_reduction(), 0.3)
+
+    def test_keeps_columns_mentioned_by_name(self):
+        schema = self.generator._format_table_schema(self.table_info, [{
+            'sub_query': "Which properties had the highest YoY change?", 'extracted_entities': []
+        }])
+        self.assertEqual(self.columns_in(schema), ['SQL_Property', 'Current_Actual_Month', 'YoY_Change'])
+
+    def test_flag_disables_pruning(self):
+        with mock.patch.object(Config, "prune_schema", False):
+            self.generator.generate_sql({'sub_query': "Revenue for AC Wailea", 'table': TABLE,
+                                         'extracted_entities': []})
+        for col_name in self.table_info.columns:
+            self.assertIn(f"- {col_name}:", self.prompts[0])
+        self.assertEqual(self.generator.schema_token_reduction(), 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import threading
+import contextvars
+import unittest
+from types import SimpleNamespace
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from utils.llm import call_llm, _in_flight
+from utils.singleflight import SingleFlight
+from utils.telemetry import TELEMETRY
+
+class SlowMessages:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+        self.release = threading.Event()
+
+    def create(self, **kwargs):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(content=[SimpleNamespace(text=f"answer {self.calls}")])
+
+class SlowClient:
+    """Anthropic client stand-in whose requests block until released"""
+
+    def __init__(self, error=None):
+        self.messages = SlowMessages(error)
+
+def run_concurrently(fn, count):
+    """Start count threads running fn and return their results or exceptions once all finished"""
+    outcomes = [None] * count
+
+    def run(idx):
+        try:
+            outcomes[idx] = fn()
+        except Exception as e:
+            outcomes[idx] = e
+
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(run, idx)) for idx in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+class TestSingleFlight(unittest.TestCase):
+
+    def wait_for_waiters(self, client, threads):
+        deadline = time.time() + 5
+        while (client.messages.calls == 0 or _in_flight.in_flight() == 0) and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)  # Let the other threads join the in-flight call
+        client.messages.release.set()
+        for thread in threads:
+            thread.join(5)
+
+    def test_identical_concurrent_calls_share_one_request(self):
+        client = SlowClient()
+        with TELEMETRY.collect() as calls:
+            threads, outcomes = run_concurrently(lambda: call_llm(client, "Which table?", stage="table_selection"), 5)
+            self.wait_for_waiters(client, threads)
+
+        self.assertEqual(client.messages.calls, 1)
+        self.assertEqual(outcomes, ["answer 1"] * 5)
+        self.assertEqual(sum(call.coalesced for call in calls), 4)
+        self.assertEqual(_in_flight.in_flight(), 0)
+
+    def test_errors_reach_every_waiter(self):
+        client = SlowClient(error=RuntimeError("overloaded"))
+        threads, outcomes = run_concurrently(lambda: call_llm(client, "Which table?", stage="table_selection"), 3)
+        self.wait_for_waiters(client, threads)
+
+        self.assertEqual(client.messages.calls, 1)
+        self.assertTrue(all(isinstance(outcome, RuntimeError) for outcome in outcomes))
+
+    def test_different_or_sequential_calls_are_sent(self):
+        client = SlowClient()
+        client.messages.release.set()
+        call_llm(client, "Which table?", stage="table_selection")
+        call_llm(client, "Which table?", stage="table_selection")
+        call_llm(client, "Which table?", stage="analysis")
+        self.assertEqual(client.messages.calls, 3)
+
+    def test_key_is_released_after_failure(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            flight.do("key", fail)
+        self.assertEqual(flight.do("key", lambda: 42), (42, False))
+
+if __name__ == "__main__":
+    unittest.main()
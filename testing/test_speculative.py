@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import Config
+from engine.generator import SQLGenerator, SPECULATIVE_HINTS
+from engine.executor import SQLExecutor
+from engine.cache import SQLCache
+from testing import get_sample_db_connection
+from testing.test_repair_loop import GOOD_SQL, StubLLM, make_orchestrator
+
+TABLE = "final_income_sheet_new_seq"
+QUERY_INFO = {'sub_query': "Room Revenue for AC Wailea", 'table': TABLE, 'extracted_entities': []}
+
+class SingleQueryLLM(StubLLM):
+    """Answers single-query prompts with the revenue of the property asked about"""
+
+    def __call__(self, prompt):
+        question = str(prompt).split("Natural Language Query")[-1]
+        if "Natural Language Query" in str(prompt):
+            return GOOD_SQL.format('AC Wailea' if 'AC Wailea' in question else 'Residence Inn Westshore Tampa')
+        return super().__call__(prompt)
+
+class TestSpeculativeGeneration(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = SQLExecutor(get_sample_db_connection())
+
+    def validate(self, sql_query):
+        success, results, error = self.executor.execute_query(sql_query)
+        if not success:
+            return False, error, None
+        return (True, "", results) if results else (False, "Query returned no rows", None)
+
+    def make_generator(self, responses, delays):
+        """LLM stub answering each prompt variant with its own SQL after its own delay"""
+        calls = []
+        lock = threading.Lock()
+
+        def llm(prompt):
+            variant = self.variant_of(prompt)
+            with lock:
+                calls.append(variant)
+            time.sleep(delays[variant])
+            return responses[variant]
+
+        generator = SQLGenerator(llm, use_templates=False, sql_cache=SQLCache(tempfile.mkdtemp()))
+        return generator, calls
+
+    def variant_of(self, prompt):
+        for idx, hint in enumerate(SPECULATIVE_HINTS):
+            if hint and hint in prompt:
+                return idx
+        return 0
+
+    def test_first_valid_candidate_wins(self):
+        responses = [
+            f"SELECT SUM(Current_Actual_Month) FROM {TABLE} WHERE SQL_Property = 'Nowhere' GROUP BY Month",
+            f"SELECT SUM(Current_Actual_Month) AS total FROM {TABLE} WHERE SQL_Property = 'AC Wailea'",
+            f"SELECT Current_Actual_Month FROM {TABLE} WHERE SQL_Property = 'AC Wailea'",
+        ]
+        generator, calls = self.make_generator(responses, delays=[0.0, 0.05, 0.5])
+
+        start = time.time()
+        sql, source, rows = generator.generate_sql_speculative(QUERY_INFO, self.validate, candidates=3, stagger=0.0)
+
+        # Variant 0 returns no rows, variant 1 wins without waiting for the slow variant 2
+        self.assertEqual(sql, responses[1])
+        self.assertEqual(source, "llm:speculative:1")
+        self.assertEqual(rows, self.executor.execute_query(responses[1])[1])
+        self.assertLess(time.time() - start, 0.4)
+
+    def test_later_candidates_are_not_sent_once_one_is_valid(self):
+        responses = [
+            f"SELECT SUM(Current_Actual_Month) AS total FROM {TABLE} WHERE SQL_Property = 'AC Wailea'",
+            f"SELECT Current_Actual_Month FROM {TABLE} WHERE SQL_Property = 'AC Wailea'",
+            f"SELECT Month FROM {TABLE} WHERE SQL_Property = 'AC Wailea'",
+        ]
+        generator, calls = self.make_generator(responses, delays=[0.05, 0.0, 0.0])
+        sql, source, _ = generator.generate_sql_speculative(QUERY_INFO, self.validate, candidates=3, stagger=1.0)
+        self.assertEqual((sql, source), (responses[0], "llm:speculative:0"))
+        self.assertEqual(calls, [0])
+        self.assertEqual(generator.stats["llm_requests"], 1)
+
+    def test_next_candidate_starts_after_stagger_or_failure(self):
+        responses = [
+            f"SELECT Month FROM {TABLE} WHERE SQL_Property = 'Nowhere'",
+            f"SELECT Current_Actual_Month FROM {TABLE} WHERE SQL_Property = 'AC Wailea'",
+            f"SELECT Month FROM {TABLE} WHERE SQL_Property = 'AC Wailea'",
+        ]
+        # Variant 0 is slow and empty: variant 1 starts after the stagger, variant 2 after variant 0 fails
+        generator, calls = self.make_generator(responses, delays=[0.2, 0.5, 0.0])
+        sql, source, _ = generator.generate_sql_speculative(QUERY_INFO, self.validate, candidates=3, stagger=0.1)
+        self.assertEqual((sql, source), (responses[2], "llm:speculative:2"))
+        self.assertEqual(calls, [0, 1, 2])
+
+    def test_falls_back_to_compiled_candidate(self):
+        responses = [f"SELECT Month FROM {TABLE} WHERE SQL_Property = 'Nowhere'", "SELECT Nonsense FROM nowhere"]
+        generator, _ = self.make_generator(responses, delays=[0.0, 0.0])
+        sql, source, rows = generator.generate_sql_speculative(QUERY_INFO, self.validate, candidates=2, stagger=0.0)
+        self.assertEqual((sql, source, rows), (responses[0], "llm:speculative", None))
+
+    def test_winning_rows_are_not_queried_again(self):
+        orchestrator = make_orchestrator(SingleQueryLLM(repair_sql=None))
+        with mock.patch.object(Config, "speculative_candidates", 2), \
+                mock.patch.object(orchestrator.executor, "execute_query",
+                                  wraps=orchestrator.executor.execute_query) as execute:
+            result = orchestrator.process_query("Compare room revenue")
+
+        self.assertTrue(result["success"], result["error"])
+        executed = [call.args[0] for call in execute.call_args_list]
+        # Each winner ran once, while it was validated, and was neither rerun nor merged into another scan
+        self.assertEqual(len(executed), 2)
+        self.assertEqual(len(set(executed)), 2)
+        execution = next(step for step in result["steps"] if step["step"] == "Query Execution")
+        self.assertEqual([branch["results"] for branch in execution["results"]],
+                         [self.executor.execute_query(branch["sql_query"])[1] for branch in execution["results"]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from config import Config
+from engine.orchestrator import QueryOrchestrator
+from engine.decomposer import QueryDecomposer
+from engine.cache import SQLCache
+from engine.examples import ExampleStore
+from utils.llm import call_llm
+from utils.telemetry import TELEMETRY, call_cost
+from testing import get_sample_db_connection
+
+TABLE = "final_income_sheet_new_seq"
+MODEL = Config.stage_routes["generation"].model
+SQL = f"SELECT SUM(Current_Actual_Month) AS total FROM {TABLE} WHERE SQL_Property = 'AC Wailea'"
+
+class StubMessages:
+    def create(self, model, messages, **kwargs):
+        prompt = messages[0]["content"]
+        prompt = prompt if isinstance(prompt, str) else "".join(block["text"] for block in prompt)
+        if "fail" in prompt:
+            raise RuntimeError("overloaded")
+        text = '{"summary": "ok"}' if "Analyze" in prompt else SQL
+        usage = SimpleNamespace(input_tokens=1000, output_tokens=100,
+                                cache_read_input_tokens=2000, cache_creation_input_tokens=0)
+        return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=usage, model=model)
+
+class StubClient:
+    """Anthropic client stand-in that reports token usage"""
+    api_key = "test"
+
+    def __init__(self):
+        self.messages = StubMessages()
+
+class StubDecomposer(QueryDecomposer):
+    def _decompose_complex_query(self, query, chat_history=None):
+        return ["Room revenue for AC Wailea"]
+
+    def _select_relevant_table(self, query):
+        return TABLE
+
+    def _extract_entities(self, query, table_info):
+        return []
+
+class StubOrchestrator(QueryOrchestrator):
+    def _create_compatible_llm(self, llm):
+        return llm
+
+class TestTelemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.trace_path = os.path.join(tempfile.mkdtemp(), "trace.jsonl")
+        patcher = mock.patch.object(TELEMETRY, "trace_path", self.trace_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_trace(self):
+        with open(self.trace_path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_call_is_traced(self):
+        with TELEMETRY.collect() as calls:
+            self.assertEqual(call_llm(StubClient(), "Room revenue", stage="generation"), SQL)
+
+        trace = self.read_trace()
+        self.assertEqual(len(trace), 1)
+        self.assertEqual(trace[0]["stage"], "generation")
+        self.assertEqual(trace[0]["model"], MODEL)
+        self.assertEqual(trace[0]["input_tokens"], 1000)
+        self.assertEqual(trace[0]["cache_status"], "off")
+        self.assertEqual(len(trace[0]["prompt_hash"]), 16)
+        self.assertAlmostEqual(trace[0]["cost"], call_cost(MODEL, 1000, 100, 2000))
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_call_is_traced(self):
+        with self.assertRaises(RuntimeError):
+            call_llm(StubClient(), "fail", stage="analysis")
+        self.assertEqual(self.read_trace()[0]["error"], "overloaded")
+
+    def test_wrapped_callable_inherits_stage(self):
+        client = StubClient()
+        with TELEMETRY.collect() as calls:
+            call_llm(lambda prompt: call_llm(client, prompt), "Room revenue", stage="repair")
+        self.assertEqual([call.stage for call in calls], ["repair"])
+
+    def test_steps_carry_per_stage_breakdown(self):
+        client = StubClient()
+        orchestrator = StubOrchestrator(client, get_sample_db_connection())
+        orchestrator.decomposer = StubDecomposer(client)
+        orchestrator.generator.cache = SQLCache(tempfile.mkdtemp())
+        orchestrator.generator.examples = ExampleStore(chats_dir=tempfile.mkdtemp(), cache_dir=tempfile.mkdtemp())
+
+        result = orchestrator.process_query("Room revenue for AC Wailea")
+
+        self.assertTrue(result["success"], result["error"])
+        steps = {step["step"]: step for step in result["steps"]}
+        self.assertEqual(steps["SQL Generation"]["llm_usage"]["stages"]["generation"]["calls"], 1)
+        self.assertEqual(steps["Analysis"]["llm_usage"]["stages"]["analysis"]["calls"], 1)
+        self.assertEqual(steps["Query Execution"]["llm_usage"]["calls"], 0)
+        self.assertEqual(result["llm_usage"]["calls"], 2)
+        self.assertEqual(len(self.read_trace()), 2)
+
+if __name__ == "__main__":
+    unittest.main()
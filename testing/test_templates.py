@@ -0,0 +1,169 @@
+import os
+import sys
+import tempfile
+import unittest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from engine.templates import SQLTemplateEngine, TemplateMatch
+from engine.generator import SQLGenerator
+from engine.cache import SQLCache
+from engine.executor import SQLExecutor
+from engine.metadata import FinancialTableMetadata
+from testing import get_sample_db_connection
+
+TABLE = "final_income_sheet_new_seq"
+
+def entity(column, value, score=100):
+    return {'search_term': value.lower(), 'column': column, 'matched_value': value, 'score': score}
+
+class TestSQLTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = SQLTemplateEngine(min_score=90)
+        self.table_info = FinancialTableMetadata().get_table_info(TABLE)
+        self.executor = SQLExecutor(get_sample_db_connection())
+
+    def run_template(self, sub_query, entities):
+        match = self.engine.match(
+            {'sub_query': sub_query, 'table': TABLE, 'extracted_entities': entities},
+            self.table_info
+        )
+        self.assertIsNotNone(match)
+        success, results, error = self.executor.execute_query(match.to_sql())
+        self.assertTrue(success, error)
+        return match, results
+
+    def test_metric_for_property_and_period(self):
+        match, results = self.run_template(
+            "What is the Room Revenue for AC Wailea for June 2024?",
+            [entity('SQL_Property', 'AC Wailea'), entity('SQL_Account_Category_Order', 'Room Revenue')]
+        )
+        self.assertEqual(match.name, "metric")
+        self.assertEqual(match.params, ['AC Wailea', 'Room Revenue', '2024-06-01'])
+        self.assertEqual(results, [{'room_revenue': 120000.0}])
+
+    def test_compare_properties(self):
+        match, results = self.run_template(
+            "Compare the Room Revenue for AC Wailea and Residence Inn Westshore Tampa in June 2024",
+            [entity('SQL_Property', 'AC Wailea'), entity('SQL_Property', 'Residence Inn Westshore Tampa'),
+             entity('SQL_Account_Category_Order', 'Room Revenue')]
+        )
+        self.assertEqual(match.name, "compare")
+        self.assertEqual(len(results), 2)
+
+    def test_trend_over_months(self):
+        match, results = self.run_template(
+            "Show the monthly trend of Room Revenue for AC Wailea from June to July 2024",
+            [entity('SQL_Property', 'AC Wailea'), entity('SQL_Account_Category_Order', 'Room Revenue')]
+        )
+        self.assertEqual(match.name, "trend")
+        self.assertEqual([row['Month'] for row in results], ['2024-06-01', '2024-07-01'])
+
+    def test_rank_properties(self):
+        match, results = self.run_template(
+            "Which property had the lowest Room Revenue in June 2024?",
+            [entity('SQL_Account_Category_Order', 'Room Revenue')]
+        )
+        self.assertEqual(match.name, "rank")
+        self.assertEqual(results[0]['SQL_Property'], 'Hilton Garden Inn Bethesda')
+
+    def test_rank_keeps_top_n(self):
+        match, results = self.run_template(
+            "What are the top 2 properties by Room Revenue in June 2024?",
+            [entity('SQL_Account_Category_Order', 'Room Revenue')]
+        )
+        self.assertEqual(match.name, "rank")
+        self.assertTrue(match.sql.endswith("LIMIT 2"), match.sql)
+        self.assertEqual(len(results), 2)
+        self.assertGreaterEqual(results[0]['room_revenue'], results[1]['room_revenue'])
+
+    def test_operator_total(self):
+        match, results = self.run_template(
+            "What is the total Room Revenue for properties managed by Marriott in June 2024?",
+            [entity('Operator', 'Marriott'), entity('SQL_Account_Category_Order', 'Room Revenue')]
+        )
+        self.assertEqual(match.name, "operator_total")
+        self.assertEqual(results, [{'Operator': 'Marriott', 'room_revenue': 210000.0}])
+
+    def test_non_additive_metric_is_averaged(self):
+        match, results = self.run_template(
+            "What was the Occupancy % for Hilton Garden Inn Bethesda in Q3 2024?",
+            [entity('SQL_Property', 'Hilton Garden Inn Bethesda'), entity('SQL_Account_Category_Order', 'Occupancy %')]
+        )
+        self.assertIn("AVG(Current_Actual_Month)", match.sql)
+        self.assertAlmostEqual(results[0]['occupancy'], 0.85)
+
+    def test_ambiguous_queries_fall_back(self):
+        # Weak entity match
+        self.assertIsNone(self.engine.match(
+            {'sub_query': "Room Revenue for AC Wailea in June 2024", 'table': TABLE,
+             'extracted_entities': [entity('SQL_Property', 'AC Wailea'),
+                                    entity('SQL_Account_Category_Order', 'Room Revenue', score=75)]},
+            self.table_info
+        ))
+        # No period
+        self.assertIsNone(self.engine.match(
+            {'sub_query': "Room Revenue for AC Wailea", 'table': TABLE,
+             'extracted_entities': [entity('SQL_Property', 'AC Wailea'),
+                                    entity('SQL_Account_Category_Order', 'Room Revenue')]},
+            self.table_info
+        ))
+        # Two metrics
+        self.assertIsNone(self.engine.match(
+            {'sub_query': "Revenue and Room Revenue for AC Wailea in June 2024", 'table': TABLE,
+             'extracted_entities': [entity('SQL_Account_Name', 'Revenue'),
+                                    entity('SQL_Account_Category_Order', 'Room Revenue')]},
+            self.table_info
+        ))
+
+    def test_unsupported_intents_fall_back(self):
+        probes = [
+            ("What was the average Room Revenue for AC Wailea in 2023?",
+             [entity('SQL_Property', 'AC Wailea'), entity('SQL_Account_Category_Order', 'Room Revenue')]),
+            ("What was the YoY change in Room Revenue for Marriott in March 2024?",
+             [entity('Operator', 'Marriott'), entity('SQL_Account_Category_Order', 'Room Revenue')]),
+            ("How did Room Revenue for AC Wailea compare to budget in June 2024?",
+             [entity('SQL_Property', 'AC Wailea'), entity('SQL_Account_Category_Order', 'Room Revenue')]),
+            # Ranks by a column that is not an entity
+            ("Which month had the lowest Room Revenue for AC Wailea in 2024?",
+             [entity('SQL_Property', 'AC Wailea'), entity('SQL_Account_Category_Order', 'Room Revenue')]),
+            ("Which quarter had the highest Room Revenue for AC Wailea in 2024?",
+             [entity('SQL_Property', 'AC Wailea'), entity('SQL_Account_Category_Order', 'Room Revenue')]),
+        ]
+        for sub_query, entities in probes:
+            self.assertIsNone(self.engine.match(
+                {'sub_query': sub_query, 'table': TABLE, 'extracted_entities': entities}, self.table_info
+            ), sub_query)
+
+    def test_rank_target_is_named_column(self):
+        match, _ = self.run_template(
+            "Which operator had the highest Room Revenue in June 2024?",
+            [entity('SQL_Account_Category_Order', 'Room Revenue')]
+        )
+        self.assertIn("GROUP BY Operator", match.sql)
+
+    def test_literal_quoting(self):
+        match = TemplateMatch(name="metric", sql="SELECT 1 WHERE a = ? AND b = ?", params=["Workers' Comp", 3])
+        self.assertEqual(match.to_sql(), "SELECT 1 WHERE a = 'Workers'' Comp' AND b = 3")
+
+    def test_generator_hit_rate(self):
+        def llm(prompt):
+            return "SELECT SUM(Current_Actual_Month) FROM final_income_sheet_new_seq"
+
+        generator = SQLGenerator(llm, sql_cache=SQLCache(tempfile.mkdtemp()))
+        _, source = generator.generate_sql_with_source({
+            'sub_query': "Room Revenue for AC Wailea in June 2024", 'table': TABLE,
+            'extracted_entities': [entity('SQL_Property', 'AC Wailea'),
+                                   entity('SQL_Account_Category_Order', 'Room Revenue')]
+        })
+        self.assertEqual(source, "template:metric")
+        _, source = generator.generate_sql_with_source({
+            'sub_query': "Room Revenue for AC Wailea", 'table': TABLE, 'extracted_entities': []
+        })
+        self.assertEqual(source, "llm")
+        self.assertEqual(generator.template_hit_rate(), 0.5)
+
+if __name__ == "__main__":
+    unittest.main()
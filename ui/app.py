@@ -1,6 +1,9 @@
 import streamlit as st
+import pandas as pd
 import uuid
+import time
 from datetime import datetime
+from typing import Dict
 import sys
 import os
 
@@ -11,7 +14,55 @@ if project_root not in sys.path:
 
 from config import Config
 from database.analyst import DatabaseAnalyst
-from ui.manager import ChatManager
+from ui.manager import ChatManager, SQLiteChatManager
+from ui.messages import assistant_message
+from ui.jobs import Job, JobManager
+from ui.export import EXPORT_FORMATS, export_result
+from ui.pivot import AGGREGATIONS, PivotSpec, dimension_columns, measure_columns, pivot_result, sort_result
+
+# Progress label of each workflow step of a running query
+STEP_LABELS = {
+    "decompose": "Understanding the question",
+    "generate": "Generating SQL",
+    "execute": "Running queries",
+    "analyze": "Analyzing results",
+}
+
+# Message styling, emitted once per script run; fragment reruns keep it
+MESSAGE_CSS = """
+        <style>
+        .step-header {
+            background-color: #f0f2f6;
+            padding: 1rem;
+            border-radius: 0.5rem;
+            margin: 1rem 0;
+            border-left: 4px solid #4CAF50;
+        }
+        .step-content {
+            margin: 1rem 0 2rem 1rem;
+            padding-left: 1rem;
+            border-left: 2px solid #e0e0e0;
+        }
+        .sql-block {
+            background-color: #f8f9fa;
+            font-family: monospace;
+            padding: 1rem;
+            border-radius: 0.3rem;
+        }
+        .entity-match {
+            background-color: #e3f2fd;
+            padding: 0.5rem;
+            border-radius: 0.3rem;
+            margin: 0.5rem 0;
+        }
+        .analysis-section {
+            background-color: #fff3e0;
+            padding: 1rem;
+            border-radius: 0.5rem;
+            margin: 1rem 0;
+        }
+        </style>
+    """
 
 def initialize_session_state():
     """Initialize or reset the session state"""
@@ -24,9 +75,29 @@ def initialize_session_state():
             'chats': {},
             'last_query': None,
             'new_chat_clicked': False,
-            'api_key_set': False
+            'api_key_set': False,
+            'chat_page': 0,
+            'formatted_messages': {},
+            'pending_jobs': []  # job_id/chat_id of queries submitted from this session
         })
 
+@st.cache_resource
+def get_chat_manager() -> ChatManager:
+    """Chat store shared by all sessions; migrates JSON chats on first use"""
+    if Config.chat_store == "sqlite":
+        return SQLiteChatManager()
+    return ChatManager()
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """Query worker pool shared by all sessions, so jobs outlive reruns"""
+    return JobManager()
+
+@st.cache_resource
+def get_analyst(api_key: str) -> DatabaseAnalyst:
+    """Analyst per API key, reused across reruns and by background jobs"""
+    return DatabaseAnalyst(Config(api_key=api_key))
+
 def render_sidebar(chat_manager: ChatManager):
     """Render the sidebar with configuration and chat management"""
     with st.sidebar:
@@ -52,12 +123,6 @@ def handle_new_chat(chat_manager: ChatManager):
     if not st.session_state.new_chat_clicked:
         st.session_state.new_chat_clicked = True
         
-        if st.session_state.messages:
-            chat_manager.save_chat(
-                st.session_state.current_chat_id,
-                st.session_state.messages
-            )
-        
         new_chat_id = str(uuid.uuid4())
         st.session_state.update({
             'current_chat_id': new_chat_id,
@@ -81,31 +146,62 @@ Please ask me any question about your database!"""
         st.rerun()
 
 def render_chat_history(chat_manager: ChatManager):
-    """Render the chat history sidebar"""
+    """Render one page of the chat history sidebar"""
     st.title("Chat History")
-    chats = chat_manager.load_chats()
+    if search := st.text_input("🔎 Search chats", key="chat_search", placeholder="Questions, SQL, entities..."):
+        render_search_results(chat_manager, search)
+        return
+
+    page_size = Config.chat_page_size
+    page_count = max(1, -(-chat_manager.count_chats() // page_size))
+    page = min(st.session_state.chat_page, page_count - 1)
+    chats = chat_manager.list_chats(limit=page_size, offset=page * page_size)
     
-    for chat_id, chat_data in chats.items():
-        with st.expander(f"📝 {chat_data['title']}", expanded=False):
-            st.write(f"Created: {datetime.fromisoformat(chat_data['timestamp']).strftime('%Y-%m-%d %H:%M')}")
+    for chat in chats:
+        chat_id = chat['chat_id']
+        with st.expander(f"📝 {chat['title']}", expanded=False):
+            st.write(f"Created: {datetime.fromisoformat(chat['timestamp']).strftime('%Y-%m-%d %H:%M')}")
             
             col1, col2 = st.columns(2)
             
             with col1:
                 if st.button("Load Chat", key=f"load_{chat_id}"):
-                    handle_load_chat(chat_manager, chat_id, chat_data)
+                    handle_load_chat(chat_manager, chat_id)
             
             with col2:
                 if st.button("🗑️ Delete", key=f"delete_{chat_id}", type="secondary"):
                     handle_delete_chat(chat_manager, chat_id)
+    
+    if page_count > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("◀", key="chat_page_prev", disabled=page == 0):
+                st.session_state.chat_page = page - 1
+                st.rerun()
+        with col2:
+            st.caption(f"Page {page + 1} of {page_count}")
+        with col3:
+            if st.button("▶", key="chat_page_next", disabled=page >= page_count - 1):
+                st.session_state.chat_page = page + 1
+                st.rerun()
+
+def render_search_results(chat_manager: ChatManager, search: str):
+    """Render ranked messages matching the search, each opening its chat"""
+    hits = chat_manager.search_chats(search)
+    if not hits:
+        st.info("No matching chats")
+        return
+    for idx, hit in enumerate(hits):
+        if st.button(f"📝 {hit['title']}", key=f"hit_{idx}_{hit['chat_id']}"):
+            handle_load_chat(chat_manager, hit['chat_id'])
+        st.caption(f"{hit['snippet']}  \n{datetime.fromisoformat(hit['timestamp']).strftime('%Y-%m-%d %H:%M')}")
 
-def handle_load_chat(chat_manager: ChatManager, chat_id: str, chat_data: dict):
-    """Handle loading a chat"""
-    if st.session_state.messages:
-        chat_manager.save_chat(
-            st.session_state.current_chat_id,
-            st.session_state.messages
-        )
+def handle_load_chat(chat_manager: ChatManager, chat_id: str):
+    """Handle loading a chat; its messages are only read now"""
+    chat_data = chat_manager.load_chat(chat_id)
+    if chat_data is None:
+        st.error("Chat could not be loaded")
+        return
     st.session_state.messages = chat_data['messages']
     st.session_state.current_chat_id = chat_id
     st.rerun()
@@ -116,147 +212,232 @@ def handle_delete_chat(chat_manager: ChatManager, chat_id: str):
     if chat_id == st.session_state.current_chat_id:
         st.session_state.current_chat_id = str(uuid.uuid4())
         st.session_state.messages = []
-    st.session_state.chats = chat_manager.load_chats()
     st.rerun()
 
 def render_messages(analyst: DatabaseAnalyst):
-    """Render chat messages with detailed process steps"""
-    # Add custom CSS for message styling
-    st.markdown("""
-        <style>
-        .step-header {
-            background-color: #f0f2f6;
-            padding: 1rem;
-            border-radius: 0.5rem;
-            margin: 1rem 0;
-            border-left: 4px solid #4CAF50;
-        }
-        .step-content {
-            margin: 1rem 0 2rem 1rem;
-            padding-left: 1rem;
-            border-left: 2px solid #e0e0e0;
-        }
-        .sql-block {
-            background-color: #f8f9fa;
-            font-family: monospace;
-            padding: 1rem;
-            border-radius: 0.3rem;
-        }
-        .entity-match {
-            background-color: #e3f2fd;
-            padding: 0.5rem;
-            border-radius: 0.3rem;
-            margin: 0.5rem 0;
-        }
-        .analysis-section {
-            background-color: #fff3e0;
-            padding: 1rem;
-            border-radius: 0.5rem;
-            margin: 1rem 0;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    """Render chat messages, each one as an isolated fragment"""
+    for idx in range(len(st.session_state.messages)):
+        render_message(idx)
 
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            if message["role"] == "user":
-                st.markdown("🧑‍💻 **User Query:**")
-                st.info(message["content"])
-            else:
-                if isinstance(message.get("content"), dict):
-                    with st.expander("View Detailed Analysis Process", expanded=True):
-                        if steps := message["content"].get("steps", []):
-                            for step in steps:
-                                # Step Header
-                                st.markdown(f"""
-                                <div class="step-header">
-                                    <h3>{step['step']} {_get_step_emoji(step['step'])}</h3>
-                                    <em>{step['description']}</em>
-                                </div>
-                                """, unsafe_allow_html=True)
-                                
-                                with st.container():
-                                    if step["step"] == "Query Understanding":
-                                        st.info(f"📝 Input Query: {step['input']}")
-                                    
-                                    elif step["step"] == "Entity Recognition":
-                                        st.subheader("🔍 Identified Entities")
-                                        for entity in step['entities']:
-                                            with st.container():
-                                                st.markdown(f"""
-                                                <div class="entity-match">
-                                                    <strong>Table:</strong> {entity['table']}<br>
-                                                    <strong>Column:</strong> {entity['column']}<br>
-                                                    <strong>Matched:</strong> {entity['matched_value']}<br>
-                                                    <strong>Score:</strong> {entity['score']}
-                                                </div>
-                                                """, unsafe_allow_html=True)
-                                    
-                                    elif step["step"] == "Query Decomposition":
-                                        st.subheader("📋 Sub-queries")
-                                        for i, sub_query in enumerate(step['sub_queries'], 1):
-                                            st.markdown(f"**{i}.** {sub_query}")
-                                    
-                                    elif step["step"] == "SQL Generation":
-                                        st.subheader("💻 Generated SQL Queries")
-                                        for query in step['queries']:
-                                            st.markdown(f"**For:** _{query['sub_query']}_")
-                                            st.code(query['sql_query'], language="sql")
-                                    
-                                    elif step["step"] == "Query Execution":
-                                        st.subheader("📊 Query Results")
-                                        for result in step['results']:
-                                            st.markdown(f"**Query:** _{result['sub_query']}_")
-                                            if result.get('error'):
-                                                st.error(f"Error: {result['error']}")
+@st.fragment
+def render_message(idx: int):
+    """Render one message with detailed process steps; expanding its tables only reruns this fragment"""
+    message = st.session_state.messages[idx]
+    with st.chat_message(message["role"]):
+        if message["role"] == "user":
+            st.markdown("🧑‍💻 **User Query:**")
+            st.info(message["content"])
+        else:
+            if isinstance(message.get("content"), dict):
+                with st.expander("View Detailed Analysis Process", expanded=True):
+                    if steps := message["content"].get("steps", []):
+                        for step_idx, step in enumerate(steps):
+                            # Step Header
+                            st.markdown(f"""
+                            <div class="step-header">
+                                <h3>{step['step']} {_get_step_emoji(step['step'])}</h3>
+                                <em>{step['description']}</em>
+                            </div>
+                            """, unsafe_allow_html=True)
+
+                            with st.container():
+                                if step["step"] == "Query Understanding":
+                                    st.info(f"📝 Input Query: {step['input']}")
+
+                                elif step["step"] == "Entity Recognition":
+                                    st.subheader("🔍 Identified Entities")
+                                    for entity in step['entities']:
+                                        with st.container():
+                                            st.markdown(f"""
+                                            <div class="entity-match">
+                                                <strong>Table:</strong> {entity['table']}<br>
+                                                <strong>Column:</strong> {entity['column']}<br>
+                                                <strong>Matched:</strong> {entity['matched_value']}<br>
+                                                <strong>Score:</strong> {entity['score']}
+                                            </div>
+                                            """, unsafe_allow_html=True)
+
+                                elif step["step"] == "Query Decomposition":
+                                    st.subheader("📋 Sub-queries")
+                                    for i, sub_query in enumerate(step['sub_queries'], 1):
+                                        st.markdown(f"**{i}.** {sub_query}")
+
+                                elif step["step"] == "SQL Generation":
+                                    st.subheader("💻 Generated SQL Queries")
+                                    for query in step['queries']:
+                                        st.markdown(f"**For:** _{query['sub_query']}_")
+                                        st.code(query['sql_query'], language="sql")
+                                        if query.get('error'):
+                                            st.error(f"Error: {query['error']}")
+
+                                elif step["step"] == "Query Execution":
+                                    st.subheader("📊 Query Results")
+                                    for j, result in enumerate(step['results']):
+                                        st.markdown(f"**Query:** _{result['sub_query']}_")
+                                        if result.get('error'):
+                                            st.error(f"Error: {result['error']}")
+                                        else:
+                                            if result['results']:
+                                                _render_table(pd.DataFrame(result['results']), f"{idx}_step_{step_idx}_{j}")
                                             else:
-                                                if result['results']:
-                                                    st.dataframe(
-                                                        result['results'],
-                                                        use_container_width=True,
-                                                        hide_index=True
-                                                    )
-                                                else:
-                                                    st.info("No results found")
-                                    
-                                    elif step["step"] == "Analysis":
-                                        if analysis := step.get('analysis', {}).get('analysis', {}):
-                                            st.subheader("🎯 Analysis Results")
-                                            
-                                            # Summary
-                                            with st.container():
-                                                st.markdown("""
-                                                <div class="analysis-section">
-                                                    <strong>Summary:</strong><br>
-                                                    {analysis.get('summary', 'No summary available')}
-                                                </div>
-                                                """, unsafe_allow_html=True)
-                                            
-                                            col1, col2 = st.columns(2)
-                                            with col1:
-                                                if insights := analysis.get('insights'):
-                                                    st.markdown("**🔍 Key Insights:**")
-                                                    st.markdown(insights)
-                                                
-                                                if trends := analysis.get('trends'):
-                                                    st.markdown("**📈 Trends:**")
-                                                    st.markdown(trends)
-                                            
-                                            with col2:
-                                                if implications := analysis.get('implications'):
-                                                    st.markdown("**💡 Business Implications:**")
-                                                    st.markdown(implications)
-                                                
-                                                if relationships := analysis.get('relationships'):
-                                                    st.markdown("**🔗 Relationships:**")
-                                                    st.markdown(relationships)
-                                
-                                st.markdown("---")
+                                                st.info("No results found")
+
+                                elif step["step"] == "Analysis":
+                                    if analysis := step.get('analysis', {}).get('analysis', {}):
+                                        st.subheader("🎯 Analysis Results")
+
+                                        # Summary
+                                        with st.container():
+                                            st.markdown("""
+                                            <div class="analysis-section">
+                                                <strong>Summary:</strong><br>
+                                                {analysis.get('summary', 'No summary available')}
+                                            </div>
+                                            """, unsafe_allow_html=True)
+
+                                        col1, col2 = st.columns(2)
+                                        with col1:
+                                            if insights := analysis.get('insights'):
+                                                st.markdown("**🔍 Key Insights:**")
+                                                st.markdown(insights)
+
+                                            if trends := analysis.get('trends'):
+                                                st.markdown("**📈 Trends:**")
+                                                st.markdown(trends)
+
+                                        with col2:
+                                            if implications := analysis.get('implications'):
+                                                st.markdown("**💡 Business Implications:**")
+                                                st.markdown(implications)
+
+                                            if relationships := analysis.get('relationships'):
+                                                st.markdown("**🔗 Relationships:**")
+                                                st.markdown(relationships)
+
+                            st.markdown("---")
+            else:
+                if message["content"].startswith("❌"):
+                    st.error(message["content"])
                 else:
-                    if message["content"].startswith("❌"):
-                        st.error(message["content"])
-                    else:
-                        st.markdown(message["content"])
+                    st.markdown(message["content"])
+                if message.get("sub_queries"):
+                    with st.expander("View SQL and Results", expanded=False):
+                        for j, sub_query in enumerate(_formatted_sub_queries(idx, message)):
+                            st.markdown(f"**For:** _{sub_query['sub_query']}_")
+                            st.code(sub_query['sql_query'], language="sql")
+                            if sub_query['error']:
+                                st.error(f"Error: {sub_query['error']}")
+                            elif sub_query['frame'] is not None:
+                                _render_table(sub_query['frame'], f"{idx}_{j}")
+                                _render_downloads(sub_query['rows'], f"{idx}_{j}")
+                    if idx == _latest_answer_index():
+                        _render_pivot_panel(idx, _formatted_sub_queries(idx, message))
+
+def _formatted_sub_queries(idx: int, message: dict) -> list:
+    """Sub-queries of a message with their results as DataFrames, built once per chat and message"""
+    cache = st.session_state.formatted_messages
+    if cache.get('chat_id') != st.session_state.current_chat_id:
+        cache.clear()
+        cache['chat_id'] = st.session_state.current_chat_id
+    if idx not in cache:
+        cache[idx] = [
+            {
+                "sub_query": sub_query['sub_query'],
+                "sql_query": sub_query['sql_query'],
+                "error": sub_query['execution_results'].get('error'),
+                "rows": sub_query['execution_results'].get('data') or [],
+                "frame": pd.DataFrame(sub_query['execution_results']['data'])
+                         if sub_query['execution_results'].get('data') else None,
+            }
+            for sub_query in message['sub_queries']
+        ]
+    return cache[idx]
+
+def _latest_answer_index() -> int:
+    """Index of the newest answer with sub-query results, the turn the pivot panel works on"""
+    for idx in range(len(st.session_state.messages) - 1, -1, -1):
+        if st.session_state.messages[idx].get("sub_queries"):
+            return idx
+    return -1
+
+def _render_pivot_panel(idx: int, sub_queries: list):
+    """Filter, pivot and sort the cached rows of the latest answer in memory; nothing is re-queried"""
+    tables = [sub_query for sub_query in sub_queries if sub_query['frame'] is not None]
+    if not tables:
+        return
+    key = f"pivot_{st.session_state.current_chat_id}_{idx}"
+    with st.expander("🧮 Pivot & Filter", expanded=False):
+        st.caption("Re-slices the rows already loaded for this answer; ask a new question for data they do not contain.")
+        choice = 0
+        if len(tables) > 1:
+            choice = st.selectbox("Result", range(len(tables)), format_func=lambda i: tables[i]['sub_query'],
+                                  key=f"{key}_result")
+        frame = tables[choice]['frame']
+        key = f"{key}_{choice}"
+        dimensions, measures = dimension_columns(frame), measure_columns(frame)
+
+        filters = {}
+        for column, dimension in zip(st.columns(max(len(dimensions), 1)), dimensions):
+            with column:
+                filters[dimension] = st.multiselect(
+                    dimension, sorted(frame[dimension].dropna().unique()), key=f"{key}_filter_{dimension}"
+                )
+
+        rows_column, pivot_column, value_column, agg_column = st.columns(4)
+        with rows_column:
+            rows = st.multiselect("Rows", dimensions, key=f"{key}_rows")
+        with pivot_column:
+            pivot = st.selectbox("Columns", [None] + [d for d in dimensions if d not in rows],
+                                 format_func=lambda column: column or "—", key=f"{key}_columns")
+        with value_column:
+            value = st.selectbox("Value", measures, key=f"{key}_value") if measures else None
+        with agg_column:
+            aggfunc = st.selectbox("Aggregate", AGGREGATIONS, key=f"{key}_agg")
+
+        try:
+            result = pivot_result(frame, PivotSpec(filters=filters, rows=rows, columns=pivot,
+                                                   value=value, aggfunc=aggfunc))
+        except ValueError as e:
+            st.warning(str(e))
+            return
+
+        sort_column, order_column = st.columns([3, 1])
+        with sort_column:
+            sort_by = st.selectbox("Sort by", [None] + list(result.columns),
+                                   format_func=lambda column: column or "—", key=f"{key}_sort")
+        with order_column:
+            descending = st.toggle("Descending", value=True, key=f"{key}_descending")
+        result = sort_result(result, sort_by, descending)
+
+        st.caption(f"{len(result):,} of {len(frame):,} rows")
+        _render_table(result, f"{idx}_pivot_{choice}")
+        _render_downloads(result.to_dict('records'), f"{idx}_pivot_{choice}")
+
+def _render_downloads(rows: list, key: str):
+    """
+    Download buttons serializing the cached result only when clicked, without re-running its SQL.
+    Callable data needs Streamlit 1.52 or newer, see requirements.txt.
+    """
+    columns = st.columns(len(EXPORT_FORMATS) + 2)
+    for column, (fmt, mime) in zip(columns, EXPORT_FORMATS.items()):
+        with column:
+            st.download_button(
+                f"⬇️ {fmt.upper()}",
+                data=lambda fmt=fmt: export_result(rows, fmt),
+                file_name=f"result_{key}.{fmt}",
+                mime=mime,
+                key=f"download_{st.session_state.current_chat_id}_{key}_{fmt}",
+                on_click="ignore"
+            )
+
+def _render_table(frame: pd.DataFrame, key: str):
+    """Render a result table, collapsed to a preview until expanded when it is large"""
+    preview = Config.ui_table_preview_rows
+    key = f"table_{st.session_state.current_chat_id}_{key}"
+    if len(frame) > preview and not st.toggle(f"Show all {len(frame):,} rows", key=key):
+        st.caption(f"Showing the first {preview} of {len(frame):,} rows")
+        frame = frame.head(preview)
+    st.dataframe(frame, use_container_width=True, hide_index=True)
 
 def _get_step_emoji(step_name: str) -> str:
     """Get emoji for each step"""
@@ -280,7 +461,7 @@ def main():
     st.title("SQL Database Analysis Assistant")
     
     initialize_session_state()
-    chat_manager = ChatManager()
+    chat_manager = get_chat_manager()
     
     # Render sidebar and get API key
     api_key = render_sidebar(chat_manager)
@@ -290,48 +471,78 @@ def main():
         return
     
     try:
-        config = Config(api_key=api_key)
-        analyst = DatabaseAnalyst(config)
+        analyst = get_analyst(api_key)
     except Exception as e:
         st.error(f"Failed to initialize database analyst: {str(e)}")
         return
     
     # Render existing messages
+    st.markdown(MESSAGE_CSS, unsafe_allow_html=True)
     render_messages(analyst)
     
+    jobs = get_job_manager()
+    if st.session_state.pending_jobs:
+        render_pending_jobs(chat_manager, jobs)
+    
     # Query input
     if query := st.chat_input("Ask a question about your data"):
-        process_query(query, analyst, chat_manager)
+        process_query(query, analyst, chat_manager, jobs)
 
-def process_query(query: str, analyst: DatabaseAnalyst, chat_manager: ChatManager):
-    """Process a user query and update the chat"""
+def process_query(query: str, analyst: DatabaseAnalyst, chat_manager: ChatManager, jobs: JobManager):
+    """Submit a user query to the background workers and show it as pending"""
+    chat_id = st.session_state.current_chat_id
+    chat_history = list(st.session_state.messages)
     st.session_state.messages.append({"role": "user", "content": query})
+    # Messages are appended to the stored chat as they are created, so sessions never save a stale copy
+    chat_manager.append_messages_async(chat_id, [{"role": "user", "content": query}])
+
+    def run(progress) -> dict:
+        # The chat id lets follow-ups ("and for July?") reuse the previous answer's SQL
+        results = analyst.process_query(query, progress=progress, conversation_id=chat_id, chat_history=chat_history)
+        return assistant_message(results, analyst.format_output(results))
+
+    def persist(job: Job, status: str):
+        # Runs on the worker, so the answer is saved even if this session has closed
+        chat_manager.append_messages_async(job.chat_id, [finished_message(job, status)])
     
-    with st.spinner("Analyzing..."):
-        try:
-            results = analyst.process_query(query)
-            formatted_output = analyst.format_output(results)
-            
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": formatted_output
-            })
-            
-            chat_manager.save_chat(
-                st.session_state.current_chat_id,
-                st.session_state.messages
-            )
-            
+    job_id = jobs.submit(run, query, chat_id, on_finish=persist)
+    st.session_state.pending_jobs.append({"job_id": job_id, "chat_id": chat_id})
+    st.rerun()
+
+@st.fragment(run_every=Config.job_poll_interval)
+def render_pending_jobs(chat_manager: ChatManager, jobs: JobManager):
+    """Poll this session's queries, showing progress for the current chat and filing finished answers"""
+    finished = False
+    for pending in list(st.session_state.pending_jobs):
+        job = jobs.get(pending["job_id"])
+        if job is None:
+            st.session_state.pending_jobs.remove(pending)
+            continue
+        if job.finished:
+            handle_finished_job(chat_manager, job)
+            st.session_state.pending_jobs.remove(pending)
+            finished = True
+        elif job.chat_id == st.session_state.current_chat_id:
             with st.chat_message("assistant"):
-                st.markdown(formatted_output)
-                
-        except Exception as e:
-            error_msg = f"Error processing query: {str(e)}"
-            st.error(error_msg)
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": f"❌ {error_msg}"
-            })
+                label = STEP_LABELS.get(job.step, "Waiting for a worker")
+                st.info(f"⏳ {label}... ({time.time() - job.submitted_at:.0f}s)")
+                if st.button("⏹️ Cancel", key=f"cancel_{job.job_id}"):
+                    jobs.cancel(job.job_id)
+    if finished:
+        st.rerun(scope="app")
+
+def finished_message(job: Job, status: str) -> Dict:
+    """Assistant message for a job that ended with status"""
+    if status == "done":
+        return job.result
+    if status == "cancelled":
+        return {"role": "assistant", "content": "❌ Query cancelled"}
+    return {"role": "assistant", "content": f"❌ Error processing query: {job.error}"}
+
+def handle_finished_job(chat_manager: ChatManager, job: Job):
+    """Show a finished job's answer if its chat is open; the job already saved it to the chat"""
+    if job.chat_id == st.session_state.current_chat_id:
+        st.session_state.messages.append(finished_message(job, job.status))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,68 @@
+import io
+import csv
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config import Config
+
+# Download formats and their MIME types
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def _chunks(rows: Iterable[Dict], chunk_rows: int) -> Iterator[List[Dict]]:
+    """Split rows into lists of at most chunk_rows"""
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, chunk_rows)):
+        yield chunk
+
+def iter_csv(rows: Iterable[Dict], chunk_rows: int = Config.export_chunk_rows) -> Iterator[bytes]:
+    """Encode rows as CSV, yielding one encoded chunk per chunk_rows rows after the header"""
+    columns = None
+    buffer = io.StringIO()
+    for chunk in _chunks(rows, chunk_rows):
+        if columns is None:
+            columns = list(chunk[0].keys())
+            writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+def write_parquet(rows: Iterable[Dict], sink, chunk_rows: int = Config.export_chunk_rows):
+    """
+    Write rows to sink as Parquet, one row group per chunk_rows rows. The schema is unified
+    across all chunks first, so a leading chunk of nulls or ints does not fix the type of
+    a column that later holds strings or floats.
+    """
+    tables = [pa.Table.from_pylist(chunk) for chunk in _chunks(rows, chunk_rows)]
+    if not tables:
+        return
+    schema = pa.unify_schemas([table.schema for table in tables], promote_options="permissive")
+    with pq.ParquetWriter(sink, schema) as writer:
+        for table in tables:
+            # Columns missing from a chunk are added as nulls, then types are promoted
+            for field in schema:
+                if field.name not in table.column_names:
+                    table = table.append_column(field.name, pa.nulls(len(table), field.type))
+            writer.write_table(table.select(schema.names).cast(schema))
+
+def export_result(rows: Iterable[Dict], fmt: str, chunk_rows: int = Config.export_chunk_rows) -> io.BytesIO:
+    """
+    Serialize a cached result set for download, encoding it chunk by chunk instead of building
+    one string. Returns a buffer positioned at its start, a type st.download_button accepts.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    output = io.BytesIO()
+    if fmt == "csv":
+        for chunk in iter_csv(rows, chunk_rows):
+            output.write(chunk)
+    else:
+        write_parquet(rows, output, chunk_rows)
+    output.seek(0)
+    return output
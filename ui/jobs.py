@@ -0,0 +1,122 @@
+import time
+import uuid
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from config import Config
+
+class JobCancelled(Exception):
+    """Raised inside a job at the next progress report after it was cancelled"""
+
+@dataclass
+class Job:
+    job_id: str
+    query: str
+    chat_id: str
+    status: str = "queued"  # "queued", "running", "done", "failed" or "cancelled"
+    step: Optional[str] = None  # Workflow step currently running
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _future: Optional[Future] = field(default=None, repr=False)
+    _on_finish: Optional[Callable[["Job", str], None]] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+class JobManager:
+    """
+    Runs queries on a worker pool so the Streamlit script never blocks on the pipeline. Jobs
+    are addressed by id and live in this process-wide manager, so they survive reruns and
+    sessions can poll them. Cancellation takes effect between workflow steps; an LLM call
+    already in flight finishes first.
+    """
+
+    def __init__(self, max_workers: int = Config.query_workers, keep_finished: float = Config.job_retention):
+        self.keep_finished = keep_finished
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[Callable[[str], None]], Dict], query: str, chat_id: str,
+               on_finish: Callable[[Job, str], None] = None) -> str:
+        """
+        Queue fn, which receives a progress callback to report each step through, and return
+        the job id. The callback raises JobCancelled once the job has been cancelled.
+        on_finish receives the job and its final status before pollers see it finish, so
+        results can be saved even when no session is polling any more.
+        """
+        job = Job(job_id=str(uuid.uuid4()), query=query, chat_id=chat_id, _on_finish=on_finish)
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+        job._future = self._pool.submit(self._run, job, fn)
+        return job.job_id
+
+    def _run(self, job: Job, fn: Callable):
+        """Run a job on a worker thread and record its outcome"""
+        if job._cancel.is_set():
+            return
+
+        def progress(step: str):
+            if job._cancel.is_set():
+                raise JobCancelled()
+            job.step = step
+
+        job.status = "running"
+        try:
+            result = fn(progress)
+        except JobCancelled:
+            result = None
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, "failed")
+            return
+        job.result = result
+        # Pipelines catch exceptions themselves, so a cancel may surface as a failed result
+        self._finish(job, "cancelled" if job._cancel.is_set() else "done")
+
+    def _finish(self, job: Job, status: str):
+        """Run the job's completion callback, then publish its final status"""
+        if job._on_finish is not None:
+            try:
+                job._on_finish(job, status)
+            except Exception as e:
+                print(f"Error finishing job {job.job_id}: {e}")
+        job.finished_at = time.time()
+        job.status = status
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Poll a job by id"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job, returning False when it already finished"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel.set()
+        if job._future is not None and job._future.cancel():
+            self._finish(job, "cancelled")
+        return True
+
+    def active(self, chat_id: str = None) -> List[Job]:
+        """Unfinished jobs, optionally of one chat, oldest first"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if not job.finished]
+        return sorted(
+            (job for job in jobs if chat_id is None or job.chat_id == chat_id),
+            key=lambda job: job.submitted_at
+        )
+
+    def _prune(self):
+        """Forget jobs finished longer ago than the retention period"""
+        cutoff = time.time() - self.keep_finished
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
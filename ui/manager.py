@@ -1,56 +1,564 @@
 import os
+import re
 import json
+import queue
+import atexit
+import sqlite3
+import tempfile
+import threading
 from datetime import datetime
-from typing import Dict, List
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+from config import Config
+from ui.messages import ResultStore, encode_message, decode_message, message_key, result_refs, _legacy_result
+
+class ChatWriter:
+    """
+    Background thread applying chat writes in submission order, so persisting a chat never
+    blocks the Streamlit script. Pending writes are flushed before reads and at exit.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args):
+        """Queue a write, starting the writer thread on first use"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+        self._queue.put((fn, args))
+
+    def flush(self):
+        """Wait until every queued write has been applied"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self):
+        """Apply queued writes one at a time"""
+        while True:
+            fn, args = self._queue.get()
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Error writing chat: {e}")
+            finally:
+                self._queue.task_done()
+
+_writer = ChatWriter()
+
+# Sidebar metadata of the JSON chats, kept next to them; a dot file so chat scans skip it
+INDEX_FILENAME = ".index"
+
+def message_search_text(message: Dict) -> str:
+    """
+    Searchable text of a message: the question for user turns; for assistant turns the answer
+    text plus the sub-queries, SQL, entity matches and analysis summary, whether stored as
+    fields or, in older chats, as a result dict or its repr
+    """
+    content = message.get("content")
+    structured = message if "sub_queries" in message else None
+    if structured is None and message.get("role") == "assistant":
+        structured = _legacy_result(content)
+        if structured is not None:
+            content = None
+
+    parts = [content if isinstance(content, str) else json.dumps(content, default=str)] if content else []
+    for sub_query in (structured or {}).get("sub_queries", []):
+        parts += [sub_query.get("sub_query", ""), sub_query.get("sql_query", "")]
+        for entity in sub_query.get("entities", []):
+            parts += [entity.get("search_term", ""), entity.get("matched_value", "")]
+    analysis = (structured or {}).get("analysis") or {}
+    if isinstance(analysis, dict):
+        parts.append(str(analysis.get("summary", "")))
+    return "\n".join(part for part in parts if part)
+
+def fts_query(text: str) -> Optional[str]:
+    """FTS5 query matching all words of free text, the last one as a prefix while typing"""
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
 
 class ChatManager:
-    def __init__(self, chats_dir: str = "saved_chats"):
+    """
+    Stores each chat as a JSON snapshot plus an append-only journal of the messages added
+    since. Saving a turn appends one line per new message instead of rewriting the whole chat;
+    once the journal grows past compact_every lines it is folded into the snapshot, which is
+    always replaced atomically. Journal lines carry their message position, so replaying a
+    journal that was already compacted, or a torn last line, is harmless. The sidebar reads
+    titles from a small index file instead of the chats, which are only read when opened.
+    """
+
+    def __init__(self, chats_dir: str = "saved_chats", compact_every: int = Config.chat_journal_compact_every):
         self.chats_dir = chats_dir
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        # chat_id -> (messages in the snapshot, message_key of each stored message, mtime of the
+        # chat's files after the last write); re-read whenever the files changed since
+        self._persisted: Dict[str, Tuple[int, List[Tuple[str, str]], int]] = {}
+        self.results = ResultStore(os.path.join(chats_dir, "results"))
+        # result hash -> stored messages referring to it; counted on the first delete, then kept up to date
+        self._result_counts: Optional[Counter] = None
+        # chat_id -> title, timestamp and mtime of its files, loaded from the index on first use
+        self._index: Optional[Dict[str, Dict]] = None
+        # chat_id -> (queued writes, title, timestamp) of chats the background writer has not saved yet
+        self._pending: Dict[str, Tuple[int, str, str]] = {}
+        self._pending_lock = threading.Lock()
         os.makedirs(self.chats_dir, exist_ok=True)
+
+    def _chat_path(self, chat_id: str) -> str:
+        return os.path.join(self.chats_dir, f"{chat_id}.json")
+
+    @staticmethod
+    def _journal_path(file_path: str) -> str:
+        return f"{file_path[:-5]}.journal"
+
+    def save_chat_async(self, chat_id: str, messages: List[Dict]):
+        """Save a chat from the background writer, or right away when background writes are off"""
+        if Config.chat_background_writes:
+            self._queue_write(self.save_chat, chat_id, messages)
+        else:
+            self.save_chat(chat_id, messages)
+
+    def append_messages_async(self, chat_id: str, messages: List[Dict]):
+        """Append messages from the background writer, in order with the saves queued before them"""
+        if Config.chat_background_writes:
+            self._queue_write(self.append_messages, chat_id, messages)
+        else:
+            self.append_messages(chat_id, messages)
+
+    def _queue_write(self, fn: Callable, chat_id: str, messages: List[Dict]):
+        """Queue a write, listing the chat in the sidebar until the writer has applied it"""
+        with self._pending_lock:
+            writes, title, _ = self._pending.get(chat_id, (0, None, None))
+            self._pending[chat_id] = (writes + 1, title or self._generate_chat_title(messages),
+                                      datetime.now().isoformat())
+        _writer.submit(self._apply_write, fn, chat_id, list(messages))
+
+    def _apply_write(self, fn: Callable, chat_id: str, messages: List[Dict]):
+        """Run a queued write on the writer thread, then drop it from the pending chats"""
+        try:
+            fn(chat_id, messages)
+        finally:
+            with self._pending_lock:
+                writes, title, timestamp = self._pending[chat_id]
+                if writes > 1:
+                    self._pending[chat_id] = (writes - 1, title, timestamp)
+                else:
+                    del self._pending[chat_id]
+
+    def _pending_entries(self) -> Dict[str, Dict]:
+        """Title and timestamp of each chat with queued writes"""
+        with self._pending_lock:
+            return {chat_id: {"title": title, "timestamp": timestamp}
+                    for chat_id, (_, title, timestamp) in self._pending.items()}
+
+    def flush(self):
+        """Wait for queued background saves"""
+        _writer.flush()
+
+    def _flush_chat(self, chat_id: str):
+        """Wait for queued background saves when some of them are for chat_id"""
+        with self._pending_lock:
+            queued = chat_id in self._pending
+        if queued:
+            self.flush()
     
     def save_chat(self, chat_id: str, messages: List[Dict]):
-        """Save chat messages to a JSON file"""
+        """
+        Save chat messages, appending the ones added since the last save to the journal. The
+        stored messages are checked against the files on disk while holding the lock, so a save
+        from a session whose copy of the chat is out of date neither drops nor overwrites what
+        another session saved: when both appended different messages, this session's new ones
+        are appended after the other session's.
+        """
         if not messages:
             return
-        
-        # Create chat data structure
+
+        timestamp = datetime.now().isoformat()
+        with self._lock:
+            snapshot_length, stored = self._stored_keys(chat_id)
+            keys = [message_key(message) for message in messages]
+            common = 0
+            while common < min(len(stored), len(keys)) and stored[common] == keys[common]:
+                common += 1
+
+            diverged = common < len(stored)
+            if not diverged:
+                new_messages = messages[common:]
+            else:
+                # Another session saved messages this one has not seen; keep them and add ours after them
+                others = list(stored[common:])
+                new_messages = []
+                for key, message in zip(keys[common:], messages[common:]):
+                    if key in others:
+                        others.remove(key)
+                    else:
+                        new_messages.append(message)
+                if new_messages:
+                    print(f"Chat {chat_id} was changed by another session; appending after its messages")
+
+            self._append(chat_id, new_messages, snapshot_length, stored, timestamp,
+                         None if diverged else messages)
+
+    def append_messages(self, chat_id: str, messages: List[Dict]):
+        """
+        Append messages after whatever the stored chat holds, e.g. an answer finished in the
+        background after the session that asked for it moved on or closed
+        """
+        if not messages:
+            return
+        with self._lock:
+            snapshot_length, stored = self._stored_keys(chat_id)
+            self._append(chat_id, messages, snapshot_length, stored, datetime.now().isoformat())
+
+    def _append(self, chat_id: str, new_messages: List[Dict], snapshot_length: int,
+                stored: List[Tuple[str, str]], timestamp: str, chat: Optional[List[Dict]] = None):
+        """
+        Write new messages after the stored ones, compacting the journal when it is due; chat
+        is the whole chat when the caller has it, otherwise it is read back for compaction.
+        Call holding the lock.
+        """
+        if new_messages:
+            # Encoded once, so result sets are stored and counted once
+            new_messages = [encode_message(message, self.results) for message in new_messages]
+            self._count_results(new_messages)
+            if not stored:
+                self._write_snapshot(chat_id, new_messages, timestamp)
+                snapshot_length = len(new_messages)
+            else:
+                self._append_journal(chat_id, new_messages, len(stored), timestamp)
+            stored = stored + [message_key(message) for message in new_messages]
+            if len(stored) - snapshot_length >= self.compact_every:
+                if chat is None:
+                    chat = self._read_chat(self._chat_path(chat_id))[0]['messages']
+                self._write_snapshot(chat_id, chat, timestamp)
+                snapshot_length = len(stored)
+            if self._index is None:
+                self._index = self._read_index()
+            indexed = self._index.get(chat_id)
+            if chat is None and indexed is not None:
+                title = indexed["title"]
+            else:
+                title = self._generate_chat_title(chat if chat is not None else new_messages)
+            self._update_index(chat_id, {
+                "title": title,
+                "timestamp": timestamp,
+                "mtime": self._chat_mtime(chat_id)
+            })
+        self._persisted[chat_id] = (snapshot_length, stored, self._chat_mtime(chat_id))
+
+    def _stored_keys(self, chat_id: str) -> Tuple[int, List[Tuple[str, str]]]:
+        """Snapshot length and message keys of the chat on disk; call holding the lock"""
+        persisted = self._persisted.get(chat_id)
+        if persisted is not None and persisted[2] == self._chat_mtime(chat_id):
+            return persisted[0], persisted[1]
+        chat, snapshot_length = self._read_chat(self._chat_path(chat_id))
+        return snapshot_length, [message_key(message) for message in chat['messages']] if chat else []
+
+    def _append_journal(self, chat_id: str, messages: List[Dict], start: int, timestamp: str):
+        """Append messages, numbered from position start, to the chat's journal in a single write"""
+        lines = "".join(
+            json.dumps({"seq": seq, "timestamp": timestamp, "message": encode_message(message, self.results)},
+                       ensure_ascii=False) + "\n"
+            for seq, message in enumerate(messages, start=start)
+        )
+        with open(self._journal_path(self._chat_path(chat_id)), 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_snapshot(self, chat_id: str, messages: List[Dict], timestamp: str):
+        """Atomically replace the chat's snapshot, then drop the journal it now contains"""
         chat_data = {
             "chat_id": chat_id,
-            "timestamp": datetime.now().isoformat(),
-            "messages": messages,
+            "timestamp": timestamp,
+            "messages": [encode_message(message, self.results) for message in messages],
             "title": self._generate_chat_title(messages)
         }
-        
-        # Save to file
-        file_path = os.path.join(self.chats_dir, f"{chat_id}.json")
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(chat_data, f, indent=2, ensure_ascii=False)
+        file_path = self._chat_path(chat_id)
+        fd, tmp_path = tempfile.mkstemp(dir=self.chats_dir, prefix=f".{chat_id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(chat_data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        journal_path = self._journal_path(file_path)
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+
+    def compact(self, chat_id: str):
+        """Fold the chat's journal into its snapshot"""
+        with self._lock:
+            chat, _ = self._read_chat(self._chat_path(chat_id))
+            if chat is None:
+                return
+            self._write_snapshot(chat_id, chat['messages'], chat['timestamp'])
+            self._persisted[chat_id] = (len(chat['messages']), [message_key(message) for message in chat['messages']],
+                                        self._chat_mtime(chat_id))
+
+    def _referenced_results(self) -> Counter:
+        """Number of stored messages referring to each result hash, read from every chat; call holding the lock"""
+        counts = Counter()
+        for filename in os.listdir(self.chats_dir):
+            if not filename.endswith('.json') or filename.startswith('.'):
+                continue
+            chat, _ = self._read_chat(os.path.join(self.chats_dir, filename))
+            for message in chat['messages'] if chat else []:
+                counts.update(result_refs(message))
+        return counts
+
+    def _count_stored_results(self):
+        """Count the references of every stored chat and sweep unreferenced result sets; call holding the lock"""
+        self._result_counts = self._referenced_results()
+        self.results.sweep(set(self._result_counts))
+
+    def _count_results(self, records: List[Dict]):
+        """Count the references of newly stored records; call holding the lock"""
+        if self._result_counts is not None:
+            for record in records:
+                self._result_counts.update(result_refs(record))
+
+    def _release_results(self, records: List[Dict]):
+        """
+        Drop the references of removed records and delete the result sets nothing refers to any
+        more. The first call counts the references of every stored chat once, sweeping files left
+        by earlier processes; later calls only touch the removed records. Call holding the lock,
+        after the records were removed.
+        """
+        if self._result_counts is None:
+            self._count_stored_results()
+            return
+        for record in records:
+            for ref in result_refs(record):
+                self._result_counts[ref] -= 1
+                if self._result_counts[ref] <= 0:
+                    del self._result_counts[ref]
+                    self.results.remove(ref)
+
+    def _read_chat(self, file_path: str) -> Tuple[Optional[Dict], int]:
+        """
+        Read a chat snapshot and replay its journal
+
+        Returns:
+            Tuple of (chat or None if there is no snapshot, number of messages in the snapshot)
+        """
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                chat_data = json.load(f)
+        except FileNotFoundError:
+            return None, 0
+        snapshot_length = len(chat_data.get('messages', []))
+
+        journal_path = self._journal_path(file_path)
+        if os.path.exists(journal_path):
+            messages = chat_data.setdefault('messages', [])
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn write of a crashed session
+                    if entry['seq'] < len(messages):
+                        messages[entry['seq']] = entry['message']
+                    else:
+                        messages.append(entry['message'])
+                    chat_data['timestamp'] = entry['timestamp']
+            chat_data['title'] = self._generate_chat_title(messages)
+        return chat_data, snapshot_length
     
-    def load_chats(self) -> Dict:
-        """Load all saved chats from the directory"""
-        chats = {}
+    def _chat_mtime(self, chat_id: str) -> int:
+        """Latest modification time (ns) of one chat's snapshot and journal"""
+        file_path = self._chat_path(chat_id)
+        mtime = 0
+        for path in (file_path, self._journal_path(file_path)):
+            try:
+                mtime = max(mtime, os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                pass
+        return mtime
+
+    def _chat_mtimes(self) -> Dict[str, int]:
+        """Latest modification time (ns) of each chat's snapshot and journal, for chats with a snapshot"""
+        mtimes, snapshots = {}, set()
+        with os.scandir(self.chats_dir) as entries:
+            for entry in entries:
+                chat_id, extension = os.path.splitext(entry.name)
+                if extension not in ('.json', '.journal') or not entry.is_file():
+                    continue
+                if extension == '.json':
+                    snapshots.add(chat_id)
+                mtimes[chat_id] = max(mtimes.get(chat_id, 0), entry.stat().st_mtime_ns)
+        return {chat_id: mtime for chat_id, mtime in mtimes.items() if chat_id in snapshots}
+
+    def _read_index(self) -> Dict[str, Dict]:
+        """The index as last written, empty when it is missing or unreadable"""
+        try:
+            with open(os.path.join(self.chats_dir, INDEX_FILENAME), 'r', encoding='utf-8') as f:
+                return json.load(f)["chats"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _write_index(self):
+        """Atomically replace the index file; no fsync, since it can always be rebuilt from the chats"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.chats_dir, prefix=f"{INDEX_FILENAME}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"chats": self._index}, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(self.chats_dir, INDEX_FILENAME))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _update_index(self, chat_id: str, entry: Optional[Dict]):
+        """Set or, with None, drop one chat's index entry and persist the index; call holding the lock"""
+        if self._index is None:
+            self._index = self._read_index()
+        if entry is None:
+            self._index.pop(chat_id, None)
+        else:
+            self._index[chat_id] = entry
+        self._write_index()
+
+    def _chat_index(self) -> Dict[str, Dict]:
+        """
+        Sidebar metadata of every chat. Chats whose files changed since they were indexed, e.g.
+        by another process or a crash before the index was written, are re-read; the others
+        cost one directory scan. Chats with queued writes are listed as they will be once
+        written, without waiting for the writer.
+        """
+        # Taken first: a write applied after this is already in the files scanned below
+        pending = self._pending_entries()
+        with self._lock:
+            if self._index is None:
+                self._index = self._read_index()
+            mtimes = self._chat_mtimes()
+            changed = False
+            for chat_id in [chat_id for chat_id in self._index if chat_id not in mtimes]:
+                del self._index[chat_id]
+                changed = True
+            for chat_id, mtime in mtimes.items():
+                entry = self._index.get(chat_id)
+                if entry is not None and entry.get("mtime") == mtime:
+                    continue
+                try:
+                    chat_data, _ = self._read_chat(self._chat_path(chat_id))
+                except Exception as e:
+                    print(f"Error indexing chat {chat_id}: {e}")
+                    continue
+                self._index[chat_id] = {
+                    "title": chat_data.get('title') or self._generate_chat_title(chat_data.get('messages', [])),
+                    "timestamp": chat_data.get('timestamp', ''),
+                    "mtime": mtime
+                }
+                changed = True
+            if changed:
+                self._write_index()
+            index = dict(self._index)
+        for chat_id, entry in pending.items():
+            stored = index.get(chat_id)
+            index[chat_id] = entry if stored is None else {
+                **stored, "timestamp": max(stored["timestamp"], entry["timestamp"])
+            }
+        return index
+
+    def _stored_chats(self) -> List[Dict]:
+        """Every chat as stored, with message records and result sets left by reference"""
+        self.flush()
+        chats = []
         
         # List all JSON files in the chats directory
         for filename in os.listdir(self.chats_dir):
             if filename.endswith('.json'):
                 file_path = os.path.join(self.chats_dir, filename)
                 try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        chat_data = json.load(f)
-                        chat_id = chat_data.get('chat_id', filename[:-5])  # Remove .json
-                        chats[chat_id] = chat_data
+                    chat_data, _ = self._read_chat(file_path)
+                    chat_data.setdefault('chat_id', filename[:-5])  # Remove .json
+                    chats.append(chat_data)
                 except Exception as e:
                     print(f"Error loading chat {filename}: {e}")
         
         return chats
+
+    def _decoded(self, chat_data: Dict) -> Dict:
+        """Chat with its messages in session form, result sets loaded"""
+        return {
+            **chat_data,
+            "messages": [decode_message(message, self.results) for message in chat_data.get('messages', [])]
+        }
+    
+    def load_chats(self) -> Dict:
+        """Load all saved chats from the directory"""
+        return {chat['chat_id']: self._decoded(chat) for chat in self._stored_chats()}
+
+    def list_chats(self, limit: int = Config.chat_page_size, offset: int = 0) -> List[Dict]:
+        """Return a page of chat_id/title/timestamp entries, newest first, from the index"""
+        chats = sorted(self._chat_index().items(), key=lambda item: item[1]['timestamp'], reverse=True)
+        return [
+            {"chat_id": chat_id, "title": entry['title'], "timestamp": entry['timestamp']}
+            for chat_id, entry in chats[offset:offset + limit]
+        ]
+
+    def search_chats(self, text: str, limit: int = Config.chat_search_limit) -> List[Dict]:
+        """Messages containing all words of text, by linear scan; SQLiteChatManager ranks with FTS5"""
+        words = [word.lower() for word in re.findall(r"\w+", text)]
+        if not words:
+            return []
+        hits = []
+        for chat in sorted(self._stored_chats(), key=lambda chat: chat.get('timestamp', ''), reverse=True):
+            for seq, message in enumerate(chat.get('messages', [])):
+                body = message_search_text(message)
+                if all(word in body.lower() for word in words):
+                    hits.append({
+                        "chat_id": chat['chat_id'], "seq": seq, "role": message.get('role'),
+                        "snippet": body[:120], "title": chat['title'], "timestamp": chat['timestamp']
+                    })
+                    if len(hits) >= limit:
+                        return hits
+        return hits
+
+    def count_chats(self) -> int:
+        """Number of saved chats"""
+        return len(self._chat_index())
+
+    def load_chat(self, chat_id: str) -> Optional[Dict]:
+        """Load one chat with its messages, or None if it does not exist"""
+        self._flush_chat(chat_id)
+        try:
+            chat_data, _ = self._read_chat(self._chat_path(chat_id))
+            return self._decoded(chat_data) if chat_data else None
+        except Exception as e:
+            print(f"Error loading chat {chat_id}: {e}")
+            return None
     
     def delete_chat(self, chat_id: str) -> bool:
-        """Delete a chat file"""
+        """Delete a chat file and its journal"""
+        self.flush()
         try:
-            file_path = os.path.join(self.chats_dir, f"{chat_id}.json")
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                return True
+            file_path = self._chat_path(chat_id)
+            with self._lock:
+                self._persisted.pop(chat_id, None)
+                chat, _ = self._read_chat(file_path)
+                journal_path = self._journal_path(file_path)
+                if os.path.exists(journal_path):
+                    os.remove(journal_path)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    self._update_index(chat_id, None)
+                    self._release_results(chat['messages'] if chat else [])
+                    return True
             return False
         except Exception as e:
             print(f"Error deleting chat {chat_id}: {e}")
@@ -67,4 +575,286 @@ class ChatManager:
                 return title
         
         # Fallback title if no user messages found
-        return f"Chat {datetime.now().strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"Chat {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+
+class SQLiteChatManager(ChatManager):
+    """
+    Chat store backed by SQLite: a chats table holding the sidebar metadata and a messages
+    table holding one row per message. Listing titles is an indexed query instead of parsing
+    every chat, and messages are only read when a chat is opened. JSON chats found in
+    chats_dir are imported once on startup.
+    """
+
+    def __init__(self, db_path: str = Config.chat_db_path, chats_dir: str = "saved_chats"):
+        self.db_path = db_path
+        self.chats_dir = chats_dir
+        self._lock = threading.Lock()
+        self.results = ResultStore(os.path.join(os.path.dirname(db_path) or ".", "results"))
+        self._result_counts: Optional[Counter] = None
+        self._pending: Dict[str, Tuple[int, str, str]] = {}
+        self._pending_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        # Shared by the Streamlit sessions of the process, serialized by the lock
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self._create_tables()
+        if chats_dir and os.path.isdir(chats_dir):
+            self.migrate_json_chats(chats_dir)
+
+    def _create_tables(self):
+        """Create the chats and messages tables"""
+        with self._lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS chats (
+                    chat_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    timestamp TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_chats_timestamp ON chats (timestamp DESC);
+                CREATE TABLE IF NOT EXISTS messages (
+                    chat_id TEXT NOT NULL REFERENCES chats (chat_id) ON DELETE CASCADE,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (chat_id, seq)
+                );
+            """)
+            has_index = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'message_search'"
+            ).fetchone()
+            if not has_index:
+                # Full-text index over the searchable text of every message, kept in sync by _write_chat
+                self.conn.execute(
+                    "CREATE VIRTUAL TABLE message_search USING fts5 ("
+                    "chat_id UNINDEXED, seq UNINDEXED, role UNINDEXED, body, tokenize = 'porter unicode61')"
+                )
+                rows = self.conn.execute("SELECT chat_id, seq, role, content FROM messages").fetchall()
+                self.conn.executemany(
+                    "INSERT INTO message_search (chat_id, seq, role, body) VALUES (?, ?, ?, ?)",
+                    [
+                        (chat_id, seq, role, message_search_text(self._stored_message(role, content)))
+                        for chat_id, seq, role, content in rows
+                    ]
+                )
+
+    def migrate_json_chats(self, chats_dir: str) -> int:
+        """Import JSON chats not yet in the database, returning how many were imported"""
+        with self._lock:
+            known = {row[0] for row in self.conn.execute("SELECT chat_id FROM chats")}
+        imported = 0
+        for filename in sorted(os.listdir(chats_dir)):
+            if not filename.endswith('.json') or filename[:-5] in known:
+                continue
+            try:
+                chat_data, _ = self._read_chat(os.path.join(chats_dir, filename))
+            except Exception as e:
+                print(f"Error migrating chat {filename}: {e}")
+                continue
+            if chat_data is None:
+                continue
+            chat_id = chat_data.get('chat_id', filename[:-5])
+            if chat_id in known or not chat_data.get('messages'):
+                continue
+            self._write_chat(
+                chat_id, chat_data['messages'],
+                chat_data.get('title') or self._generate_chat_title(chat_data['messages']),
+                chat_data.get('timestamp') or datetime.now().isoformat()
+            )
+            imported += 1
+        return imported
+
+    def save_chat(self, chat_id: str, messages: List[Dict]):
+        """Save a chat, writing only the messages added since the last save"""
+        if not messages:
+            return
+        self._write_chat(chat_id, messages, self._generate_chat_title(messages), datetime.now().isoformat())
+
+    def append_messages(self, chat_id: str, messages: List[Dict]):
+        """Append messages after whatever the stored chat holds, e.g. an answer finished in the background"""
+        if not messages:
+            return
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO chats (chat_id, title, timestamp) VALUES (?, ?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET timestamp = excluded.timestamp",
+                (chat_id, self._generate_chat_title(messages), datetime.now().isoformat())
+            )
+            stored = self.conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,)
+            ).fetchone()[0]
+            self._insert_messages(chat_id, messages, stored)
+
+    def _write_chat(self, chat_id: str, messages: List[Dict], title: str, timestamp: str):
+        """Upsert the chat row and sync its messages in one transaction"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO chats (chat_id, title, timestamp) VALUES (?, ?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET title = excluded.title, timestamp = excluded.timestamp",
+                (chat_id, title, timestamp)
+            )
+            stored = self.conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,)
+            ).fetchone()[0]
+            removed = []
+            if stored > len(messages):
+                removed = self._chat_records(chat_id, len(messages))
+                self.conn.execute("DELETE FROM messages WHERE chat_id = ? AND seq >= ?", (chat_id, len(messages)))
+                self.conn.execute("DELETE FROM message_search WHERE chat_id = ? AND seq >= ?", (chat_id, len(messages)))
+            self._insert_messages(chat_id, messages[stored:], stored)
+        if removed:
+            # Only once the transaction committed, so a rollback cannot leave references to removed files
+            with self._lock:
+                self._release_results(removed)
+
+    def _insert_messages(self, chat_id: str, messages: List[Dict], start: int):
+        """Insert messages numbered from position start, with their search rows; call in a transaction"""
+        new_messages = [
+            (seq, encode_message(message, self.results))
+            for seq, message in enumerate(messages, start=start)
+        ]
+        self._count_results([message for _, message in new_messages])
+        self.conn.executemany(
+            "INSERT INTO messages (chat_id, seq, role, content) VALUES (?, ?, ?, ?)",
+            [
+                # Messages without a typed form keep the original row format, the content alone
+                (chat_id, seq, message.get("role", ""),
+                 json.dumps(message if "schema" in message else message.get("content"), ensure_ascii=False))
+                for seq, message in new_messages
+            ]
+        )
+        self.conn.executemany(
+            "INSERT INTO message_search (chat_id, seq, role, body) VALUES (?, ?, ?, ?)",
+            [(chat_id, seq, message.get("role", ""), message_search_text(message)) for seq, message in new_messages]
+        )
+
+    def _referenced_results(self) -> Counter:
+        """Number of stored messages referring to each result hash; call holding the lock"""
+        rows = self.conn.execute(
+            "SELECT DISTINCT messages.chat_id, messages.seq, json_extract(sub_query.value, '$.result_ref') "
+            "FROM messages, json_each(messages.content, '$.sub_queries') AS sub_query "
+            "WHERE json_type(messages.content) = 'object'"
+        )
+        return Counter(ref for _, _, ref in rows if ref)
+
+    def _chat_records(self, chat_id: str, start: int = 0) -> List[Dict]:
+        """Stored records of a chat's messages from position start; call holding the lock"""
+        rows = self.conn.execute(
+            "SELECT role, content FROM messages WHERE chat_id = ? AND seq >= ? ORDER BY seq", (chat_id, start)
+        )
+        return [self._stored_message(role, content) for role, content in rows]
+
+    @staticmethod
+    def _stored_message(role: str, content: str) -> Dict:
+        """Message of a row: a typed record, or the content alone for rows saved before the schema"""
+        stored = json.loads(content)
+        if isinstance(stored, dict) and "schema" in stored:
+            return stored
+        return {"role": role, "content": stored}
+
+    def search_chats(self, text: str, limit: int = Config.chat_search_limit) -> List[Dict]:
+        """Rank messages matching all words of text with BM25, best first"""
+        query = fts_query(text)
+        if query is None:
+            return []
+        self.flush()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT s.chat_id, s.seq, s.role, snippet(message_search, 3, '**', '**', '…', 12), c.title, c.timestamp "
+                "FROM message_search s JOIN chats c ON c.chat_id = s.chat_id "
+                "WHERE message_search MATCH ? ORDER BY rank LIMIT ?",
+                (query, limit)
+            ).fetchall()
+        return [
+            {"chat_id": chat_id, "seq": seq, "role": role, "snippet": snippet, "title": title, "timestamp": timestamp}
+            for chat_id, seq, role, snippet, title, timestamp in rows
+        ]
+
+    def _pending_chats(self) -> Tuple[Dict[str, Dict], int]:
+        """
+        Sidebar entries of the chats with queued writes, keeping the stored title of those
+        already saved, and how many are not saved yet; call holding the lock
+        """
+        pending = self._pending_entries()
+        stored = 0
+        if pending:
+            placeholders = ", ".join("?" * len(pending))
+            for chat_id, title, timestamp in self.conn.execute(
+                f"SELECT chat_id, title, timestamp FROM chats WHERE chat_id IN ({placeholders})", list(pending)
+            ):
+                pending[chat_id] = {"title": title, "timestamp": max(timestamp, pending[chat_id]["timestamp"])}
+                stored += 1
+        return pending, len(pending) - stored
+
+    def list_chats(self, limit: int = Config.chat_page_size, offset: int = 0) -> List[Dict]:
+        """
+        Return a page of chat_id/title/timestamp entries, newest first; chats with queued
+        writes are listed as they will be once written, without waiting for the writer
+        """
+        with self._lock:
+            pending, _ = self._pending_chats()
+            # The page of the merged list lies within this many of the newest stored chats
+            rows = self.conn.execute(
+                "SELECT chat_id, title, timestamp FROM chats ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+                (offset + limit + len(pending), 0) if pending else (limit, offset)
+            ).fetchall()
+        chats = [{"chat_id": chat_id, "title": title, "timestamp": timestamp}
+                 for chat_id, title, timestamp in rows if chat_id not in pending]
+        if not pending:
+            return chats
+        chats += [{"chat_id": chat_id, **entry} for chat_id, entry in pending.items()]
+        chats.sort(key=lambda chat: chat['timestamp'], reverse=True)
+        return chats[offset:offset + limit]
+
+    def count_chats(self) -> int:
+        """Number of saved chats, counting those whose first write is still queued"""
+        with self._lock:
+            _, unsaved = self._pending_chats()
+            return self.conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0] + unsaved
+
+    def load_chat(self, chat_id: str) -> Optional[Dict]:
+        """Load one chat with its messages, or None if it does not exist"""
+        self._flush_chat(chat_id)
+        with self._lock:
+            chat = self.conn.execute(
+                "SELECT chat_id, title, timestamp FROM chats WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            if chat is None:
+                return None
+            rows = self.conn.execute(
+                "SELECT role, content FROM messages WHERE chat_id = ? ORDER BY seq", (chat_id,)
+            ).fetchall()
+        return {
+            "chat_id": chat[0],
+            "title": chat[1],
+            "timestamp": chat[2],
+            "messages": [decode_message(self._stored_message(role, content), self.results) for role, content in rows],
+        }
+
+    def load_chats(self) -> Dict:
+        """Load all chats with their messages"""
+        with self._lock:
+            chat_ids = [row[0] for row in self.conn.execute("SELECT chat_id FROM chats ORDER BY timestamp DESC")]
+        return {chat_id: self.load_chat(chat_id) for chat_id in chat_ids}
+
+    def delete_chat(self, chat_id: str) -> bool:
+        """Delete a chat and its messages"""
+        self.flush()
+        try:
+            with self._lock, self.conn:
+                removed = self._chat_records(chat_id)
+                deleted = self.conn.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,)).rowcount
+                self.conn.execute("DELETE FROM message_search WHERE chat_id = ?", (chat_id,))
+            if deleted:
+                with self._lock:
+                    self._release_results(removed)
+            # A migrated JSON file would otherwise be imported again on the next start
+            if self.chats_dir:
+                json_path = os.path.join(self.chats_dir, f"{chat_id}.json")
+                for path in (json_path, self._journal_path(json_path)):
+                    if os.path.exists(path):
+                        os.remove(path)
+            return deleted > 0
+        except Exception as e:
+            print(f"Error deleting chat {chat_id}: {e}")
+            return False
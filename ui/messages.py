@@ -0,0 +1,322 @@
+import os
+import ast
+import sys
+import json
+import gzip
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Set, Tuple
+from config import Config
+
+MESSAGE_SCHEMA = 1
+
+@dataclass
+class EntityMatch:
+    search_term: str
+    column: str
+    matched_value: str
+    score: float = 0
+
+@dataclass
+class SubQueryRecord:
+    sub_query: str
+    table: str
+    sql_query: str
+    entities: List[EntityMatch] = field(default_factory=list)
+    success: bool = False
+    error: Optional[str] = None
+    row_count: int = 0
+    rows: Optional[List[Dict]] = None  # Small result sets are kept inline
+    result_ref: Optional[str] = None  # Content hash of a larger result set in the ResultStore
+
+@dataclass
+class ChatMessage:
+    """
+    Stored form of a chat message. Questions, SQL, entity matches and analysis are fields
+    rather than a stringified dict, and result sets live in the ResultStore by reference.
+    """
+    role: str
+    content: str = ""  # User question, formatted answer or error text
+    sub_queries: List[SubQueryRecord] = field(default_factory=list)
+    analysis: Dict = field(default_factory=dict)
+
+    def to_record(self) -> Dict:
+        return {"schema": MESSAGE_SCHEMA, **asdict(self)}
+
+    @classmethod
+    def from_record(cls, record: Dict) -> "ChatMessage":
+        sub_queries = [
+            SubQueryRecord(**{
+                **sub_query,
+                "entities": [EntityMatch(**entity) for entity in sub_query.get("entities", [])]
+            })
+            for sub_query in record.get("sub_queries", [])
+        ]
+        return cls(record["role"], record.get("content", ""), sub_queries, record.get("analysis") or {})
+
+class ResultStore:
+    """
+    Result sets stored once per content hash, optionally gzip-compressed. Identical results
+    from reruns or different chats share one file, and recently read sets are memoized.
+    """
+
+    def __init__(self, results_dir: str, compress: bool = Config.chat_results_compress,
+                 memo_size: int = 64):
+        self.results_dir = results_dir
+        self.compress = compress
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, ref: str, compressed: bool) -> str:
+        return os.path.join(self.results_dir, f"{ref}.json.gz" if compressed else f"{ref}.json")
+
+    def put(self, rows: List[Dict]) -> str:
+        """Store a result set unless an identical one exists, returning its content hash"""
+        payload = json.dumps(rows, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+        ref = hashlib.sha256(payload).hexdigest()[:32]
+        if os.path.exists(self._path(ref, True)) or os.path.exists(self._path(ref, False)):
+            return ref
+
+        os.makedirs(self.results_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.results_dir, suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(gzip.compress(payload, mtime=0) if self.compress else payload)
+        os.replace(tmp_path, self._path(ref, self.compress))
+        return ref
+
+    def sweep(self, keep: Set[str]) -> int:
+        """Remove the result sets whose content hash is not in keep, returning how many were removed"""
+        try:
+            names = os.listdir(self.results_dir)
+        except FileNotFoundError:
+            return 0
+        removed = 0
+        for name in names:
+            ref = name.split('.', 1)[0]
+            if not name.endswith(('.json', '.json.gz')) or ref in keep:
+                continue
+            try:
+                os.remove(os.path.join(self.results_dir, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            for ref in [ref for ref in self._memo if ref not in keep]:
+                del self._memo[ref]
+        return removed
+
+    def remove(self, ref: str):
+        """Delete one result set"""
+        for compressed in (True, False):
+            try:
+                os.remove(self._path(ref, compressed))
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._memo.pop(ref, None)
+
+    def get(self, ref: str) -> List[Dict]:
+        """Load a result set by content hash"""
+        with self._lock:
+            if ref in self._memo:
+                self._memo.move_to_end(ref)
+                return self._memo[ref]
+
+        path = self._path(ref, True)
+        try:
+            if os.path.exists(path):
+                with gzip.open(path, 'rb') as f:
+                    rows = json.loads(f.read())
+            else:
+                with open(self._path(ref, False), 'rb') as f:
+                    rows = json.loads(f.read())
+        except (OSError, ValueError) as e:
+            print(f"Error loading result set {ref}: {e}")
+            return []
+
+        with self._lock:
+            self._memo[ref] = rows
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return rows
+
+def assistant_message(results: Dict, text: str) -> Dict:
+    """Session message for a pipeline answer: the formatted text plus its sub-queries and analysis"""
+    executed = {}
+    for step in results.get("steps", []):
+        if step.get("step") == "Query Execution":
+            # Repair rounds re-execute failed sub-queries; the last execution wins
+            for result in step.get("results", []):
+                executed[result.get("sub_query_number", len(executed))] = result
+
+    sub_queries = []
+    for result in executed.values():
+        sub_queries.append({
+            "sub_query": result.get("query", ""),
+            "table": result.get("table", ""),
+            "entities": result.get("entities", []),
+            "sql_query": result.get("executed_sql") or result.get("sql_query", ""),
+            "execution_results": {
+                "success": not result.get("error"),
+                "error": result.get("error"),
+                "data": result.get("results", []),
+            },
+        })
+    analysis = (results.get("analysis") or {}).get("analysis") or {}
+    return {"role": "assistant", "content": text, "sub_queries": sub_queries, "analysis": analysis}
+
+def _legacy_result(content) -> Optional[Dict]:
+    """Assistant content saved as a result dict or its Python repr, else None"""
+    if isinstance(content, str) and content.startswith("{"):
+        try:
+            content = ast.literal_eval(content)
+        except (ValueError, SyntaxError):
+            return None
+    return content if isinstance(content, dict) and "sub_queries" in content else None
+
+def message_key(message: Dict) -> Tuple[str, str]:
+    """Role and text of a session message or stored record, equal for both forms of the same message"""
+    content = message.get("content")
+    legacy = _legacy_result(content) if message.get("role") == "assistant" and "schema" not in message else None
+    if legacy is not None:
+        analysis = legacy.get("analysis") or {}
+        content = analysis.get("summary", "") if isinstance(analysis, dict) else ""
+    elif not isinstance(content, str):
+        content = json.dumps(content, sort_keys=True, default=str)
+    return message.get("role", ""), content or ""
+
+def result_refs(record: Dict) -> Set[str]:
+    """Content hashes of the result sets a stored record refers to"""
+    if "schema" not in record:
+        return set()
+    return {sub_query["result_ref"] for sub_query in record.get("sub_queries", []) if sub_query.get("result_ref")}
+
+def encode_message(message: Dict, store: ResultStore) -> Dict:
+    """Stored record of a session message, moving result sets above the inline limit to the store"""
+    if "schema" in message:
+        return message
+
+    content = message.get("content")
+    sub_queries = message.get("sub_queries")
+    analysis = message.get("analysis")
+    legacy = _legacy_result(content) if message.get("role") == "assistant" else None
+    if legacy is not None:
+        sub_queries = legacy.get("sub_queries", [])
+        analysis = legacy.get("analysis") or {}
+        content = analysis.get("summary", "") if isinstance(analysis, dict) else ""
+    elif not isinstance(content, str):
+        # Other structured content has no typed form and is stored as it is
+        return message
+
+    records = []
+    for sub_query in sub_queries or []:
+        execution = sub_query.get("execution_results") or {}
+        rows = execution.get("data") or []
+        inline = len(rows) <= Config.chat_inline_rows
+        records.append(SubQueryRecord(
+            sub_query=sub_query.get("sub_query", ""),
+            table=sub_query.get("table", ""),
+            sql_query=sub_query.get("sql_query", ""),
+            entities=[
+                EntityMatch(entity.get("search_term", ""), entity.get("column", ""),
+                            entity.get("matched_value", ""), entity.get("score", 0))
+                for entity in sub_query.get("entities", [])
+            ],
+            success=bool(execution.get("success")),
+            error=execution.get("error"),
+            row_count=len(rows),
+            rows=rows if inline else None,
+            result_ref=None if inline else store.put(rows),
+        ))
+    return ChatMessage(message.get("role", ""), content or "", records, analysis or {}).to_record()
+
+def decode_message(record: Dict, store: ResultStore) -> Dict:
+    """Session message of a stored record; messages saved before the schema are returned as they are"""
+    if "schema" not in record:
+        return record
+
+    message = ChatMessage.from_record(record)
+    decoded = {"role": message.role, "content": message.content}
+    if message.sub_queries or message.analysis:
+        decoded["sub_queries"] = [
+            {
+                "sub_query": sub_query.sub_query,
+                "table": sub_query.table,
+                "entities": [asdict(entity) for entity in sub_query.entities],
+                "sql_query": sub_query.sql_query,
+                "execution_results": {
+                    "success": sub_query.success,
+                    "error": sub_query.error,
+                    "data": sub_query.rows if sub_query.result_ref is None else store.get(sub_query.result_ref),
+                },
+            }
+            for sub_query in message.sub_queries
+        ]
+        decoded["analysis"] = message.analysis
+    return decoded
+
+def _directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+def convert_chats(chats_dir: str) -> Dict:
+    """
+    Rewrite the JSON chats in chats_dir as typed records and report disk usage and the time
+    to load every chat with its results before and after
+    """
+    from ui.manager import ChatManager
+
+    manager = ChatManager(chats_dir)
+    filenames = sorted(name for name in os.listdir(chats_dir) if name.endswith('.json'))
+    size_before = _directory_size(chats_dir)
+
+    started_at = time.perf_counter()
+    for filename in filenames:
+        with open(os.path.join(chats_dir, filename), 'r', encoding='utf-8') as f:
+            chat = json.load(f)
+        for message in chat.get('messages', []):
+            _legacy_result(message.get('content'))
+    load_before = time.perf_counter() - started_at
+
+    converted = 0
+    for filename in filenames:
+        chat, _ = manager._read_chat(os.path.join(chats_dir, filename))
+        if chat and any("schema" not in message for message in chat.get('messages', [])):
+            manager._write_snapshot(chat['chat_id'], chat['messages'], chat['timestamp'])
+            converted += 1
+
+    manager.results._memo.clear()
+    started_at = time.perf_counter()
+    manager.load_chats()
+    load_after = time.perf_counter() - started_at
+
+    return {
+        "chats": len(filenames),
+        "converted": converted,
+        "bytes_before": size_before,
+        "bytes_after": _directory_size(chats_dir),
+        "load_seconds_before": load_before,
+        "load_seconds_after": load_after,
+    }
+
+if __name__ == "__main__":
+    # Usage: python -m ui.messages [chats_dir] [--copy]
+    args = [arg for arg in sys.argv[1:] if arg != "--copy"]
+    chats_dir = args[0] if args else "saved_chats"
+    if "--copy" in sys.argv:
+        # Measure on a scratch copy and leave the originals untouched
+        copy_dir = os.path.join(tempfile.mkdtemp(), "chats")
+        shutil.copytree(chats_dir, copy_dir, ignore=shutil.ignore_patterns("chats.db*"))
+        chats_dir = copy_dir
+    stats = convert_chats(chats_dir)
+    print(f"Converted {stats['converted']} of {stats['chats']} chats in {chats_dir}")
+    print(f"Disk usage: {stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes")
+    print(f"Load time: {stats['load_seconds_before'] * 1000:.1f} -> {stats['load_seconds_after'] * 1000:.1f} ms")
@@ -0,0 +1,78 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import pandas as pd
+from config import Config
+
+# Aggregations offered when the same row/column cell holds several values
+AGGREGATIONS = ["sum", "mean", "min", "max", "count"]
+
+CHANGE = "Change"
+CHANGE_PCT = "Change %"
+
+@dataclass
+class PivotSpec:
+    """How to re-slice a cached result: filters first, then an optional pivot, then the sort"""
+    filters: Dict[str, List] = field(default_factory=dict)  # Column -> values to keep
+    rows: List[str] = field(default_factory=list)  # Columns to group rows by
+    columns: Optional[str] = None  # Column whose values become columns, e.g. Month
+    value: Optional[str] = None  # Numeric column to aggregate
+    aggfunc: str = "sum"
+    sort_by: Optional[str] = None
+    descending: bool = True
+
+def dimension_columns(frame: pd.DataFrame, max_values: int = Config.ui_pivot_max_values) -> List[str]:
+    """Non-numeric columns with few enough distinct values to filter and group by"""
+    return [column for column in frame.columns
+            if not pd.api.types.is_numeric_dtype(frame[column]) and frame[column].nunique() <= max_values]
+
+def measure_columns(frame: pd.DataFrame) -> List[str]:
+    """Numeric columns that can be aggregated"""
+    return [column for column in frame.columns if pd.api.types.is_numeric_dtype(frame[column])]
+
+def apply_filters(frame: pd.DataFrame, filters: Dict[str, List]) -> pd.DataFrame:
+    """Keep the rows whose values are among the selected ones, using one combined boolean mask"""
+    mask = pd.Series(True, index=frame.index)
+    for column, values in filters.items():
+        if values:
+            mask &= frame[column].isin(values)
+    return frame[mask]
+
+def pivot_result(frame: pd.DataFrame, spec: PivotSpec) -> pd.DataFrame:
+    """
+    Re-slice a cached result in memory. With a column to pivot, its values become columns and
+    Change / Change % compare the last of them with the first, e.g. the last month with the
+    first. Raises ValueError for a spec that does not fit the frame.
+    """
+    unknown = [column for column in [*spec.filters, *spec.rows, spec.columns, spec.value, spec.sort_by]
+               if column and column not in frame.columns and column not in (CHANGE, CHANGE_PCT)]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(map(str, unknown))}")
+    if spec.aggfunc not in AGGREGATIONS:
+        raise ValueError(f"Unsupported aggregation: {spec.aggfunc}")
+    if spec.columns and spec.columns in spec.rows:
+        raise ValueError(f"{spec.columns} cannot be both a row and a column")
+
+    result = apply_filters(frame, spec.filters)
+    if spec.value and (spec.rows or spec.columns):
+        if spec.columns:
+            result = result.pivot_table(index=spec.rows or None, columns=spec.columns, values=spec.value,
+                                        aggfunc=spec.aggfunc, observed=True, sort=True)
+            if not spec.rows:
+                # A single total row per pivoted column
+                result = result.to_frame().T if isinstance(result, pd.Series) else result
+            result.columns = [str(column) for column in result.columns]
+            if len(result.columns) > 1:
+                first, last = result.iloc[:, 0], result.iloc[:, -1]
+                result[CHANGE] = last - first
+                result[CHANGE_PCT] = result[CHANGE] / first.abs().where(first != 0)
+        else:
+            result = result.groupby(spec.rows, observed=True, sort=True)[spec.value].agg(spec.aggfunc).to_frame()
+        result = result.reset_index() if spec.rows else result.reset_index(drop=True)
+
+    return sort_result(result.reset_index(drop=True), spec.sort_by, spec.descending)
+
+def sort_result(frame: pd.DataFrame, column: Optional[str], descending: bool = True) -> pd.DataFrame:
+    """Sort by one column with missing values last; no column or an unknown one keeps the order"""
+    if not column or column not in frame.columns:
+        return frame
+    return frame.sort_values(column, ascending=not descending, na_position="last").reset_index(drop=True)
@@ -0,0 +1,158 @@
+import re
+import calendar
+from typing import List, Optional, Tuple
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12
+}
+
+_MONTH_PATTERN = (
+    r'(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|'
+    r'aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)'
+)
+
+# Keyword rules for the aggregation intent, checked in order
+AGGREGATION_RULES = [
+    ("trend", r'\b(trends?|over time|monthly|month[- ]over[- ]month|by month|each month|per month)\b'),
+    ("rank", r'\b(highest|lowest|top|bottom|rank(?:ed|ing)?|best|worst|most|least)\b'),
+    ("compare", r'\b(compare|comparison|versus|vs\.?|between|higher|lower|greater|more than|less than)\b'),
+]
+
+# Words that flip a ranking to ascending order
+ASCENDING_WORDS = r'\b(lowest|least|worst|bottom|smallest|minimum|min)\b'
+
+# Aggregate functions asked for by name, checked in order; anything else is a sum
+FUNCTION_RULES = [
+    ("avg", r'\b(average|avg|mean)\b'),
+    ("count", r'\b(how many|number of|count)\b'),
+    ("change", r'\b(yoy|year[- ]over[- ]year|change|growth|grew|increase|decrease)\b'),
+]
+
+_NUMBER_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'ten': 10}
+
+def _month_start(year: int, month: int) -> str:
+    return f"{year:04d}-{month:02d}-01"
+
+def _month_range(year: int, first: int, last: int) -> List[str]:
+    return [_month_start(year, m) for m in range(first, last + 1)]
+
+def resolve_periods(query: str, default_year: int = None) -> List[str]:
+    """
+    Resolve the time periods mentioned in a query to month-start dates (YYYY-MM-01),
+    matching the format of the Month column. Handles months ("Dec 2024", "2024-06"),
+    quarters ("Q3 2024"), halves ("H1 2023", "last six months of 2023") and bare years.
+    Months without a year ("and for July?") resolve to default_year when it is given.
+    Returns a sorted list of unique dates, empty when no period is mentioned.
+    """
+    periods, _ = _scan_periods(query, default_year)
+    return periods
+
+def mask_periods(query: str, default_year: int = None) -> str:
+    """Lower-case the query and replace every period mention with a <period> placeholder"""
+    _, masked = _scan_periods(query, default_year)
+    return masked
+
+def _scan_periods(query: str, default_year: int = None) -> Tuple[List[str], str]:
+    """Resolve period mentions and return them with the query text where they are masked"""
+    text = query.lower()
+    periods = set()
+
+    def consume(pattern, handler):
+        nonlocal text
+        for match in re.finditer(pattern, text):
+            periods.update(handler(match))
+        text = re.sub(pattern, ' <period> ', text)
+
+    # ISO dates: 2024-06 or 2024-06-01
+    consume(r'\b(\d{4})-(\d{2})(?:-\d{2})?\b',
+            lambda m: [_month_start(int(m.group(1)), int(m.group(2)))])
+
+    # Quarters: Q3 2024 / 2024 Q3
+    consume(r'\bq([1-4])\s*(?:of\s+)?(\d{4})\b',
+            lambda m: _month_range(int(m.group(2)), 3 * int(m.group(1)) - 2, 3 * int(m.group(1))))
+    consume(r'\b(\d{4})\s*q([1-4])\b',
+            lambda m: _month_range(int(m.group(1)), 3 * int(m.group(2)) - 2, 3 * int(m.group(2))))
+
+    # Halves: H1 2023, first half of 2023, last six months of 2023
+    consume(r'\b(?:h1|first half(?: of)?|first six months(?: of)?)\s+(\d{4})\b',
+            lambda m: _month_range(int(m.group(1)), 1, 6))
+    consume(r'\b(?:h2|second half(?: of)?|last six months(?: of)?)\s+(\d{4})\b',
+            lambda m: _month_range(int(m.group(1)), 7, 12))
+
+    # Month ranges within a year: "June to August 2024"
+    consume(r'\b' + _MONTH_PATTERN + r'\s*(?:to|through|-)\s*' + _MONTH_PATTERN + r',?\s*(?:of\s+)?(\d{4})\b',
+            lambda m: _month_range(int(m.group(3)), MONTHS[m.group(1)[:3]], MONTHS[m.group(2)[:3]]))
+
+    # Months, allowing a shared year: "July 2023 or August 2023", "June and July 2024"
+    month_list = _MONTH_PATTERN + r'(?:\s*(?:,|and|or)\s*' + _MONTH_PATTERN + r')*'
+    def months_with_year(match):
+        year = int(match.group('year'))
+        names = re.findall(_MONTH_PATTERN, match.group('months'))
+        return [_month_start(year, MONTHS[name[:3]]) for name in names]
+    consume(r'\b(?P<months>' + month_list + r')\.?,?\s*(?:of\s+)?(?P<year>\d{4})\b', months_with_year)
+
+    # Bare years: "in 2022"
+    consume(r'\b(20\d{2})\b', lambda m: _month_range(int(m.group(1)), 1, 12))
+
+    if default_year is not None:
+        consume(r'\b' + _MONTH_PATTERN + r'\b', lambda m: [_month_start(default_year, MONTHS[m.group(1)[:3]])])
+
+    return sorted(periods), re.sub(r'\s+', ' ', text).strip()
+
+def move_month(sql_query: str, old_period: str, new_period: str) -> Optional[str]:
+    """
+    Move the first and last day-of-month literals of one month in a SQL statement to another
+    month, or return None when the old month is spelled in a way that cannot be moved safely
+    """
+    old_year, old_month = int(old_period[:4]), int(old_period[5:7])
+    new_year, new_month = int(new_period[:4]), int(new_period[5:7])
+    old_last = calendar.monthrange(old_year, old_month)[1]
+    new_last = calendar.monthrange(new_year, new_month)[1]
+
+    def replace(match):
+        day = int(match.group(1))
+        if day == 1:
+            return f"'{new_year:04d}-{new_month:02d}-01'"
+        if day == old_last:
+            return f"'{new_year:04d}-{new_month:02d}-{new_last:02d}'"
+        raise ValueError(f"Cannot move day {day} to another month")
+
+    old_prefix = f"{old_year:04d}-{old_month:02d}"
+    if old_prefix not in sql_query:
+        return None
+    try:
+        sql_query = re.sub(rf"'{old_prefix}-(\d{{2}})'", replace, sql_query)
+    except ValueError:
+        return None
+    # Any other spelling of the old month, e.g. LIKE '2023-11%', was not moved
+    return None if old_prefix in sql_query else sql_query
+
+def detect_direction(query: str) -> str:
+    """Sort direction a ranking question asks for: asc for lowest, least and the like, otherwise desc"""
+    return "asc" if re.search(ASCENDING_WORDS, query.lower()) else "desc"
+
+def detect_limit(query: str) -> Optional[int]:
+    """Number of rows asked for by "top 3", "bottom five" and the like, None when not limited"""
+    match = re.search(r'\b(?:top|bottom|best|worst|first|last)\s+(\d+|' + '|'.join(_NUMBER_WORDS) + r')\b',
+                      query.lower())
+    if match is None:
+        return None
+    value = match.group(1)
+    return int(value) if value.isdigit() else _NUMBER_WORDS[value]
+
+def detect_function(query: str) -> str:
+    """Aggregate function a question asks for: avg, count, change or sum"""
+    text = query.lower()
+    for name, pattern in FUNCTION_RULES:
+        if re.search(pattern, text):
+            return name
+    return "sum"
+
+def detect_aggregation(query: str) -> str:
+    """Detect the aggregation intent of a query: trend, rank, compare or total"""
+    text = query.lower()
+    for name, pattern in AGGREGATION_RULES:
+        if re.search(pattern, text):
+            return name
+    return "total"
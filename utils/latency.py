@@ -0,0 +1,71 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+from config import Config
+
+class LatencyTracker:
+    """
+    Sliding window of recent successful call latencies per pipeline stage and model. Derives an
+    adaptive timeout from a high percentile and the delay after which a request is worth hedging.
+    Keying on the model keeps calls escalated to a larger, slower model from timing out against
+    the smaller model's latencies. Until a stage and model have enough samples it falls back to
+    the static HTTP timeout and never hedges.
+    """
+
+    def __init__(self, window: int = Config.latency_window, min_samples: int = Config.latency_min_samples):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[Tuple[str, str], Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, model: str, seconds: float):
+        """Record the latency of a successful call"""
+        with self._lock:
+            self._samples.setdefault((stage, model), deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, stage: str, model: str, q: float) -> Optional[float]:
+        """The q-th quantile (0-1) of recent latencies, or None without enough samples"""
+        with self._lock:
+            samples = sorted(self._samples.get((stage, model), ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def timeout_for(self, stage: str, model: str) -> float:
+        """Request timeout: a multiple of the high-percentile latency, within the configured bounds"""
+        high = self.percentile(stage, model, Config.timeout_percentile)
+        if high is None:
+            return Config.http_timeout
+        return min(Config.http_timeout, max(Config.min_llm_timeout, high * Config.timeout_multiplier))
+
+    def hedge_delay(self, stage: str, model: str) -> Optional[float]:
+        """Seconds to wait before sending a duplicate request, or None when hedging does not apply"""
+        if not Config.hedging_enabled:
+            return None
+        return self.percentile(stage, model, Config.hedge_percentile)
+
+class HedgeBudget:
+    """Caps hedged requests at a fraction of all requests so duplicates stay a bounded cost"""
+
+    def __init__(self, ratio: float = Config.hedge_budget, burst: int = Config.hedge_burst):
+        self.ratio = ratio
+        self.burst = burst
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        """Count a primary request; each one earns a fraction of a hedge"""
+        with self._lock:
+            self.requests += 1
+
+    def try_acquire(self) -> bool:
+        """Take one hedge from the budget, or False when it is spent"""
+        with self._lock:
+            if self.hedges >= int(self.ratio * self.requests) + self.burst:
+                return False
+            self.hedges += 1
+            return True
+
+LATENCY = LatencyTracker()
+HEDGE_BUDGET = HedgeBudget()
@@ -0,0 +1,186 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import httpx
+from anthropic import Anthropic
+from config import Config, StageRoute
+from utils.telemetry import TELEMETRY, record_call
+from utils.singleflight import SingleFlight
+from utils.latency import LATENCY, HEDGE_BUDGET
+
+# Stage of the call in progress, so calls made inside wrapped callables are attributed to it
+_stage: ContextVar[str] = ContextVar("llm_stage", default=None)
+
+# Identical requests in flight anywhere in the process share one API call
+_in_flight = SingleFlight()
+
+# Runs requests that may be hedged; a losing request finishes here in the background
+_hedge_pool = ThreadPoolExecutor(max_workers=Config.http_max_connections, thread_name_prefix="llm-hedge")
+
+# One client per API key and endpoint for the whole process, see get_client
+_clients: Dict[Tuple[str, Optional[str]], Anthropic] = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_key: str, base_url: str = None) -> Anthropic:
+    """
+    Return the process-wide Anthropic client for an API key. Every component and every
+    Streamlit rerun shares its HTTP connection pool, so keep-alive connections are reused
+    instead of paying a new TLS handshake per client.
+    """
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=Config.http_max_connections,
+                    max_keepalive_connections=Config.http_max_keepalive_connections,
+                    keepalive_expiry=Config.http_keepalive_expiry,
+                ),
+                timeout=Config.http_timeout,
+            )
+            client = Anthropic(api_key=api_key, base_url=base_url, http_client=http_client)
+            _clients[key] = client
+        return client
+
+class CachedPrompt(str):
+    """
+    A prompt string that remembers where its static prefix ends. It behaves like the full
+    prompt text everywhere, while cache-aware clients send the prefix as its own content
+    block with a cache_control breakpoint, so repeated calls only pay for the suffix.
+    """
+
+    def __new__(cls, prefix: str, suffix: str):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        return prompt
+
+def prompt_content(prompt: str) -> Union[str, List[Dict]]:
+    """Message content for a prompt: cache blocks when caching is enabled, otherwise the plain text"""
+    if not Config.prompt_caching or not isinstance(prompt, CachedPrompt) or not prompt.prefix:
+        return str(prompt)
+    blocks = [{"type": "text", "text": prompt.prefix, "cache_control": {"type": "ephemeral"}}]
+    if prompt.suffix:
+        blocks.append({"type": "text", "text": prompt.suffix})
+    return blocks
+
+def call_llm(llm, prompt: str, stage: str = None, temperature: float = 0,
+             validate: Callable[[str], bool] = None) -> str:
+    """
+    Call any of the client shapes used in the engine with the model and limits routed for
+    the stage, recording latency, token usage and cache status for telemetry
+
+    Args:
+        llm: An Anthropic client (messages), a LangChain chat model (invoke) or a callable taking the prompt
+        prompt: Prompt text, optionally a CachedPrompt
+        stage: Pipeline stage, a key of Config.stage_routes; nested calls inherit it
+        validate: Optional check of the output; a failing output is retried once with the
+            route's escalation model when it has one
+    """
+    stage_token = _stage.set(stage or _stage.get())
+    try:
+        if not hasattr(llm, 'invoke') and not hasattr(llm, 'messages'):
+            # Wrapped callables receive the CachedPrompt itself and decide how to send it;
+            # a call_llm inside them records the call under this stage
+            return llm(prompt)
+
+        route = Config.stage_routes.get(_stage.get()) or StageRoute(Config.sonnet_model)
+        text = _call_model(llm, prompt, route.model, route, temperature)
+        if validate and route.escalate_to and not validate(text):
+            TELEMETRY.record_event(_stage.get(), "escalation", f"{route.model} -> {route.escalate_to}")
+            text = _call_model(llm, prompt, route.escalate_to, route, temperature)
+        return text
+    finally:
+        _stage.reset(stage_token)
+
+def _call_model(llm, prompt: str, model: str, route: StageRoute, temperature: float) -> str:
+    """Send one request to the given model, sharing an identical request already in flight, and record it"""
+    content = prompt_content(prompt)
+    cached_prompt = not isinstance(content, str)
+
+    def send():
+        return _send_hedged(llm, prompt, content, model, route, temperature, cached_prompt)
+
+    if not Config.coalesce_llm_calls:
+        return _response_text(send(), hasattr(llm, 'invoke'))
+
+    # Waiters get the sender's response, or its exception raised in their own thread
+    started_at = time.time()
+    key = (id(llm), model, str(prompt), cached_prompt, temperature, route.max_tokens, route.stop_sequences)
+    response, shared = _in_flight.do(key, send)
+    if shared:
+        record_call(_stage.get(), model, prompt, started_at, response, cached_prompt=cached_prompt, coalesced=True)
+    return _response_text(response, hasattr(llm, 'invoke'))
+
+def _send_hedged(llm, prompt: str, content, model: str, route: StageRoute, temperature: float,
+                 cached_prompt: bool):
+    """
+    Send a request and, when it is still running after the hedge delay of the stage and model and the hedge
+    budget allows, a duplicate of it. The first successful response wins; the other request
+    is left to finish in the background and is still recorded, since it is billed.
+    """
+    HEDGE_BUDGET.count_request()
+    delay = LATENCY.hedge_delay(_stage.get(), model)
+    args = (llm, prompt, content, model, route, temperature, cached_prompt)
+    if delay is None:
+        return _send_recorded(*args)
+
+    primary = _hedge_pool.submit(contextvars.copy_context().run, _send_recorded, *args)
+    try:
+        return primary.result(timeout=delay)
+    except FutureTimeout:
+        pass
+    if not HEDGE_BUDGET.try_acquire():
+        return primary.result()
+
+    hedge = _hedge_pool.submit(contextvars.copy_context().run, _send_recorded, *args, True)
+    for future in as_completed([primary, hedge]):
+        if future.exception() is None:
+            return future.result()
+    return primary.result()
+
+def _send_recorded(llm, prompt: str, content, model: str, route: StageRoute, temperature: float,
+                   cached_prompt: bool, hedge: bool = False):
+    """Send one request with the adaptive timeout of the stage and model, recording it and its latency"""
+    stage = _stage.get()
+    started_at = time.time()
+    try:
+        response = _send(llm, content, model, route, temperature, LATENCY.timeout_for(stage, model))
+    except Exception as e:
+        record_call(stage, model, prompt, started_at, cached_prompt=cached_prompt, error=e, hedge=hedge)
+        raise
+    LATENCY.observe(stage, model, time.time() - started_at)
+    record_call(stage, model, prompt, started_at, response, cached_prompt=cached_prompt, hedge=hedge)
+    return response
+
+def _send(llm, content, model: str, route: StageRoute, temperature: float, timeout: float = None):
+    """Send one request with an Anthropic client or a LangChain chat model"""
+    if hasattr(llm, 'invoke'):
+        # Overrides are passed through to the request payload
+        return llm.invoke(
+            content if isinstance(content, str) else [("human", content)],
+            model=model, max_tokens=route.max_tokens, stop=list(route.stop_sequences) or None
+        )
+    request = {
+        "model": model,
+        "messages": [{"role": "user", "content": content}],
+        "temperature": temperature,
+        "max_tokens": route.max_tokens,
+    }
+    if route.stop_sequences:
+        request["stop_sequences"] = list(route.stop_sequences)
+    if timeout:
+        request["timeout"] = timeout
+    return llm.messages.create(**request)
+
+def _response_text(response, langchain: bool) -> str:
+    """Text of a LangChain AIMessage or an Anthropic message"""
+    if not langchain:
+        return response.content[0].text
+    if isinstance(response.content, str):
+        return response.content
+    return "".join(block.get("text", "") for block in response.content if isinstance(block, dict))
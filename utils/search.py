@@ -1,18 +1,19 @@
 from typing import List, Dict
 from fuzzywuzzy import fuzz
+from utils.llm import CachedPrompt
 
 def extract_entities_from_llm(sub_query: str, llm) -> List[str]:
     """Extract entities from the sub-query using the Sonnet LLM"""
     if not callable(llm):
         raise ValueError("LLM must be a callable object")
         
-    prompt = f"""Extract the key entities from the following query: '{sub_query}'.
+    prefix = """Extract the key entities from the query below.
     Example:
         For the query "List the utility expenses for Marriott Crystal City during Q4 2022.",
         the entities extracted would be ['utility', 'Marriott Crystal City']. Just the entities, in comma separated list. Don't extract dates.
     """
     try:
-        response = llm(prompt)
+        response = llm(CachedPrompt(prefix, f"Query: '{sub_query}'"))
         # Assuming the LLM returns a comma-separated list of entities
         entities = [entity.strip().strip("'") for entity in response.split(',') if entity.strip()]
         return entities
@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Tuple
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the function, callers
+    arriving while it is in flight wait for and share its result or exception. The key is
+    released as soon as the call finishes, so later calls always run again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable) -> Tuple[object, bool]:
+        """
+        Run fn, or wait for the identical call already in flight
+
+        Returns:
+            Tuple of (result, shared) where shared is True when another caller's result was reused
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._release(key)
+            future.set_exception(e)
+            raise
+        self._release(key)
+        future.set_result(result)
+        return result, False
+
+    def _release(self, key: Hashable):
+        """Forget the finished call so the next identical call is sent again"""
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running"""
+        with self._lock:
+            return len(self._in_flight)
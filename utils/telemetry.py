@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+from config import Config
+
+# USD per million tokens: (input, output). Cache writes cost 1.25x input, cache reads 0.1x input.
+MODEL_PRICES = {
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "claude-3-sonnet-20240229": (3.00, 15.00),
+    "claude-3-5-haiku-20241022": (0.80, 4.00),
+    "claude-3-5-sonnet-20241022": (3.00, 15.00),
+    "claude-3-opus-20240229": (15.00, 75.00),
+}
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.1
+
+# Collectors of the requests and steps currently being processed, innermost last
+_collectors: ContextVar[Tuple[List, ...]] = ContextVar("llm_call_collectors", default=())
+
+@dataclass
+class LLMCall:
+    stage: str
+    model: str
+    prompt_hash: str
+    latency: float
+    input_tokens: Optional[int] = None  # Uncached input tokens
+    output_tokens: Optional[int] = None
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    cache_status: str = "off"  # "off" (no cache blocks sent), "miss", "write" or "hit"
+    cost: Optional[float] = None
+    error: Optional[str] = None
+    timestamp: float = 0.0
+    coalesced: bool = False  # Shared an identical request already in flight; not billed
+    hedge: bool = False  # Duplicate sent because the original was slower than the stage's hedge delay
+
+@dataclass
+class TelemetryEvent:
+    """A notable pipeline event that is not itself a call, e.g. an escalation or a failed repair"""
+    stage: str
+    event: str
+    detail: str = ""
+    timestamp: float = 0.0
+
+def prompt_hash(prompt: str) -> str:
+    """Short stable hash identifying a prompt in traces"""
+    return hashlib.sha256(str(prompt).encode('utf-8')).hexdigest()[:16]
+
+def call_cost(model: str, input_tokens: int, output_tokens: int,
+              cache_read_tokens: int = 0, cache_write_tokens: int = 0) -> Optional[float]:
+    """Cost of one call in USD, or None for models without a known price"""
+    if model not in MODEL_PRICES or input_tokens is None or output_tokens is None:
+        return None
+    input_price, output_price = MODEL_PRICES[model]
+    return (
+        input_tokens * input_price
+        + cache_write_tokens * input_price * CACHE_WRITE_MULTIPLIER
+        + cache_read_tokens * input_price * CACHE_READ_MULTIPLIER
+        + output_tokens * output_price
+    ) / 1_000_000
+
+class LLMTelemetry:
+    """
+    Records every LLM call made through utils.llm.call_llm, and pipeline events worth
+    counting next to them. Both are appended to a JSONL trace for offline aggregation and
+    handed to the collectors active in the calling context, which the orchestrator uses to
+    attach a per-stage breakdown to each step.
+    """
+
+    def __init__(self, trace_path: str = Config.telemetry_path):
+        self.trace_path = trace_path
+        self._lock = threading.Lock()
+
+    def record(self, call: LLMCall):
+        """Hand a call, or an event, to the active collectors and append it to the trace"""
+        for collector in _collectors.get():
+            collector.append(call)
+        if not Config.telemetry_enabled:
+            return
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.trace_path) or ".", exist_ok=True)
+                with open(self.trace_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(asdict(call)) + "\n")
+        except OSError as e:
+            print(f"Error writing LLM trace: {e}")
+
+    def record_event(self, stage: str, event: str, detail: str = ""):
+        """Record a pipeline event of a stage, e.g. "escalation" with the models involved"""
+        self.record(TelemetryEvent(stage=stage or "unknown", event=event, detail=detail, timestamp=time.time()))
+
+    @contextmanager
+    def collect(self):
+        """Collect the calls made in this context, including threads started with a copy of it"""
+        calls = []
+        token = _collectors.set(_collectors.get() + (calls,))
+        try:
+            yield calls
+        finally:
+            _collectors.reset(token)
+
+    @staticmethod
+    def summarize(records: List) -> Dict:
+        """Per-stage totals of calls, latency, tokens and cost, and per-stage counts of events"""
+        calls = [record for record in records if isinstance(record, LLMCall)]
+        stages = {}
+
+        def stage_totals(name: str) -> Dict:
+            return stages.setdefault(name, {
+                "calls": 0, "coalesced": 0, "hedges": 0, "latency": 0.0, "input_tokens": 0, "output_tokens": 0,
+                "cache_read_tokens": 0, "cache_write_tokens": 0, "cost": 0.0, "events": {}
+            })
+
+        for record in records:
+            if isinstance(record, TelemetryEvent):
+                events = stage_totals(record.stage)["events"]
+                events[record.event] = events.get(record.event, 0) + 1
+        for call in calls:
+            stage = stage_totals(call.stage)
+            stage["calls"] += 1
+            stage["coalesced"] += int(call.coalesced)
+            stage["hedges"] += int(call.hedge)
+            stage["latency"] += call.latency
+            stage["input_tokens"] += call.input_tokens or 0
+            stage["output_tokens"] += call.output_tokens or 0
+            stage["cache_read_tokens"] += call.cache_read_tokens
+            stage["cache_write_tokens"] += call.cache_write_tokens
+            stage["cost"] += call.cost or 0.0
+        return {
+            "stages": stages,
+            "calls": len(calls),
+            "latency": sum(call.latency for call in calls),
+            "cost": sum(call.cost or 0.0 for call in calls),
+        }
+
+TELEMETRY = LLMTelemetry()
+
+def usage_from_response(response) -> Dict:
+    """Token usage of an Anthropic message or a LangChain AIMessage, normalized to uncached input"""
+    usage = getattr(response, 'usage', None)
+    if usage is not None and hasattr(usage, 'input_tokens'):
+        return {
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "cache_read_tokens": getattr(usage, 'cache_read_input_tokens', None) or 0,
+            "cache_write_tokens": getattr(usage, 'cache_creation_input_tokens', None) or 0,
+        }
+
+    usage = getattr(response, 'usage_metadata', None)
+    if usage:
+        details = usage.get('input_token_details') or {}
+        cache_read = details.get('cache_read') or 0
+        cache_write = details.get('cache_creation') or 0
+        return {
+            # LangChain counts cached tokens as part of the input
+            "input_tokens": usage.get('input_tokens', 0) - cache_read - cache_write,
+            "output_tokens": usage.get('output_tokens'),
+            "cache_read_tokens": cache_read,
+            "cache_write_tokens": cache_write,
+        }
+    return {}
+
+def record_call(stage: str, model: str, prompt: str, started_at: float, response=None,
+                cached_prompt: bool = False, error: Exception = None, coalesced: bool = False,
+                hedge: bool = False):
+    """Build an LLMCall from a response and record it"""
+    usage = usage_from_response(response) if response is not None and not coalesced else {}
+    model = getattr(response, 'model', None) or \
+        (getattr(response, 'response_metadata', None) or {}).get('model') or model
+    if not cached_prompt:
+        cache_status = "off"
+    elif usage.get("cache_read_tokens"):
+        cache_status = "hit"
+    elif usage.get("cache_write_tokens"):
+        cache_status = "write"
+    else:
+        cache_status = "miss"
+
+    TELEMETRY.record(LLMCall(
+        stage=stage or "unknown",
+        model=model,
+        prompt_hash=prompt_hash(prompt),
+        latency=time.time() - started_at,
+        input_tokens=usage.get("input_tokens"),
+        output_tokens=usage.get("output_tokens"),
+        cache_read_tokens=usage.get("cache_read_tokens", 0),
+        cache_write_tokens=usage.get("cache_write_tokens", 0),
+        cache_status=cache_status,
+        cost=call_cost(model, usage.get("input_tokens"), usage.get("output_tokens"),
+                       usage.get("cache_read_tokens", 0), usage.get("cache_write_tokens", 0)),
+        error=str(error) if error else None,
+        timestamp=started_at,
+        coalesced=coalesced,
+        hedge=hedge,
+    ))